@@ -1,166 +1,3047 @@
+import argparse
+import contextvars
+import gc
 import gradio as gr
+import hashlib
+import heapq
+import json
+import math
 import numpy as np
+import os
+import queue
 import random
+import shutil
+import tempfile
+import threading
+import time
 import torch
 # import spaces  # ローカル実行用: Hugging Face Spaces専用モジュールのためコメントアウト
 
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from PIL import Image
 from diffusers import QwenImageEditPlusPipeline, QwenImageTransformer2DModel, GGUFQuantizationConfig
+from diffusers.pipelines.qwenimage.pipeline_qwenimage_edit_plus import CONDITION_IMAGE_SIZE, calculate_dimensions, calculate_shift
 from huggingface_hub import hf_hub_download
 #from qwenimage.pipeline_qwenimage_edit_plus import QwenImageEditPlusPipeline
 #from qwenimage.transformer_qwenimage import QwenImageTransformer2DModel
 
 MAX_SEED = np.iinfo(np.int32).max
 
-# --- Model Loading (GGUF Quantized) ---
+# Pixels denoised together in one multi-view batch (views × height × width)
+MULTI_VIEW_PIXEL_BUDGET = int(os.environ.get("QIE_MULTI_VIEW_PIXEL_BUDGET", 2 * 1024 * 1024))
+
+
+# --- Execution Mode ---
+# "auto" uses CUDA when available, "cpu" forces the CPU path, "cuda" requires a GPU
+DEVICE_MODE = os.environ.get("QIE_DEVICE", "auto")
+
 dtype = torch.bfloat16
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
-print("Loading GGUF quantized model (Q2_K - 7.47GB)...")
 
-# Download GGUF file from HuggingFace Hub
-gguf_file = hf_hub_download(
-    repo_id="unsloth/Qwen-Image-Edit-2511-GGUF",
-    filename="qwen-image-edit-2511-Q2_K.gguf"
-)
+def available_cores() -> int:
+    """CPU cores this process may run on (respects affinity masks / cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
 
-# Load GGUF quantized transformer
-transformer = QwenImageTransformer2DModel.from_single_file(
-    gguf_file,
-    quantization_config=GGUFQuantizationConfig(compute_dtype=torch.bfloat16),
-    torch_dtype=torch.bfloat16,
-    config="Qwen/Qwen-Image-Edit-2511",
-    subfolder="transformer",
-)
 
-# Create pipeline with quantized transformer
-pipe = QwenImageEditPlusPipeline.from_pretrained(
-    "Qwen/Qwen-Image-Edit-2511",
-    transformer=transformer,
-    torch_dtype=dtype
-)
+def cpu_supports_bf16() -> bool:
+    """Whether oneDNN has native bfloat16 kernels on this CPU (AVX512-BF16 / AMX)."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
 
-# Enable CPU offloading to reduce VRAM usage
-pipe.enable_model_cpu_offload()
-print(f"Model loaded successfully on {device} with CPU offloading enabled")
 
-# Load the lightning LoRA for fast inference
-pipe.load_lora_weights(
-    "lightx2v/Qwen-Image-Edit-2511-Lightning",
-    weight_name="Qwen-Image-Edit-2511-Lightning-4steps-V1.0-bf16.safetensors",
-    adapter_name="lightning"
-)
+def configure_execution(mode: str = None):
+    """
+    Choose device and compute dtype and, on CPU, size the intra-/inter-op
+    thread pools. Must run before the pipeline is loaded. Prints a summary.
 
-# Load the multi-angles LoRA
-pipe.load_lora_weights(
-    "fal/Qwen-Image-Edit-2511-Multiple-Angles-LoRA",
-    weight_name="qwen-image-edit-2511-multiple-angles-lora.safetensors",
-    adapter_name="angles"
-)
+    Env overrides: QIE_CPU_DTYPE (bfloat16/float32), QIE_CPU_THREADS, QIE_CPU_INTEROP_THREADS.
+    """
+    global device, dtype, DEVICE_MODE
+    DEVICE_MODE = mode or DEVICE_MODE
+    if DEVICE_MODE == "cuda" and not torch.cuda.is_available():
+        raise RuntimeError("QIE_DEVICE=cuda but no CUDA device is available")
 
-pipe.set_adapters(["lightning", "angles"], adapter_weights=[1.0, 1.0])
+    if DEVICE_MODE == "cpu" or not torch.cuda.is_available():
+        device = "cpu"
+        cpu_dtype = os.environ.get("QIE_CPU_DTYPE", "auto")
+        if cpu_dtype == "auto":
+            dtype = torch.bfloat16 if cpu_supports_bf16() else torch.float32
+        else:
+            dtype = getattr(torch, cpu_dtype)
 
-# --- Prompt Building ---
+        cores = available_cores()
+        threads = int(os.environ.get("QIE_CPU_THREADS", cores))
+        interop_threads = int(os.environ.get("QIE_CPU_INTEROP_THREADS", max(1, min(4, cores // 8))))
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Inter-op pool is fixed once parallel work has started
+            interop_threads = torch.get_num_interop_threads()
+        print(
+            f"Execution: CPU mode, dtype={str(dtype).removeprefix('torch.')}, "
+            f"{threads} intra-op / {interop_threads} inter-op threads ({cores} cores), "
+            f"no CPU offload, torch.inference_mode"
+        )
+    else:
+        device = "cuda"
+        dtype = torch.bfloat16
+        print(f"Execution: CUDA mode ({torch.cuda.get_device_name(0)}), dtype=bfloat16, model CPU offload")
 
-# Azimuth mappings (8 positions)
-AZIMUTH_MAP = {
-    0: "front view",
-    45: "front-right quarter view",
-    90: "right side view",
-    135: "back-right quarter view",
-    180: "back view",
-    225: "back-left quarter view",
-    270: "left side view",
-    315: "front-left quarter view"
+
+configure_execution()
+
+
+# --- Model Loading (GGUF Quantized) ---
+BASE_MODEL = "Qwen/Qwen-Image-Edit-2511"
+GGUF_REPO = "unsloth/Qwen-Image-Edit-2511-GGUF"
+
+
+@dataclass(frozen=True)
+class QuantProfile:
+    name: str
+    file: str
+    size_gb: float  # GGUF file size, roughly the transformer's resident weights
+
+
+# Quantized transformer variants in GGUF_REPO, from smallest to highest quality
+QUANT_PROFILES = {
+    p.name: p for p in (
+        QuantProfile("Q2_K", "qwen-image-edit-2511-Q2_K.gguf", 7.47),
+        QuantProfile("Q3_K_M", "qwen-image-edit-2511-Q3_K_M.gguf", 9.7),
+        QuantProfile("Q4_K_M", "qwen-image-edit-2511-Q4_K_M.gguf", 13.1),
+        QuantProfile("Q5_K_M", "qwen-image-edit-2511-Q5_K_M.gguf", 14.9),
+        QuantProfile("Q6_K", "qwen-image-edit-2511-Q6_K.gguf", 16.8),
+        QuantProfile("Q8_0", "qwen-image-edit-2511-Q8_0.gguf", 21.8),
+    )
 }
 
-# Elevation mappings (4 positions)
-ELEVATION_MAP = {
-    -30: "low-angle shot",
-    0: "eye-level shot",
-    30: "elevated shot",
-    60: "high-angle shot"
+# "auto" picks the best profile that fits the memory budget; or a name from QUANT_PROFILES
+QUANT_MODE = os.environ.get("QIE_QUANT", "auto")
+# Memory available to the model in GB (GPU memory in CUDA mode, RAM in CPU mode); 0 detects it
+MEMORY_BUDGET_GB = float(os.environ.get("QIE_MEMORY_BUDGET_GB", 0))
+
+
+def detect_memory_gb() -> float:
+    """Total GPU memory in CUDA mode, physical RAM in CPU mode (0 if unknown)."""
+    if device == "cuda":
+        return torch.cuda.get_device_properties(0).total_memory / 1024 ** 3
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3
+    except (AttributeError, ValueError, OSError):
+        return 0.0
+
+
+def quant_overhead_gb() -> float:
+    """Memory needed besides the transformer weights while denoising."""
+    if device == "cuda":
+        # Model offload keeps only the transformer on the GPU while it runs; the rest is activations
+        return 3.0
+    # On CPU the ~8.3B-parameter text encoder and the VAE stay resident next to the transformer
+    return 8.3 * torch.finfo(dtype).bits / 8 + 4.0
+
+
+def select_quant_profile(budget_gb: float) -> QuantProfile:
+    """Highest-quality profile whose weights plus overhead fit `budget_gb` (the smallest if none does)."""
+    profiles = list(QUANT_PROFILES.values())
+    fitting = [p for p in profiles if p.size_gb + quant_overhead_gb() <= budget_gb]
+    return fitting[-1] if fitting else profiles[0]
+
+
+def configure_quantization(mode: str = None, budget_gb: float = None):
+    """
+    Choose the GGUF variant (sets QUANT_PROFILE and GGUF_FILE). Must run
+    before the pipeline is loaded, and again after configure_execution()
+    since the budget depends on the device. Prints the choice.
+    """
+    global QUANT_MODE, MEMORY_BUDGET_GB, QUANT_PROFILE, GGUF_FILE
+    QUANT_MODE = mode or QUANT_MODE
+    MEMORY_BUDGET_GB = budget_gb or MEMORY_BUDGET_GB
+    if QUANT_MODE == "auto":
+        budget = MEMORY_BUDGET_GB or detect_memory_gb()
+        QUANT_PROFILE = select_quant_profile(budget)
+        reason = f"best fit for {budget:.1f}GB {'declared' if MEMORY_BUDGET_GB else 'detected'} budget"
+    elif QUANT_MODE in QUANT_PROFILES:
+        QUANT_PROFILE = QUANT_PROFILES[QUANT_MODE]
+        reason = "selected explicitly"
+    else:
+        raise ValueError(f"Unknown quantization profile {QUANT_MODE!r}; choose auto or one of {', '.join(QUANT_PROFILES)}")
+    GGUF_FILE = QUANT_PROFILE.file
+    print(f"Quantization: {QUANT_PROFILE.name} ({QUANT_PROFILE.size_gb:.1f}GB transformer, {reason})")
+
+# adapter_name -> (repo_id, weight_name)
+LORAS = {
+    # Lightning LoRA for fast (4-step) inference
+    "lightning": ("lightx2v/Qwen-Image-Edit-2511-Lightning", "Qwen-Image-Edit-2511-Lightning-4steps-V1.0-bf16.safetensors"),
+    # Multi-angles LoRA for camera control
+    "angles": ("fal/Qwen-Image-Edit-2511-Multiple-Angles-LoRA", "qwen-image-edit-2511-multiple-angles-lora.safetensors"),
 }
 
-# Distance mappings (3 positions)
-DISTANCE_MAP = {
-    0.6: "close-up",
-    1.0: "medium shot",
-    1.8: "wide shot"
-}
+# Active adapters and their weights
+ADAPTER_WEIGHTS = {"lightning": 1.0, "angles": 1.0}
+
+configure_quantization()
+
+# Fuse the active adapters into the transformer and reuse a cached snapshot of the result
+FUSE_LORA = os.environ.get("QIE_FUSE_LORA", "0") == "1"
+
+# Decode frames larger than this many pixels in overlapping tiles (0 disables tiling and slicing)
+VAE_TILING_PIXELS = int(os.environ.get("QIE_VAE_TILING_PIXELS", 1024 * 1024))
+VAE_TILE_SIZE = int(os.environ.get("QIE_VAE_TILE_SIZE", 512))
+VAE_TILE_OVERLAP = int(os.environ.get("QIE_VAE_TILE_OVERLAP", 64))
+
+# Local model store: every artifact the app loads, pinned by hash in <MODEL_DIR>/manifest.json
+MODEL_DIR = os.environ.get("QIE_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+# Never contact the Hub; fail at startup if an artifact is missing, unpinned or modified
+OFFLINE = os.environ.get("QIE_OFFLINE", "0") == "1"
+# "fast": rehash only files whose size/mtime changed since their last check; "full": rehash all; "off": sizes only
+VERIFY_MODE = os.environ.get("QIE_VERIFY", "fast")
+
+# The GGUF file replaces the base transformer weights, so only its config is kept from the base repo
+BASE_IGNORE_PATTERNS = ["transformer/*.safetensors", "transformer/*.bin", "transformer/*.index.json", "*.md", ".gitattributes"]
+
+
+def file_fingerprint(path: str) -> str:
+    """Cheap identity of a local file (name, size, mtime) for cache keys."""
+    stat = os.stat(path)
+    return f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def file_identity(path: str) -> str:
+    """
+    Content identity of a model file for cache keys: its sha256 pin from the
+    model store manifest, which survives copying the store to another node,
+    else the (name, size, mtime) fingerprint.
+    """
+    sha256 = model_store.pinned_sha256(path)
+    return f"sha256:{sha256}" if sha256 else file_fingerprint(path)
+
+
+def fused_snapshot_key(gguf_file: str, lora_files: dict) -> str:
+    """Key of a fused transformer snapshot: base model, GGUF file, LoRA files and adapter weights."""
+    payload = json.dumps([
+        BASE_MODEL,
+        file_identity(gguf_file),
+        sorted((name, file_identity(path)) for name, path in lora_files.items()),
+        sorted(ADAPTER_WEIGHTS.items()),
+    ])
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def fuse_and_snapshot(pipe, snapshot_dir: str):
+    """
+    Bake the active adapters into the transformer weights and save the result.
+
+    GGUF blocks cannot absorb a LoRA delta, so the transformer is dequantized
+    to the compute dtype first; the snapshot therefore needs RAM/disk for
+    full-precision transformer weights.
+    """
+    print("Fusing LoRA adapters into the transformer...")
+    pipe.transformer.dequantize()
+    pipe.fuse_lora(adapter_names=list(ADAPTER_WEIGHTS), lora_scale=1.0)
+    pipe.unload_lora_weights()
+    write_dir_atomic(snapshot_dir, lambda tmp: pipe.transformer.save_pretrained(tmp, safe_serialization=True))
+    print(f"Saved fused transformer snapshot to {snapshot_dir}")
+
+
+def sha256_file(path: str, chunk_size: int = 16 * 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelStore:
+    """
+    Local copies of the base pipeline (minus transformer weights), the GGUF
+    transformer and the LoRAs, laid out as base/, gguf/ and loras/<adapter>/.
+
+    manifest.json pins {relative path: {"size", "sha256"}} for every file;
+    .verified.json remembers (size, mtime, sha256) of each file's last check,
+    so a normal start only stats files. Online, missing artifacts are
+    downloaded from the Hub and new files are pinned; offline, anything
+    missing or unpinned is an error.
+    """
+    MANIFEST = "manifest.json"
+    VERIFIED = ".verified.json"
+
+    def __init__(self, directory: str, offline: bool = False, verify_mode: str = "fast"):
+        self.directory = directory
+        self.offline = offline
+        self.verify_mode = verify_mode
+
+    @property
+    def paths(self) -> dict:
+        return {
+            "base": os.path.join(self.directory, "base"),
+            "gguf": os.path.join(self.directory, "gguf", GGUF_FILE),
+            "loras": {
+                adapter_name: os.path.join(self.directory, "loras", adapter_name, weight_name)
+                for adapter_name, (_, weight_name) in LORAS.items()
+            },
+        }
+
+    def _required(self) -> list:
+        paths = self.paths
+        return [os.path.join(paths["base"], "model_index.json"), paths["gguf"], *paths["loras"].values()]
+
+    def _load_json(self, name: str) -> dict:
+        try:
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_json(self, name: str, data: dict):
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+    def pinned_sha256(self, path: str):
+        """sha256 pinned in the manifest for a file inside the store, or None."""
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(self.directory)).replace(os.sep, "/")
+        return self._load_json(self.MANIFEST).get(rel, {}).get("sha256")
+
+    def _save_verified(self, verified: dict):
+        """Best-effort: a read-only store just re-hashes changed files on the next start."""
+        try:
+            self._save_json(self.VERIFIED, verified)
+        except OSError as e:
+            print(f"Could not record verified model files ({e}); they will be hashed again next start")
+
+    def _files(self) -> list:
+        """Store-relative paths of all artifact files (Hub download metadata excluded)."""
+        files = []
+        for root, dirs, names in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if d != ".cache"]
+            for name in names:
+                rel = os.path.relpath(os.path.join(root, name), self.directory)
+                if rel not in (self.MANIFEST, self.VERIFIED) and ".tmp-" not in name:
+                    files.append(rel.replace(os.sep, "/"))
+        return files
+
+    def missing(self) -> list:
+        manifest = self._load_json(self.MANIFEST)
+        missing = [p for p in self._required() if not os.path.isfile(p)]
+        missing += [
+            os.path.join(self.directory, rel) for rel in manifest
+            if not os.path.isfile(os.path.join(self.directory, rel))
+        ]
+        return missing
+
+    def download(self):
+        """Fetch the artifacts from the Hub into the store."""
+        from huggingface_hub import snapshot_download
+        paths = self.paths
+        print(f"Downloading model artifacts into {self.directory}...")
+        snapshot_download(repo_id=BASE_MODEL, local_dir=paths["base"], ignore_patterns=BASE_IGNORE_PATTERNS)
+        hf_hub_download(repo_id=GGUF_REPO, filename=GGUF_FILE, local_dir=os.path.dirname(paths["gguf"]))
+        for adapter_name, (repo_id, weight_name) in LORAS.items():
+            hf_hub_download(repo_id=repo_id, filename=weight_name, local_dir=os.path.dirname(paths["loras"][adapter_name]))
+
+    def pin(self):
+        """Add files not yet in the manifest, with their size and hash (recorded as verified, too)."""
+        manifest = self._load_json(self.MANIFEST)
+        new = [rel for rel in self._files() if rel not in manifest]
+        if not new:
+            return
+        verified = self._load_json(self.VERIFIED)
+        for rel in new:
+            path = os.path.join(self.directory, rel)
+            stat = os.stat(path)
+            manifest[rel] = {"size": stat.st_size, "sha256": sha256_file(path)}
+            verified[rel] = [stat.st_size, stat.st_mtime_ns, manifest[rel]["sha256"]]
+        self._save_json(self.MANIFEST, manifest)
+        self._save_verified(verified)
+        print(f"Pinned {len(new)} new file(s) in {os.path.join(self.directory, self.MANIFEST)}")
+
+    def verify(self) -> list:
+        """Check every pinned file against the manifest; returns a list of problems."""
+        manifest = self._load_json(self.MANIFEST)
+        verified = self._load_json(self.VERIFIED)
+        problems = [f"{rel}: not pinned in the manifest" for rel in self._files() if rel not in manifest]
+        changed = False
+        for rel, pinned in manifest.items():
+            path = os.path.join(self.directory, rel)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                problems.append(f"{rel}: missing")
+                continue
+            if stat.st_size != pinned["size"]:
+                problems.append(f"{rel}: size {stat.st_size} != pinned {pinned['size']}")
+                continue
+            if self.verify_mode == "off":
+                continue
+            record = [stat.st_size, stat.st_mtime_ns, pinned["sha256"]]
+            if self.verify_mode == "fast" and verified.get(rel) == record:
+                continue
+            if sha256_file(path) != pinned["sha256"]:
+                problems.append(f"{rel}: sha256 does not match the manifest")
+                verified.pop(rel, None)
+            else:
+                verified[rel] = record
+            changed = True
+        if changed:
+            self._save_verified(verified)
+        return problems
+
+    def prepare(self) -> dict:
+        """Make sure every artifact is present and matches its pin; returns the local paths."""
+        missing = self.missing()
+        if missing and self.offline:
+            raise RuntimeError(
+                f"Offline mode: model store {self.directory} is missing {len(missing)} file(s), e.g. {missing[0]}. "
+                "Run `python app.py --prepare-models` on a connected machine and copy the store over."
+            )
+        if missing:
+            self.download()
+        if not self.offline:
+            self.pin()
+        elif not os.path.isfile(os.path.join(self.directory, self.MANIFEST)):
+            raise RuntimeError(f"Offline mode: {os.path.join(self.directory, self.MANIFEST)} not found")
+        start = time.perf_counter()
+        problems = self.verify()
+        if problems:
+            raise RuntimeError("Model store verification failed:\n  " + "\n  ".join(problems))
+        print(f"Model store verified ({self.verify_mode}) in {time.perf_counter() - start:.1f}s")
+        return self.paths
+
+
+model_store = ModelStore(MODEL_DIR, offline=OFFLINE, verify_mode=VERIFY_MODE)
+
+
+def install_tiled_decode(pipe):
+    """
+    Bound VAE decode memory at high resolutions. Frames above VAE_TILING_PIXELS
+    are decoded in VAE_TILE_SIZE tiles whose VAE_TILE_OVERLAP borders are
+    blended; batches whose total size crosses the threshold are decoded one
+    item at a time. Smaller decodes run the regular full-frame path.
+    """
+    vae = pipe.vae
+    if not VAE_TILING_PIXELS or not hasattr(vae, "enable_tiling"):
+        return
+    decode = vae.decode
+    # Tiles are cut on the latent grid, so keep them on whole packed-latent cells
+    multiple_of = pipe.vae_scale_factor * 2
+    tile = max(multiple_of, VAE_TILE_SIZE // multiple_of * multiple_of)
+    stride = max(multiple_of, (tile - VAE_TILE_OVERLAP) // multiple_of * multiple_of)
+    logged = set()
+
+    def bounded_decode(z, *args, **kwargs):
+        height, width = z.shape[-2] * pipe.vae_scale_factor, z.shape[-1] * pipe.vae_scale_factor
+        tiled = height * width > VAE_TILING_PIXELS
+        sliced = z.shape[0] > 1 and z.shape[0] * height * width > VAE_TILING_PIXELS
+        if not (tiled or sliced):
+            return decode(z, *args, **kwargs)
+        if (height, width, z.shape[0]) not in logged:
+            logged.add((height, width, z.shape[0]))
+            mode = f"{tile}px tiles with {tile - stride}px overlap" if tiled else "full frames"
+            print(f"VAE decode {width}x{height} x{z.shape[0]}: {mode}{', one item at a time' if sliced else ''}")
+        if tiled:
+            vae.enable_tiling(
+                tile_sample_min_height=tile, tile_sample_min_width=tile,
+                tile_sample_stride_height=stride, tile_sample_stride_width=stride,
+            )
+        vae.use_slicing = sliced
+        try:
+            return decode(z, *args, **kwargs)
+        finally:
+            vae.disable_tiling()
+            vae.use_slicing = False
+
+    vae.decode = bounded_decode
+
+
+def load_pipeline(fuse_lora: bool = None):
+    """
+    Download the GGUF transformer and LoRAs and build the edit pipeline.
+
+    Args:
+        fuse_lora: Fuse the adapters and use/create a snapshot (defaults to FUSE_LORA)
+    """
+    global FUSE_LORA
+    fuse_lora = FUSE_LORA if fuse_lora is None else fuse_lora
+    print(f"Loading GGUF quantized model ({QUANT_PROFILE.name} - {QUANT_PROFILE.size_gb:.2f}GB)...")
+
+    # Everything is loaded from the verified local store (downloaded into it when online)
+    paths = model_store.prepare()
+    base_dir, gguf_file, lora_files = paths["base"], paths["gguf"], paths["loras"]
+
+    snapshot_dir = os.path.join(CACHE_DIR, "fused", fused_snapshot_key(gguf_file, lora_files))
+    use_snapshot = fuse_lora and os.path.isdir(snapshot_dir)
+
+    if use_snapshot:
+        # Fused snapshot for this model/LoRA/weight combination; safetensors are memory-mapped
+        print(f"Loading fused transformer snapshot from {snapshot_dir}")
+        transformer = QwenImageTransformer2DModel.from_pretrained(snapshot_dir, torch_dtype=dtype, local_files_only=True)
+    else:
+        # Load GGUF quantized transformer (the GGUF reader memory-maps the file)
+        transformer = QwenImageTransformer2DModel.from_single_file(
+            gguf_file,
+            quantization_config=GGUFQuantizationConfig(compute_dtype=dtype),
+            torch_dtype=dtype,
+            config=base_dir,
+            subfolder="transformer",
+            local_files_only=True,
+        )
+
+    # Create pipeline with quantized transformer; the other components are memory-mapped safetensors
+    pipe = QwenImageEditPlusPipeline.from_pretrained(
+        base_dir,
+        transformer=transformer,
+        torch_dtype=dtype,
+        use_safetensors=True,
+        local_files_only=True,
+    )
+
+    if not use_snapshot:
+        for adapter_name, path in lora_files.items():
+            pipe.load_lora_weights(os.path.dirname(path), weight_name=os.path.basename(path), adapter_name=adapter_name)
+
+        pipe.set_adapters(list(ADAPTER_WEIGHTS), adapter_weights=list(ADAPTER_WEIGHTS.values()))
+
+        if fuse_lora:
+            try:
+                fuse_and_snapshot(pipe, snapshot_dir)
+            except Exception as e:
+                # The pipeline may be half-fused at this point, so start over unfused
+                print(f"LoRA fusion failed ({e}); falling back to unfused adapters")
+                FUSE_LORA = False  # results are keyed on the LoRA path actually in use
+                del pipe, transformer
+                gc.collect()
+                return load_pipeline(fuse_lora=False)
+
+    if device == "cuda":
+        # Model offload moves the whole transformer onto the GPU for denoising; a fused (dequantized
+        # bf16, ~40GB) transformer cannot fit on the low-VRAM cards this app targets
+        transformer_bytes = sum(p.numel() * p.element_size() for p in pipe.transformer.parameters())
+        vram_bytes = torch.cuda.get_device_properties(0).total_memory
+        if transformer_bytes > vram_bytes * 0.8:
+            print(
+                f"Warning: the transformer ({transformer_bytes / 1024 ** 3:.1f}GB) does not fit in VRAM "
+                f"({vram_bytes / 1024 ** 3:.1f}GB); using sequential CPU offload, which is much slower. "
+                f"{'Unset QIE_FUSE_LORA to keep the GGUF weights. ' if use_snapshot or fuse_lora else ''}"
+            )
+            pipe.enable_sequential_cpu_offload()
+        else:
+            # Enable CPU offloading to reduce VRAM usage
+            pipe.enable_model_cpu_offload()
+        print(f"Model loaded successfully on {device} with CPU offloading enabled")
+    else:
+        # Offload hooks only shuffle weights between CPU and CPU
+        print(f"Model loaded successfully on {device} ({str(dtype).removeprefix('torch.')})")
+
+    install_tiled_decode(pipe)
+    install_compile(pipe, json.dumps([fused_snapshot_key(gguf_file, lora_files), use_snapshot or fuse_lora]))
+    install_dequant_cache(pipe)
+    install_step_cache(pipe)
+    install_vae_latent_cache(pipe)
+    install_instrumentation(pipe)
+    return pipe
+
+
+class PipelineFactory:
+    """
+    Thread-safe lazy holder for the pipeline.
+
+    Nothing is loaded until get() is first called (or start_background_load()
+    kicks off loading in a daemon thread), so importing this module stays cheap.
+    state is one of "idle", "loading", "ready" or "error". A background load
+    runs `warmup` after loading; ready stays False until it has finished.
+    """
+    def __init__(self, loader, warmup=None):
+        self._loader = loader
+        self._warmup = warmup
+        self._warming = False
+        self._lock = threading.Lock()
+        self._pipe = None
+        self._error = None
+        self._thread = None
+        self.state = "idle"
+
+    @property
+    def ready(self) -> bool:
+        return self._pipe is not None and not self._warming
+
+    def get(self):
+        """Return the pipeline, loading it on the calling thread if needed."""
+        if self._pipe is not None:
+            return self._pipe
+        with self._lock:
+            if self._pipe is None:
+                self.state = "loading"
+                try:
+                    self._pipe = self._loader()
+                except Exception as e:
+                    self._error = e
+                    self.state = "error"
+                    raise
+                self._error = None
+                self.state = "ready"
+        return self._pipe
+
+    def start_background_load(self):
+        """Start loading in a daemon thread; returns immediately."""
+        with self._lock:
+            if self._pipe is not None or (self._thread is not None and self._thread.is_alive()):
+                return
+            self.state = "loading"
+            self._warming = self._warmup is not None
+            self._thread = threading.Thread(target=self._background_load, name="pipeline-loader", daemon=True)
+            self._thread.start()
+
+    def _background_load(self):
+        try:
+            self.get()
+        except Exception as e:
+            self._warming = False
+            print(f"Model loading failed: {e}")
+            return
+        try:
+            if self._warmup is not None:
+                self._warmup()
+        finally:
+            self._warming = False
+
+    def status_text(self) -> str:
+        if self.state == "ready" and self._warming:
+            return f"⏳ Model loaded, compiling kernels ({len(compile_status.shapes)}/{compile_status.total_shapes} shapes)..."
+        if self.state == "ready":
+            return "✅ Model ready"
+        if self.state == "error":
+            return f"❌ Model failed to load: {self._error}"
+        if self.state == "loading":
+            return "⏳ Model loading... (camera controls are already usable)"
+        return "💤 Model not loaded yet (loads on first Generate)"
+
+
+pipeline_factory = PipelineFactory(load_pipeline, warmup=lambda: warmup_compiled())
+
+# The pipeline (and its CPU-offload hooks) must not be driven by two threads at once
+PIPELINE_LOCK = threading.RLock()
+
+
+def get_pipe():
+    """Return the shared pipeline, surfacing load failures as a UI error."""
+    try:
+        return pipeline_factory.get()
+    except Exception as e:
+        raise gr.Error(f"Model failed to load: {e}")
+
+
+# --- Metrics ---
+
+# Prometheus-style /metrics endpoint (QIE_METRICS_PORT=0 disables)
+METRICS_HOST = os.environ.get("QIE_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("QIE_METRICS_PORT", 7861))
+
+# Trace of the request currently running on this thread; set by run_pipeline()
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Histogram:
+    """Minimal thread-safe Prometheus histogram with one label."""
+    def __init__(self, name: str, help_text: str, label: str, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label_value: str, value: float):
+        with self._lock:
+            series = self._series.setdefault(label_value, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, (counts, total, count) in self._series.items():
+                label = f'{self.label}="{label_value}"'
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{label}}} {total}")
+                lines.append(f"{self.name}_count{{{label}}} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "qie_stage_seconds",
+    "Time spent per pipeline stage (prompt_encode, vae_encode, denoise_step, offload_transfer, vae_decode, preview, request).",
+    "stage",
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 120, 300),
+)
+
+
+class StageTrace:
+    """Per-request stage timings, shown in the UI next to the result."""
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+
+    def add(self, stage: str, seconds: float):
+        total, count = self.stages.get(stage, (0.0, 0))
+        self.stages[stage] = (total + seconds, count + 1)
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other: "StageTrace"):
+        for stage, (total, count) in other.stages.items():
+            old_total, old_count = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (old_total + total, old_count + count)
+        for name, n in other.counters.items():
+            self.count(name, n)
+
+    def summary(self) -> dict:
+        """{stage: total ms} and counters, plus the step count and mean step time for denoising."""
+        out = {stage: round(total * 1000, 1) for stage, (total, _) in self.stages.items()}
+        if "denoise_step" in self.stages:
+            total, count = self.stages["denoise_step"]
+            out["denoise_steps"] = count
+            out["denoise_step_mean"] = round(total * 1000 / count, 1)
+        out.update(self.counters)
+        if self.counters.get("step_cache_steps"):
+            out["step_cache_hit_rate"] = round(self.counters.get("step_cache_hits", 0) / self.counters["step_cache_steps"], 2)
+        return out
+
+
+def sync_device():
+    """Wait for queued CUDA work so wall-clock stage timings are meaningful."""
+    if device == "cuda":
+        torch.cuda.synchronize()
+
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(stage, seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    sync_device()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        sync_device()
+        record_stage(stage, time.perf_counter() - start)
+
+
+class StepTimer:
+    """
+    Times denoising steps: a transformer forward pre-hook marks the start of a
+    step and the pipeline's callback_on_step_end records it.
+    """
+    def __init__(self):
+        self._started = None
+
+    def pre_forward(self, module, args):
+        if self._started is None:
+            sync_device()
+            self._started = time.perf_counter()
+
+    def __call__(self, pipe, step, timestep, callback_kwargs):
+        if self._started is not None:
+            sync_device()
+            record_stage("denoise_step", time.perf_counter() - self._started)
+            self._started = None
+        return callback_kwargs
+
+
+def instrument_offload_hooks():
+    """
+    Time accelerate's CpuOffload hooks, which move a model to the GPU (and the
+    previous one back) in pre_forward. Patched on the class, because every
+    pipeline call ends in maybe_free_model_hooks(), which installs new hook
+    instances.
+    """
+    try:
+        from accelerate.hooks import CpuOffload
+    except ImportError:
+        return
+    if getattr(CpuOffload, "_qie_timed", False):
+        return
+    pre_forward = CpuOffload.pre_forward
+
+    def timed_pre_forward(self, module, *args, **kwargs):
+        with stage_timer("offload_transfer"):
+            return pre_forward(self, module, *args, **kwargs)
+
+    CpuOffload.pre_forward = timed_pre_forward
+    CpuOffload._qie_timed = True
+
+
+def install_instrumentation(pipe):
+    """Time VAE decode and CPU-offload transfers on a loaded pipeline; returns the step timer."""
+    decode = pipe.vae.decode
+
+    def timed_decode(*args, **kwargs):
+        with stage_timer("vae_decode"):
+            return decode(*args, **kwargs)
+
+    pipe.vae.decode = timed_decode
+
+    instrument_offload_hooks()
+
+    step_timer = StepTimer()
+    pipe.transformer.register_forward_pre_hook(step_timer.pre_forward)
+    pipe._qie_step_timer = step_timer
+    return step_timer
+
+
+def render_metrics() -> str:
+    lines = STAGE_SECONDS.render()
+    lines += [
+        "# HELP qie_cache_requests_total Cache lookups by cache and result.",
+        "# TYPE qie_cache_requests_total counter",
+    ]
+    caches = (
+        ("vae_latents", vae_latent_cache),
+        ("prompt_embeds", prompt_embed_cache),
+        ("results", result_store),
+        ("gguf_weights", dequant_weight_cache),
+        ("step_residuals", step_cache),
+    )
+    for name, cache in caches:
+        lines.append(f'qie_cache_requests_total{{cache="{name}",result="hit"}} {cache.hits}')
+        lines.append(f'qie_cache_requests_total{{cache="{name}",result="miss"}} {cache.misses}')
+    lines += [
+        "# HELP qie_quant_profile_info Quantization profile of the loaded transformer.",
+        "# TYPE qie_quant_profile_info gauge",
+        f'qie_quant_profile_info{{profile="{QUANT_PROFILE.name}",file="{GGUF_FILE}"}} 1',
+        "# HELP qie_model_ready Whether the pipeline has finished loading (any worker replica in pool mode).",
+        "# TYPE qie_model_ready gauge",
+        f"qie_model_ready {int(worker_pool.ready if worker_pool is not None else pipeline_factory.ready)}",
+    ]
+    if worker_pool is not None:
+        lines += worker_pool.metrics()
+    if resolution_buckets is not None:
+        lines += resolution_buckets.metrics()
+    if COMPILE_ENABLED:
+        lines += [
+            "# HELP qie_compile_ready Whether compile warmup has finished successfully.",
+            "# TYPE qie_compile_ready gauge",
+            f'qie_compile_ready{{state="{compile_status.state}"}} {int(compile_status.state == "ready")}',
+            "# HELP qie_compile_warm_shapes Shapes compiled by warmup so far.",
+            "# TYPE qie_compile_warm_shapes gauge",
+            f"qie_compile_warm_shapes {len(compile_status.shapes)}",
+        ]
+    lines += [
+        "# HELP qie_speculative_views_total Speculative pre-renders by outcome.",
+        "# TYPE qie_speculative_views_total counter",
+        f'qie_speculative_views_total{{result="rendered"}} {speculative_renderer.rendered}',
+        f'qie_speculative_views_total{{result="preempted"}} {speculative_renderer.preempted}',
+        f'qie_speculative_views_total{{result="skipped"}} {speculative_renderer.skipped}',
+        "# HELP qie_speculative_pending Speculative pre-renders waiting for idle time.",
+        "# TYPE qie_speculative_pending gauge",
+        f"qie_speculative_pending {speculative_renderer.pending()}",
+        "# HELP qie_jobs Recent generation jobs by state.",
+        "# TYPE qie_jobs gauge",
+    ]
+    for state, n in sorted(job_manager.counts().items()):
+        lines.append(f'qie_jobs{{state="{state}"}} {n}')
+    if generation_scheduler is not None:
+        lines += [
+            "# HELP qie_scheduler_pending_jobs Jobs waiting in the request scheduler.",
+            "# TYPE qie_scheduler_pending_jobs gauge",
+            f"qie_scheduler_pending_jobs {generation_scheduler.pending()}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """/metrics, plus job status: GET /jobs, GET /jobs/<id> and POST /jobs/<id>/cancel."""
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            self._send(200, render_metrics().encode(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/jobs":
+            self._send_json(200, job_manager.jobs())
+        elif path.startswith("/jobs/") and job_manager.get(path[len("/jobs/"):]) is not None:
+            self._send_json(200, job_manager.get(path[len("/jobs/"):]))
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if not (path.startswith("/jobs/") and path.endswith("/cancel")):
+            self.send_error(404)
+            return
+        job_id = path[len("/jobs/"):-len("/cancel")]
+        if job_manager.get(job_id) is None:
+            self.send_error(404)
+            return
+        self._send_json(200, {"id": job_id, "cancelled": job_manager.cancel(job_id)})
+
+    def _send_json(self, status: int, payload):
+        self._send(status, json.dumps(payload).encode(), "application/json")
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host: str = None, port: int = None):
+    """Serve /metrics and the job status API from a daemon thread next to the Gradio app."""
+    host = host or METRICS_HOST
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return server
+
+
+# --- Caches ---
+
+# Byte budget for cached VAE latents of uploaded images (kept on CPU)
+VAE_CACHE_BYTES = int(os.environ.get("QIE_VAE_CACHE_BYTES", 256 * 1024 * 1024))
+
+# Byte budget for the in-memory tier of the prompt embedding cache
+EMBED_CACHE_BYTES = int(os.environ.get("QIE_EMBED_CACHE_BYTES", 512 * 1024 * 1024))
+
+# Size budget for the on-disk tier of the prompt embedding cache
+EMBED_DISK_BYTES = int(os.environ.get("QIE_EMBED_DISK_BYTES", 4 * 1024 * 1024 * 1024))
+
+# Byte budget for dequantized GGUF weights kept in compute dtype across steps (0 disables)
+DEQUANT_CACHE_BYTES = int(os.environ.get("QIE_DEQUANT_CACHE_BYTES", 0))
+
+# Skip the transformer's remaining blocks on steps whose first-block output changed less than this (0 disables)
+STEP_CACHE_THRESHOLD = float(os.environ.get("QIE_STEP_CACHE_THRESHOLD", 0))
+
+# Size budget for the on-disk store of generated images
+RESULT_CACHE_BYTES = int(os.environ.get("QIE_RESULT_CACHE_BYTES", 2 * 1024 * 1024 * 1024))
+
+# Root directory for on-disk caches (prompt embeddings, results, ...)
+CACHE_DIR = os.environ.get("QIE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+
+# Content hash of the image currently being generated; set by generate_views()
+_current_image_key = contextvars.ContextVar("current_image_key", default=None)
+
+
+def image_hash(pil_image: Image.Image) -> str:
+    """Content hash of a normalized (RGB) PIL image."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{pil_image.mode}:{pil_image.size}".encode())
+    h.update(pil_image.tobytes())
+    return h.hexdigest()
+
+
+def tensor_nbytes(value) -> int:
+    """Size in bytes of a tensor, or of all tensors in a tuple/list."""
+    if isinstance(value, (tuple, list)):
+        return sum(tensor_nbytes(v) for v in value)
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    return 0
+
+
+class LRUCache:
+    """Thread-safe LRU mapping that evicts least recently used entries beyond a byte budget."""
+    def __init__(self, max_bytes: int, sizeof=tensor_nbytes):
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+
+    def __len__(self):
+        return len(self._entries)
+
+
+vae_latent_cache = LRUCache(VAE_CACHE_BYTES)
+
+
+class DequantizedWeightCache(LRUCache):
+    """
+    LRU cache of dequantized GGUF weights, keyed by layer.
+
+    Every denoising step visits all layers in the same order, which makes
+    plain LRU evict exactly the layer needed next. Layers used within the
+    last `window` lookups (one pass over the model) are therefore never
+    evicted: a new weight is admitted only if it fits or displaces layers
+    that have gone cold. When the budget is smaller than the model, a stable
+    set of layers stays cached and the rest dequantize on demand.
+    """
+    def __init__(self, max_bytes: int):
+        super().__init__(max_bytes)
+        self.window = 0
+        self._tick = 0
+        self._last_used = {}
+
+    def get(self, key):
+        with self._lock:
+            self._tick += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            self._last_used[key] = self._tick
+            return entry[0]
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            victims, freed = [], 0
+            for victim, (_, victim_size) in self._entries.items():
+                if self.nbytes - freed + size <= self.max_bytes:
+                    break
+                if self._tick - self._last_used[victim] < self.window:
+                    return
+                victims.append(victim)
+                freed += victim_size
+            if self.nbytes - freed + size > self.max_bytes:
+                return
+            for victim in victims:
+                del self._entries[victim], self._last_used[victim]
+            self.nbytes -= freed
+            self._entries[key] = (value, size)
+            self._last_used[key] = self._tick
+            self.nbytes += size
+
+
+dequant_weight_cache = DequantizedWeightCache(DEQUANT_CACHE_BYTES)
+
+
+def save_tensor(path: str, tensor: torch.Tensor):
+    """Save a tensor as .npy; bfloat16 is stored bit-for-bit as int16."""
+    tensor = tensor.detach().cpu().contiguous()
+    array = tensor.view(torch.int16).numpy() if tensor.dtype == torch.bfloat16 else tensor.numpy()
+    np.save(path, array)
+
+
+def load_tensor(path: str, dtype_name: str) -> torch.Tensor:
+    """Memory-map a tensor written by save_tensor (copy-on-write, so it stays usable as a torch tensor)."""
+    tensor = torch.from_numpy(np.load(path, mmap_mode="c"))
+    return tensor.view(torch.bfloat16) if dtype_name == "bfloat16" else tensor
+
+
+def write_dir_atomic(path: str, write_fn):
+    """Populate a temporary directory with write_fn(tmp_dir) and rename it into place."""
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        write_fn(tmp)
+        os.replace(tmp, path)
+    except OSError:
+        # Another worker published the same entry first
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+
+
+def evict_lru(directory: str, max_bytes: int, usage) -> int:
+    """
+    Drop the least recently used entries of `directory` until it is under
+    `max_bytes`, and return the bytes left. `usage(entry)` gives an entry's
+    (last use time, size) or None to leave it alone; entries are files or
+    directories.
+    """
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                used = usage(entry)
+            except OSError:
+                continue
+            if used is not None:
+                entries.append((*used, entry.path))
+    total = sum(size for _, size, _ in entries)
+    # Evict down to 90% of the budget so the next few puts don't rescan
+    for _, size, path in sorted(entries):
+        if total <= max_bytes * 0.9:
+            break
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if not os.path.exists(path):
+            total -= size
+    return total
+
+
+class PromptEmbedCache:
+    """
+    Two-tier cache of VL-encoder outputs: an in-memory LRU in front of
+    memory-mapped .npy files under `directory`, shared by restarts and by
+    other worker processes. The disk tier is LRU-evicted to `disk_bytes`
+    like ResultStore, with each entry's meta.json mtime recording its last use.
+    """
+    def __init__(self, directory: str, max_bytes: int, disk_bytes: int):
+        self.directory = directory
+        self.memory = LRUCache(max_bytes)
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._nbytes = None
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str):
+        """Return (prompt_embeds, prompt_embeds_mask) on CPU, or None."""
+        value = self.memory.get(key)
+        if value is None:
+            value = self._load(key)
+            if value is not None:
+                self.memory.put(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._touch(key)
+        return value
+
+    def _touch(self, key: str):
+        try:
+            os.utime(os.path.join(self._path(key), "meta.json"))
+        except OSError:
+            pass
+
+    def put(self, key: str, prompt_embeds: torch.Tensor, prompt_embeds_mask):
+        """Store the embeddings in both tiers and return the CPU copies."""
+        prompt_embeds = prompt_embeds.detach().cpu()
+        prompt_embeds_mask = prompt_embeds_mask.detach().cpu() if prompt_embeds_mask is not None else None
+        value = (prompt_embeds, prompt_embeds_mask)
+        self.memory.put(key, value)
+        try:
+            self._save(key, prompt_embeds, prompt_embeds_mask)
+        except OSError as e:
+            print(f"Could not persist prompt embeddings: {e}")
+        return value
+
+    def _save(self, key, prompt_embeds, prompt_embeds_mask):
+        path = self._path(key)
+        if os.path.isdir(path):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+
+        def write(tmp):
+            meta = {"embeds_dtype": str(prompt_embeds.dtype).removeprefix("torch.")}
+            save_tensor(os.path.join(tmp, "embeds.npy"), prompt_embeds)
+            if prompt_embeds_mask is not None:
+                meta["mask_dtype"] = str(prompt_embeds_mask.dtype).removeprefix("torch.")
+                save_tensor(os.path.join(tmp, "mask.npy"), prompt_embeds_mask)
+            # meta.json is written last and marks the entry as complete
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump(meta, f)
+
+        write_dir_atomic(path, write)
+        size = sum(entry.stat().st_size for entry in os.scandir(path))
+        with self._lock:
+            if self._nbytes is not None:
+                self._nbytes += size
+            if self._nbytes is None or self._nbytes > self.disk_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Rescan the directory and drop least recently used entries until under budget."""
+        def usage(entry):
+            meta = os.path.join(entry.path, "meta.json")
+            if ".tmp-" in entry.name or not os.path.exists(meta):
+                return None
+            return os.path.getmtime(meta), sum(f.stat().st_size for f in os.scandir(entry.path))
+
+        self._nbytes = evict_lru(self.directory, self.disk_bytes, usage)
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            prompt_embeds = load_tensor(os.path.join(path, "embeds.npy"), meta["embeds_dtype"])
+            prompt_embeds_mask = None
+            if "mask_dtype" in meta:
+                prompt_embeds_mask = load_tensor(os.path.join(path, "mask.npy"), meta["mask_dtype"])
+        except (OSError, ValueError, KeyError):
+            return None
+        return prompt_embeds, prompt_embeds_mask
+
+
+prompt_embed_cache = PromptEmbedCache(os.path.join(CACHE_DIR, "prompt_embeds"), EMBED_CACHE_BYTES, EMBED_DISK_BYTES)
+
+
+class ResultStore:
+    """
+    Content-addressed store of generated images (one file per key, PNG by
+    default) with size-based LRU eviction. A file's mtime records its last
+    use; writes go through a temporary file and os.replace so readers never
+    see partial files.
+    """
+    def __init__(self, directory: str, max_bytes: int, image_format: str = "PNG", save_options: dict = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.image_format = image_format
+        self.save_options = {"compress_level": 1} if save_options is None else save_options
+        self._suffix = f".{image_format.lower()}"
+        self._lock = threading.Lock()
+        self._nbytes = None
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self._suffix}")
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def lookup(self, key: str):
+        """Path of a stored entry (marking it used) without decoding it, or None."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            image = Image.open(path)
+            image.load()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return image
+
+    def put(self, key: str, image: Image.Image):
+        """Store `image` under `key`; returns its path, or None if it could not be written."""
+        path = self._path(key)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            image.save(tmp, format=self.image_format, **self.save_options)
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"Could not store result: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return None
+        with self._lock:
+            if self._nbytes is not None:
+                self._nbytes += size
+            if self._nbytes is None or self._nbytes > self.max_bytes:
+                self._evict()
+        return path
+
+    def _evict(self):
+        """Rescan the directory and drop least recently used files until under budget."""
+        def usage(entry):
+            if not entry.name.endswith(self._suffix):
+                return None
+            stat = entry.stat()
+            return stat.st_mtime, stat.st_size
+
+        self._nbytes = evict_lru(self.directory, self.max_bytes, usage)
+
+
+result_store = ResultStore(os.path.join(CACHE_DIR, "results"), RESULT_CACHE_BYTES)
+
+# Small WebP copies of uploads for the 3D viewport texture, served as files instead of inline base64
+THUMBNAIL_SIZE = int(os.environ.get("QIE_THUMBNAIL_SIZE", 512))
+THUMBNAIL_CACHE_BYTES = int(os.environ.get("QIE_THUMBNAIL_CACHE_BYTES", 64 * 1024 * 1024))
+thumbnail_store = ResultStore(
+    os.path.join(CACHE_DIR, "thumbnails"), THUMBNAIL_CACHE_BYTES, image_format="WEBP", save_options={"quality": 80, "method": 4},
+)
+
+
+def thumbnail_url(image) -> str:
+    """
+    URL of a <= THUMBNAIL_SIZE px thumbnail of `image`, created once per
+    distinct image: a path relative to the app root, or a data URL.
+    """
+    pil_image = to_pil_rgb(image)
+    key = image_hash(pil_image)
+    path = thumbnail_store.lookup(key)
+    if path is None:
+        # to_pil_rgb already returned a private copy, so it can be shrunk in place
+        thumbnail = pil_image
+        thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS, reducing_gap=3.0)
+        path = thumbnail_store.put(key, thumbnail)
+        if path is None:
+            # Cache dir not writable: fall back to an inline (but still small) data URL
+            import base64
+            from io import BytesIO
+            buffered = BytesIO()
+            thumbnail.save(buffered, format="WEBP", quality=80)
+            return f"data:image/webp;base64,{base64.b64encode(buffered.getvalue()).decode()}"
+    # Relative to the app root (the viewport resolves it), so it works under a Gradio root_path
+    return f"gradio_api/file={os.path.abspath(path)}"
+
+
+def result_key(image_key: str, prompt: str, seed: int, guidance_scale: float, num_inference_steps: int, height: int, width: int) -> str:
+    """
+    Key covering every input and setting that determines a generated view (the
+    prompt encodes the snapped pose): besides the model, the fused LoRA path,
+    step cache threshold and VAE tiling change the pixels too.
+    """
+    payload = json.dumps([
+        BASE_MODEL, GGUF_FILE, str(dtype), sorted(ADAPTER_WEIGHTS.items()), FUSE_LORA, STEP_CACHE_THRESHOLD,
+        [VAE_TILING_PIXELS, VAE_TILE_SIZE, VAE_TILE_OVERLAP] if VAE_TILING_PIXELS else None,
+        image_key, prompt, int(seed), float(guidance_scale), int(num_inference_steps), int(height), int(width),
+    ])
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def install_vae_latent_cache(pipe):
+    """
+    Wrap the pipeline's VAE encoder so image-conditioning latents are reused
+    across calls for the same upload. Entries are keyed by the image hash and
+    the resolution actually fed to the encoder. The pipeline encodes with
+    sample_mode="argmax", so cached latents are identical to fresh ones.
+    """
+    encode = pipe._encode_vae_image
+
+    def cached_encode_vae_image(image, generator):
+        image_key = _current_image_key.get()
+        if image_key is None:
+            with stage_timer("vae_encode"):
+                return encode(image, generator)
+        key = (image_key, tuple(image.shape))
+        latents = vae_latent_cache.get(key)
+        if latents is None:
+            with stage_timer("vae_encode"):
+                latents = encode(image, generator)
+            vae_latent_cache.put(key, latents.detach().to("cpu"))
+            return latents
+        return latents.to(image.device)
+
+    pipe._encode_vae_image = cached_encode_vae_image
+
+
+def install_dequant_cache(pipe):
+    """
+    Let the transformer's GGUF linear layers reuse dequantized weights from
+    dequant_weight_cache instead of dequantizing on every forward pass.
+    Cached weights live on the device they were dequantized on (on CUDA the
+    budget is VRAM, capped to what the other components leave free); a layer
+    whose quantized weight has since moved (CPU offload) dequantizes afresh.
+    """
+    # Compiled blocks fuse dequantization into the matmuls; a cache lookup would split the graph at every layer
+    if not DEQUANT_CACHE_BYTES or COMPILE_ENABLED:
+        return
+    try:
+        from diffusers.quantizers.gguf.utils import GGUFLinear, dequantize_gguf_tensor
+    except ImportError:
+        return
+    layers = [m for m in pipe.transformer.modules() if isinstance(m, GGUFLinear)]
+    if any(hasattr(layer, "_hf_hook") for layer in layers):
+        # Sequential offload hooks each layer's forward to move its weights; replacing forward would bypass that
+        print("Dequantized weight cache disabled: not compatible with sequential CPU offload")
+        return
+    dequant_weight_cache.window = len(layers)
+    if device == "cuda":
+        # Weights are cached where they were dequantized, so on CUDA the budget is VRAM that stays
+        # allocated while model offload swaps in the text encoder and VAE; leave room for the largest
+        free_bytes, _ = torch.cuda.mem_get_info()
+        largest = max(
+            sum(p.numel() * p.element_size() for p in component.parameters())
+            for component in pipe.components.values() if isinstance(component, torch.nn.Module)
+        )
+        allowed = max(0, int(free_bytes - largest - quant_overhead_gb() * 1024 ** 3))
+        if DEQUANT_CACHE_BYTES > allowed:
+            print(
+                f"Warning: QIE_DEQUANT_CACHE_BYTES is a VRAM budget on CUDA; "
+                f"capping it to {allowed / 1024 ** 3:.1f}GB of {free_bytes / 1024 ** 3:.1f}GB free VRAM"
+            )
+            dequant_weight_cache.max_bytes = allowed
+        if not dequant_weight_cache.max_bytes:
+            return
+
+    for layer in layers:
+        def cached_forward(inputs, _layer=layer):
+            weight = dequant_weight_cache.get(_layer)
+            if weight is None or weight.device != _layer.weight.device:
+                weight = dequantize_gguf_tensor(_layer.weight).to(_layer.compute_dtype)
+                dequant_weight_cache.put(_layer, weight)
+            bias = _layer.bias.to(_layer.compute_dtype) if _layer.bias is not None else None
+            return torch.nn.functional.linear(inputs, weight, bias)
+
+        layer.forward = cached_forward
+    memory = "VRAM" if device == "cuda" else "RAM"
+    print(f"Dequantized weight cache: {len(layers)} GGUF layers, {dequant_weight_cache.max_bytes / 1024 ** 3:.1f}GB {memory} budget")
+
+
+class StepResidualCache:
+    """
+    First-block caching (as in FBCache/TeaCache) across denoising steps.
+
+    The first transformer block always runs. Its residual's relative change
+    since the previous step (mean absolute difference over mean magnitude) is
+    accumulated; while the sum stays below `threshold`, the remaining blocks
+    are skipped and the residual they added on the last fully computed step
+    is reused. reset() starts a new pipeline call; call_hits/call_steps
+    count that call's reused and total steps.
+    """
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.reset()
+
+    def reset(self):
+        self.skip = False
+        self.call_hits = 0
+        self.call_steps = 0
+        self._previous = None
+        self._accumulated = 0.0
+        self._tail_inputs = None
+        self._tail_residuals = None
+
+    def after_first_block(self, hidden_in, encoder_out, hidden_out):
+        residual = hidden_out - hidden_in
+        previous, self._previous = self._previous, residual
+        self._tail_inputs = (encoder_out, hidden_out)
+        self.call_steps += 1
+        self.skip = False
+        if previous is not None and self._tail_residuals is not None and previous.shape == residual.shape:
+            change = (residual - previous).abs().mean() / previous.abs().mean().clamp_min(1e-6)
+            self._accumulated += change.item()
+            self.skip = self._accumulated < self.threshold
+        if self.skip:
+            self.call_hits += 1
+            self.hits += 1
+        else:
+            self._accumulated = 0.0
+            self.misses += 1
+
+    def store(self, encoder_out, hidden_out):
+        """Remember what the remaining blocks added on a fully computed step."""
+        encoder_in, hidden_in = self._tail_inputs
+        self._tail_residuals = (encoder_out - encoder_in, hidden_out - hidden_in)
+
+    def apply(self, encoder, hidden):
+        encoder_residual, hidden_residual = self._tail_residuals
+        return encoder + encoder_residual, hidden + hidden_residual
+
+
+step_cache = StepResidualCache(STEP_CACHE_THRESHOLD)
+
+
+def install_step_cache(pipe):
+    """
+    Route the transformer blocks through step_cache: the first block reports
+    its output, and on skipped steps the other blocks pass their inputs
+    through while the last one adds the cached residual.
+    """
+    if not STEP_CACHE_THRESHOLD:
+        return
+    blocks = list(pipe.transformer.transformer_blocks)
+    if len(blocks) < 2:
+        return
+
+    def block_states(args, kwargs):
+        """(encoder_hidden_states, hidden_states) passed to a block, matching its return order."""
+        hidden = kwargs["hidden_states"] if "hidden_states" in kwargs else args[0]
+        encoder = kwargs["encoder_hidden_states"] if "encoder_hidden_states" in kwargs else args[1]
+        return encoder, hidden
+
+    first_forward = blocks[0].forward
+
+    def first_block(*args, **kwargs):
+        _, hidden_in = block_states(args, kwargs)
+        encoder_out, hidden_out = first_forward(*args, **kwargs)
+        step_cache.after_first_block(hidden_in, encoder_out, hidden_out)
+        return encoder_out, hidden_out
+
+    blocks[0].forward = first_block
+
+    for block in blocks[1:]:
+        def tail_block(*args, _forward=block.forward, _last=block is blocks[-1], **kwargs):
+            if step_cache.skip:
+                encoder, hidden = block_states(args, kwargs)
+                return step_cache.apply(encoder, hidden) if _last else (encoder, hidden)
+            encoder_out, hidden_out = _forward(*args, **kwargs)
+            if _last:
+                step_cache.store(encoder_out, hidden_out)
+            return encoder_out, hidden_out
+
+        block.forward = tail_block
+    print(f"Step residual cache: threshold {STEP_CACHE_THRESHOLD} over {len(blocks)} transformer blocks")
+
+
+# --- Compiled Execution ---
+
+# Opt-in torch.compile of the transformer blocks and the VAE decoder
+COMPILE_ENABLED = os.environ.get("QIE_COMPILE", "0") == "1"
+COMPILE_MODE = os.environ.get("QIE_COMPILE_MODE", "default")
+# Shapes ("WxH,...") compiled at startup when resolution buckets are off; with buckets, every bucket is
+COMPILE_WARMUP_SIZES = os.environ.get("QIE_COMPILE_WARMUP_SIZES", "1024x1024")
+COMPILE_WARMUP_STEPS = int(os.environ.get("QIE_COMPILE_WARMUP_STEPS", 2))
+
+
+class CompileStatus:
+    """Progress of the compiled path: state is "off", "cold", "warming", "ready" or "error"."""
+    def __init__(self, enabled: bool):
+        self.state = "cold" if enabled else "off"
+        self.cache_dir = None
+        self.shapes = []
+        self.total_shapes = 0
+
+
+compile_status = CompileStatus(COMPILE_ENABLED)
+
+
+def install_compile(pipe, model_key: str):
+    """
+    Compile each transformer block and the VAE decoder with torch.compile.
+
+    Blocks are compiled one by one (they share code, so one graph serves all
+    of them) rather than the whole transformer, which keeps compile times
+    short and leaves the per-step Python of the step cache, the previewer
+    and the offload hooks outside the graphs. Must run before
+    install_step_cache, which wraps the compiled block forwards.
+
+    Inductor artifacts go to CACHE_DIR/compile/<key>, where the key covers
+    the base model, GGUF file (quantization), LoRA set and weights, device,
+    dtype and torch version; inductor keys them by shape within that
+    directory, so restarts reuse compiled kernels instead of recompiling.
+    """
+    if not COMPILE_ENABLED:
+        return
+    payload = json.dumps([model_key, device, str(dtype), torch.__version__, COMPILE_MODE])
+    cache_dir = os.path.join(CACHE_DIR, "compile", hashlib.blake2b(payload.encode(), digest_size=16).hexdigest())
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = cache_dir
+    os.environ.setdefault("TRITON_CACHE_DIR", os.path.join(cache_dir, "triton"))
+    import torch._dynamo
+    import torch._inductor.config
+    torch._inductor.config.fx_graph_cache = True
+    # One graph per (shape, batch size, device) and compiled module type
+    torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, 64)
+    # A graph that fails to compile (e.g. no C++ toolchain on CPU) runs eagerly instead
+    torch._dynamo.config.suppress_errors = True
+    compile_status.cache_dir = cache_dir
+
+    blocks = list(pipe.transformer.transformer_blocks)
+    for block in blocks:
+        block.forward = torch.compile(block.forward, mode=COMPILE_MODE, dynamic=False)
+    decoder = getattr(pipe.vae, "decoder", None)
+    if decoder is not None:
+        decoder.forward = torch.compile(decoder.forward, mode=COMPILE_MODE, dynamic=False)
+    print(f"torch.compile ({COMPILE_MODE}): {len(blocks)} transformer blocks{' and VAE decoder' if decoder is not None else ''}, cache {cache_dir}")
+
+
+def compile_warmup_sizes() -> list:
+    """(height, width) shapes compiled at startup: the resolution buckets, else QIE_COMPILE_WARMUP_SIZES."""
+    if resolution_buckets is not None:
+        return list(resolution_buckets.hits)
+    sizes = []
+    for size in COMPILE_WARMUP_SIZES.split(","):
+        width, height = (int(v) for v in size.lower().split("x"))
+        sizes.append((height, width))
+    return sizes
+
+
+def warmup_compiled():
+    """
+    Run a short generation at every warmup shape so kernels are compiled (or
+    loaded from the on-disk cache) before traffic arrives. Each shape is
+    warmed once, at batch size 1 with an input image of that same shape;
+    other output/input shape pairs and batch sizes compile on first use, as
+    do the rest after a failed warmup. The gray warmup image bypasses the
+    VAE latent and prompt embedding caches, and step cache counters are
+    cleared afterwards, so no warmup entries or stats reach production.
+    """
+    if not COMPILE_ENABLED:
+        return
+    sizes = compile_warmup_sizes()
+    compile_status.total_shapes = len(sizes)
+    compile_status.state = "warming"
+    prompt = build_camera_prompt(0, 0, 1.0)
+    for height, width in sizes:
+        image = Image.new("RGB", (width, height), (128, 128, 128))
+        start = time.perf_counter()
+        try:
+            with torch.inference_mode():
+                run_pipeline(image, None, [prompt], [0], 1.0, COMPILE_WARMUP_STEPS, height, width)
+        except Exception as e:
+            print(f"Compile warmup failed at {width}x{height} ({e}); remaining shapes compile on first use")
+            compile_status.state = "error"
+            return
+        finally:
+            step_cache.hits = step_cache.misses = 0
+        compile_status.shapes.append((height, width))
+        print(f"Compile warmup {width}x{height}: {time.perf_counter() - start:.1f}s")
+    compile_status.state = "ready"
+
+
+# --- Latent Previews ---
+
+# Longest side of the per-step previews streamed to the UI (QIE_PREVIEW_SIZE=0 disables them)
+PREVIEW_SIZE = int(os.environ.get("QIE_PREVIEW_SIZE", 384))
+
+# Linear map from the 16 normalized latent channels of the Wan 2.1 VAE (which
+# Qwen-Image uses) to RGB in [-1, 1]; rows are channels
+LATENT_RGB_FACTORS = [
+    [-0.1299, -0.1692, 0.2932],
+    [0.0671, 0.0406, 0.0442],
+    [0.3568, 0.2548, 0.1747],
+    [0.0372, 0.2344, 0.1420],
+    [0.0313, 0.0189, -0.0328],
+    [0.0296, -0.0956, -0.0665],
+    [-0.3477, -0.4059, -0.2925],
+    [0.0166, 0.1902, 0.1975],
+    [-0.0412, 0.0267, -0.1364],
+    [-0.1293, 0.0740, 0.1636],
+    [0.0680, 0.3019, 0.1128],
+    [0.0032, 0.0581, 0.0639],
+    [-0.1251, 0.0927, 0.1699],
+    [0.0060, -0.0633, 0.0005],
+    [0.3477, 0.2275, 0.2950],
+    [0.1984, 0.0913, 0.1861],
+]
+LATENT_RGB_BIAS = [-0.1835, -0.0868, -0.3360]
+
+
+def latent_rgb_projection(z_dim: int):
+    """(weight [z_dim, 3], bias [3]); other VAEs fall back to reading the first channels as RGB."""
+    if z_dim == len(LATENT_RGB_FACTORS):
+        return torch.tensor(LATENT_RGB_FACTORS), torch.tensor(LATENT_RGB_BIAS)
+    return torch.eye(z_dim, 3), torch.zeros(3)
+
+
+class LatentPreviewer:
+    """
+    Per-step previews without a VAE decode. A transformer forward hook keeps
+    the latest velocity prediction v, so after each step the clean latents
+    can be estimated as x0 = x_t - sigma * v and projected to a small RGB
+    image with LATENT_RGB_FACTORS.
+
+    `callbacks` holds one callable (or None) per batch row; each receives the
+    PIL preview of its view.
+    """
+    def __init__(self, pipe, height: int, width: int, callbacks: list):
+        self.height, self.width = height, width
+        self.callbacks = callbacks
+        self.weight, self.bias = latent_rgb_projection(pipe.vae.config.z_dim)
+        self._velocity = None
+
+    def capture(self, module, args, output):
+        self._velocity = output[0] if isinstance(output, tuple) else output.sample
+
+    def __call__(self, pipe, step, timestep, callback_kwargs):
+        # The final step is followed by the real decode anyway
+        if self._velocity is None or step >= getattr(pipe, "_num_timesteps", 0) - 1:
+            return callback_kwargs
+        with stage_timer("preview"):
+            latents = callback_kwargs["latents"]
+            sigma = pipe.scheduler.sigmas[pipe.scheduler.step_index].to(latents.device)
+            x0 = latents - sigma * self._velocity[:, : latents.size(1)].to(latents.dtype)
+            x0 = pipe._unpack_latents(x0, self.height, self.width, pipe.vae_scale_factor)[:, :, 0].float()
+            rgb = torch.einsum("bchw,cr->brhw", x0, self.weight.to(x0.device)) + self.bias.to(x0.device).view(1, 3, 1, 1)
+            rgb = ((rgb + 1) * 127.5).clamp(0, 255).to(torch.uint8).permute(0, 2, 3, 1).cpu().numpy()
+        scale = PREVIEW_SIZE / max(rgb.shape[1:3])
+        size = (max(1, round(rgb.shape[2] * scale)), max(1, round(rgb.shape[1] * scale)))
+        for callback, pixels in zip(self.callbacks, rgb):
+            if callback is not None:
+                callback(Image.fromarray(pixels).resize(size, Image.BILINEAR))
+        return callback_kwargs
+
+
+def chain_step_callbacks(*callbacks):
+    """Combine callback_on_step_end functions, skipping None; each gets the previous one's kwargs."""
+    callbacks = [c for c in callbacks if c is not None]
+    if len(callbacks) <= 1:
+        return callbacks[0] if callbacks else None
+
+    def step_end(pipe, step, timestep, callback_kwargs):
+        for callback in callbacks:
+            callback_kwargs = callback(pipe, step, timestep, callback_kwargs)
+        return callback_kwargs
+
+    return step_end
+
+
+# --- Prompt Building ---
+
+# Azimuth mappings (8 positions)
+AZIMUTH_MAP = {
+    0: "front view",
+    45: "front-right quarter view",
+    90: "right side view",
+    135: "back-right quarter view",
+    180: "back view",
+    225: "back-left quarter view",
+    270: "left side view",
+    315: "front-left quarter view"
+}
+
+# Elevation mappings (4 positions)
+ELEVATION_MAP = {
+    -30: "low-angle shot",
+    0: "eye-level shot",
+    30: "elevated shot",
+    60: "high-angle shot"
+}
+
+# Distance mappings (3 positions)
+DISTANCE_MAP = {
+    0.6: "close-up",
+    1.0: "medium shot",
+    1.8: "wide shot"
+}
+
+
+def snap_to_nearest(value, options):
+    """Snap a value to the nearest option in a list."""
+    return min(options, key=lambda x: abs(x - value))
+
+
+def build_camera_prompt(azimuth: float, elevation: float, distance: float) -> str:
+    """
+    Build a camera prompt from azimuth, elevation, and distance values.
+    
+    Args:
+        azimuth: Horizontal rotation in degrees (0-360)
+        elevation: Vertical angle in degrees (-30 to 60)
+        distance: Distance factor (0.6 to 1.8)
+    
+    Returns:
+        Formatted prompt string for the LoRA
+    """
+    # Snap to nearest valid values
+    azimuth_snapped = snap_to_nearest(azimuth, list(AZIMUTH_MAP.keys()))
+    elevation_snapped = snap_to_nearest(elevation, list(ELEVATION_MAP.keys()))
+    distance_snapped = snap_to_nearest(distance, list(DISTANCE_MAP.keys()))
+    
+    azimuth_name = AZIMUTH_MAP[azimuth_snapped]
+    elevation_name = ELEVATION_MAP[elevation_snapped]
+    distance_name = DISTANCE_MAP[distance_snapped]
+    
+    return f"<sks> {azimuth_name} {elevation_name} {distance_name}"
+
+
+def session_id(request) -> str:
+    """Identify the UI session behind a Gradio request (None outside of Gradio)."""
+    return getattr(request, "session_hash", None) if request is not None else None
+
+
+def to_pil_rgb(image) -> Image.Image:
+    """Normalize an uploaded image (PIL or file path) to RGB."""
+    return image.convert("RGB") if isinstance(image, Image.Image) else Image.open(image).convert("RGB")
+
+
+def encode_camera_prompt(pipe, pil_image: Image.Image, prompt: str):
+    """
+    Run the vision-language encoder for one (image, prompt) pair, exactly as
+    QwenImageEditPlusPipeline does internally for a single input image.
+
+    Returns:
+        (prompt_embeds, prompt_embeds_mask); the mask may be None
+    """
+    condition_width, condition_height = calculate_dimensions(CONDITION_IMAGE_SIZE, pil_image.width / pil_image.height)
+    condition_image = pipe.image_processor.resize(pil_image, condition_height, condition_width)
+    return pipe.encode_prompt(
+        prompt=prompt,
+        image=[condition_image],
+        device=pipe._execution_device,
+        num_images_per_prompt=1,
+    )
+
+
+def get_prompt_embeds(pipe, pil_image: Image.Image, image_key: str, prompt: str):
+    """
+    Return (prompt_embeds, prompt_embeds_mask), running the VL encoder only on
+    a cache miss. image_key=None encodes without touching the cache.
+    """
+    if image_key is None:
+        with stage_timer("prompt_encode"):
+            return encode_camera_prompt(pipe, pil_image, prompt)
+    condition_size = calculate_dimensions(CONDITION_IMAGE_SIZE, pil_image.width / pil_image.height)
+    key = hashlib.blake2b(
+        f"{BASE_MODEL}|{dtype}|{image_key}|{prompt}|{condition_size[0]}x{condition_size[1]}".encode(),
+        digest_size=16,
+    ).hexdigest()
+    cached = prompt_embed_cache.get(key)
+    if cached is None:
+        with stage_timer("prompt_encode"):
+            encoded = encode_camera_prompt(pipe, pil_image, prompt)
+        cached = prompt_embed_cache.put(key, *encoded)
+    return cached
+
+
+def stack_prompt_embeds(encoded):
+    """Right-pad per-prompt embeddings to a common length and stack them into one batch."""
+    max_len = max(embeds.shape[1] for embeds, _ in encoded)
+    batch_embeds, batch_masks = [], []
+    for embeds, mask in encoded:
+        if mask is None:
+            mask = torch.ones(embeds.shape[:2], dtype=torch.long, device=embeds.device)
+        pad = max_len - embeds.shape[1]
+        if pad:
+            embeds = torch.nn.functional.pad(embeds, (0, 0, 0, pad))
+            mask = torch.nn.functional.pad(mask, (0, pad))
+        batch_embeds.append(embeds)
+        batch_masks.append(mask)
+    return torch.cat(batch_embeds), torch.cat(batch_masks)
+
+
+@torch.inference_mode()
+def run_pipeline(
+    pil_image: Image.Image,
+    image_key: str,
+    prompts: list,
+    seeds: list,
+    guidance_scale: float,
+    num_inference_steps: int,
+    height: int,
+    width: int,
+    trace: StageTrace = None,
+    latents: torch.Tensor = None,
+    sigmas: list = None,
+    output_type: str = "pil",
+    on_preview: list = None,
+    cancel_events: list = None,
+) -> list:
+    """
+    Denoise one or more camera prompts for the same input image in a single
+    pipeline call. The image is VAE-encoded once and shared across the batch;
+    every view gets its own generator seeded from `seeds`, so a view is
+    identical to what a single-prompt call with that seed would produce.
+    Stage timings (and step cache hits) are recorded into `trace` when given.
+    image_key=None bypasses the VAE latent and prompt embedding caches.
+
+    `latents`/`sigmas` start denoising from given (packed) latents on a custom
+    schedule; output_type="latent" returns packed latents instead of images.
+    `on_preview` holds one callable (or None) per prompt that receives cheap
+    PIL previews of that view after each denoising step. `cancel_events`
+    holds one threading.Event (or None) per prompt; once all are set the call
+    stops at the next step with GenerationCancelled.
+    Calls are serialized on PIPELINE_LOCK since the pipeline is not reentrant.
+    """
+    pipe = get_pipe()
+    generators = [torch.Generator(device=device).manual_seed(s) for s in seeds]
+    execution_device = pipe._execution_device
+
+    with PIPELINE_LOCK:
+        trace_token = _current_trace.set(trace)
+        image_key_token = _current_image_key.set(image_key)
+        previewer = preview_hook = None
+        canceller = cancellation_check(cancel_events) if cancel_events and all(cancel_events) else None
+        if PREVIEW_SIZE and on_preview and any(on_preview):
+            preview_height, preview_width = resolve_output_size(pipe, pil_image, height, width)
+            previewer = LatentPreviewer(pipe, preview_height, preview_width, on_preview)
+            preview_hook = pipe.transformer.register_forward_hook(previewer.capture)
+        try:
+            # The VL encoder sees the image once per prompt, so prompts are encoded (or
+            # fetched from the cache) one at a time and handed to the pipeline as a batch
+            prompt_embeds, prompt_embeds_mask = stack_prompt_embeds(
+                [get_prompt_embeds(pipe, pil_image, image_key, p) for p in prompts]
+            )
+            step_cache.reset()
+            try:
+                return pipe(
+                    image=[pil_image],
+                    height=height if height != 0 else None,
+                    width=width if width != 0 else None,
+                    num_inference_steps=num_inference_steps,
+                    generator=generators if len(generators) > 1 else generators[0],
+                    guidance_scale=guidance_scale,
+                    num_images_per_prompt=1,
+                    prompt_embeds=prompt_embeds.to(execution_device),
+                    prompt_embeds_mask=prompt_embeds_mask.to(execution_device),
+                    callback_on_step_end=chain_step_callbacks(getattr(pipe, "_qie_step_timer", None), previewer, canceller),
+                    latents=latents,
+                    sigmas=sigmas,
+                    output_type=output_type,
+                ).images
+            except Exception:
+                # An exception (e.g. cancellation from a step callback) skips the pipeline's own
+                # maybe_free_model_hooks(); without it the transformer stays on the GPU under offload
+                pipe.maybe_free_model_hooks()
+                raise
+        finally:
+            if preview_hook is not None:
+                preview_hook.remove()
+            if trace is not None and step_cache.call_steps:
+                trace.count("step_cache_hits", step_cache.call_hits)
+                trace.count("step_cache_steps", step_cache.call_steps)
+            # Drop the cached residuals until the next call
+            step_cache.reset()
+            _current_image_key.reset(image_key_token)
+            _current_trace.reset(trace_token)
+
+
+# --- Resolution Buckets ---
+
+# Render at a fixed set of shapes so compiled kernels, RoPE tables and scheduler batches get reused
+BUCKETS_ENABLED = os.environ.get("QIE_BUCKETS", "0") == "1"
+# Target pixel counts (one bucket set per entry) and width:height aspect ratios
+BUCKET_PIXELS = [int(p) for p in os.environ.get("QIE_BUCKET_PIXELS", str(1024 * 1024)).split(",")]
+BUCKET_RATIOS = os.environ.get("QIE_BUCKET_RATIOS", "1:1,4:3,3:4,3:2,2:3,16:9,9:16").split(",")
+
+
+class ResolutionBuckets:
+    """
+    Snaps requests to the nearest of a fixed set of (height, width) buckets.
+
+    One set of buckets (a tier) is built per target pixel count. The output
+    renders at the bucket nearest the requested size and is resized back.
+    The input image is snapped separately, to the bucket nearest its own
+    size and aspect ratio, so the condition and VAE image shapes are fixed
+    too while the conditioning image is never squashed to the output's
+    aspect (only stretched by the small gap to its nearest bucket).
+    """
+    def __init__(self, pixel_counts: list, ratios: list):
+        self.tiers = {}
+        for pixels in pixel_counts:
+            tier = set()
+            for ratio in ratios:
+                w, h = (float(v) for v in ratio.split(":"))
+                width, height = calculate_dimensions(pixels, w / h)
+                tier.add((height, width))
+            self.tiers[pixels] = sorted(tier)
+        self.hits = {bucket: 0 for tier in self.tiers.values() for bucket in tier}
+        self._lock = threading.Lock()
+
+    def nearest(self, height: int, width: int) -> tuple:
+        """The tier with the closest pixel count, then its bucket with the closest aspect ratio."""
+        pixels = min(self.tiers, key=lambda p: abs(math.log(p / (height * width))))
+        aspect = math.log(width / height)
+        return min(self.tiers[pixels], key=lambda b: abs(math.log(b[1] / b[0]) - aspect))
+
+    def snap(self, pil_image: Image.Image, height: int, width: int, count: bool = True):
+        """(image, bucket height, bucket width, requested (width, height)) for a request; `count` records a hit."""
+        if not height or not width:
+            calculated_width, calculated_height = calculate_dimensions(1024 * 1024, pil_image.width / pil_image.height)
+            height = height or calculated_height
+            width = width or calculated_width
+        bucket_height, bucket_width = self.nearest(height, width)
+        if count:
+            with self._lock:
+                self.hits[(bucket_height, bucket_width)] += 1
+        input_height, input_width = self.nearest(pil_image.height, pil_image.width)
+        if pil_image.size != (input_width, input_height):
+            pil_image = pil_image.resize((input_width, input_height), Image.LANCZOS)
+        return pil_image, bucket_height, bucket_width, (width, height)
+
+    def metrics(self) -> list:
+        lines = [
+            "# HELP qie_resolution_bucket_hits_total Requests snapped to each resolution bucket.",
+            "# TYPE qie_resolution_bucket_hits_total counter",
+        ]
+        with self._lock:
+            for (height, width), n in self.hits.items():
+                lines.append(f'qie_resolution_bucket_hits_total{{bucket="{width}x{height}"}} {n}')
+        return lines
+
+
+def restore_size(image: Image.Image, size: tuple) -> Image.Image:
+    """Resize a bucket-sized output back to the requested (width, height)."""
+    return image if image.size == size else image.resize(size, Image.LANCZOS)
+
+
+resolution_buckets = ResolutionBuckets(BUCKET_PIXELS, BUCKET_RATIOS) if BUCKETS_ENABLED else None
+
+
+# --- Jobs ---
+
+# How long a single-view request waits for a newer one from the same session before it starts
+DEBOUNCE_MS = float(os.environ.get("QIE_DEBOUNCE_MS", 250))
+
+
+class GenerationCancelled(Exception):
+    """A generation was superseded or cancelled before it finished."""
+
+
+@dataclass(eq=False)
+class JobRecord:
+    id: str
+    owner: str
+    kind: str
+    state: str = "pending"  # pending -> running -> done / cancelled / error
+    created: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id, "owner": self.owner, "kind": self.kind, "state": self.state,
+            "created": self.created, "started": self.started, "finished": self.finished,
+        }
+
+
+class JobManager:
+    """
+    Tracks generation jobs by ID. Starting a job for a session cancels that
+    session's unfinished job, so rapid camera changes only pay for the last
+    one: a superseded job stops during its debounce wait, before it is
+    batched, or at the next denoising step. Jobs without a session never
+    supersede each other. The most recent `history` jobs are kept for status
+    queries.
+    """
+    def __init__(self, debounce_ms: float, history: int = 200):
+        self.debounce = debounce_ms / 1000.0
+        self.history = history
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active = {}
+
+    def start(self, owner: str = None, kind: str = "single_view") -> JobRecord:
+        job = JobRecord(os.urandom(8).hex(), owner, kind)
+        with self._lock:
+            if owner is not None:
+                previous = self._active.get(owner)
+                if previous is not None:
+                    previous.cancel_event.set()
+                self._active[owner] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        return job
+
+    def wait_debounce(self, job: JobRecord) -> bool:
+        """Wait out the debounce window; False if the job was superseded meanwhile."""
+        if self.debounce and job.owner is not None:
+            job.cancel_event.wait(self.debounce)
+        if job.cancel_event.is_set():
+            return False
+        job.state, job.started = "running", time.time()
+        return True
+
+    def finish(self, job: JobRecord, state: str):
+        with self._lock:
+            job.state, job.finished = state, time.time()
+            if self._active.get(job.owner) is job:
+                del self._active[job.owner]
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.finished is not None:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.to_dict() if job is not None else None
+
+    def jobs(self) -> list:
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def counts(self) -> dict:
+        counts = {}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job.state] = counts.get(job.state, 0) + 1
+        return counts
+
+
+job_manager = JobManager(DEBOUNCE_MS)
+
+
+def cancellation_check(cancel_events: list):
+    """Step-end callback that aborts the pipeline call once every job in its batch is cancelled."""
+    def check(pipe, step, timestep, callback_kwargs):
+        if all(event.is_set() for event in cancel_events):
+            raise GenerationCancelled()
+        return callback_kwargs
+
+    return check
+
+
+# --- Worker Pool ---
+
+def parse_worker_urls(spec: str) -> list:
+    """Base URLs from a comma-separated list."""
+    return [url.strip().rstrip("/") for url in spec.split(",") if url.strip()]
+
+
+# worker.py base URLs (QIE_WORKERS, comma-separated); when set, generations run on these replicas instead of in-process
+WORKER_URLS = parse_worker_urls(os.environ.get("QIE_WORKERS", ""))
+WORKER_HEALTH_INTERVAL_S = float(os.environ.get("QIE_WORKER_HEALTH_INTERVAL_S", 5))
+WORKER_TIMEOUT_S = float(os.environ.get("QIE_WORKER_TIMEOUT_S", 900))
+
+
+def encode_image(pil_image: Image.Image) -> str:
+    """Lossless base64 PNG for the worker protocol."""
+    import base64
+    from io import BytesIO
+    buffered = BytesIO()
+    pil_image.save(buffered, format="PNG", compress_level=1)
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+def decode_image(data: str) -> Image.Image:
+    import base64
+    from io import BytesIO
+    image = Image.open(BytesIO(base64.b64decode(data)))
+    image.load()
+    return image
+
+
+class WorkerUnavailable(Exception):
+    """No worker replica could take the request."""
+
+
+class WorkerPool:
+    """
+    Dispatches generations to pipeline replicas (worker.py) over HTTP.
+
+    A background thread polls each worker's /health. Requests go to the
+    ready worker with the least outstanding work: requests in flight from
+    here plus the worker's own reported queue. Input images are sent by hash
+    first and uploaded only when the worker does not have them yet. A worker
+    that fails a request is marked down until its next good health check,
+    and the request moves to another worker.
+    """
+    def __init__(self, urls: list, health_interval: float = WORKER_HEALTH_INTERVAL_S, timeout: float = WORKER_TIMEOUT_S):
+        self.health_interval = health_interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.workers = {url: {"up": False, "ready": False, "inflight": 0, "pending": 0, "info": {}} for url in urls}
+        self._thread = None
+        # Dispatches independent chunks of one request to several replicas at once
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency(), thread_name_prefix="worker-dispatch")
+
+    def concurrency(self) -> int:
+        """Requests worth having in flight: one running and one queued per replica."""
+        return 2 * len(self.workers)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._health_loop, name="worker-health", daemon=True)
+            self._thread.start()
+
+    def _request(self, url: str, payload: dict = None, timeout: float = None):
+        import urllib.request
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+            return json.loads(response.read())
+
+    def check(self, url: str):
+        try:
+            health = self._request(f"{url}/health", timeout=min(10.0, self.health_interval * 2))
+        except (OSError, ValueError):
+            with self._lock:
+                self.workers[url].update(up=False, ready=False)
+            return
+        with self._lock:
+            self.workers[url].update(up=True, ready=bool(health.get("ready")), pending=health.get("pending", 0), info=health)
+
+    def _health_loop(self):
+        while True:
+            for url in list(self.workers):
+                self.check(url)
+            time.sleep(self.health_interval)
+
+    def _pick(self, exclude: set):
+        with self._lock:
+            candidates = [
+                (w["inflight"] + w["pending"], url) for url, w in self.workers.items()
+                if w["up"] and w["ready"] and url not in exclude
+            ]
+            if not candidates:
+                return None
+            url = min(candidates)[1]
+            self.workers[url]["inflight"] += 1
+            return url
+
+    def generate(
+        self, pil_image, image_key, prompts, seed, guidance_scale, num_inference_steps, height, width,
+        owner=None, batch_limit=0, trace=None,
+    ) -> list:
+        """Denoise `prompts` on the least loaded ready worker; stage timings are merged into `trace`."""
+        payload = {
+            "image_key": image_key, "prompts": prompts, "seed": seed, "guidance_scale": guidance_scale,
+            "num_inference_steps": num_inference_steps, "height": height, "width": width,
+            "owner": owner, "batch_limit": batch_limit,
+        }
+        tried = set()
+        while True:
+            url = self._pick(tried)
+            if url is None:
+                raise WorkerUnavailable(f"No ready worker among {len(self.workers)} ({len(tried)} failed)")
+            tried.add(url)
+            try:
+                response = self._request(f"{url}/generate", payload)
+                if response.get("error") == "unknown_image":
+                    response = self._request(f"{url}/generate", dict(payload, image=encode_image(pil_image)))
+                if "error" in response:
+                    raise gr.Error(f"Worker {url}: {response['error']}")
+            except (OSError, ValueError) as e:
+                print(f"Worker {url} failed ({e}); trying another replica")
+                with self._lock:
+                    self.workers[url].update(up=False, ready=False)
+                continue
+            finally:
+                with self._lock:
+                    self.workers[url]["inflight"] -= 1
+            if trace is not None:
+                remote = StageTrace()
+                remote.stages = {stage: tuple(v) for stage, v in response.get("stages", {}).items()}
+                remote.counters = response.get("counters", {})
+                trace.merge(remote)
+            return [decode_image(data) for data in response["images"]]
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return any(w["ready"] for w in self.workers.values())
+
+    def status_text(self) -> str:
+        with self._lock:
+            ready = sum(w["ready"] for w in self.workers.values())
+            up = sum(w["up"] for w in self.workers.values())
+        if ready:
+            return f"✅ {ready}/{len(self.workers)} worker replicas ready"
+        if up:
+            return f"⏳ {up}/{len(self.workers)} worker replicas up, model loading..."
+        return f"⏳ Waiting for worker replicas ({len(self.workers)} configured)"
+
+    def metrics(self) -> list:
+        lines = [
+            "# HELP qie_worker_up Whether a worker replica answers health checks (1) and has its model loaded (ready).",
+            "# TYPE qie_worker_up gauge",
+        ]
+        with self._lock:
+            for url, w in self.workers.items():
+                lines.append(f'qie_worker_up{{worker="{url}",ready="{int(w["ready"])}"}} {int(w["up"])}')
+            lines += ["# HELP qie_worker_inflight Requests in flight per worker replica.", "# TYPE qie_worker_inflight gauge"]
+            for url, w in self.workers.items():
+                lines.append(f'qie_worker_inflight{{worker="{url}"}} {w["inflight"] + w["pending"]}')
+        return lines
+
+
+worker_pool = WorkerPool(WORKER_URLS) if WORKER_URLS else None
+
+
+def model_status_text() -> str:
+    return worker_pool.status_text() if worker_pool is not None else pipeline_factory.status_text()
+
+
+def generation_concurrency() -> int:
+    """
+    Generation events the UI runs at once. In-process, concurrent clicks reach
+    the scheduler so they can be batched; without it PIPELINE_LOCK serializes
+    runs, but a second slot lets a new click cancel the running one. With a
+    worker pool, enough to keep every replica busy.
+    """
+    if worker_pool is not None:
+        return worker_pool.concurrency()
+    return SCHEDULER_MAX_BATCH if SCHEDULER_ENABLED else 2
+
+
+# --- Request Scheduler ---
+
+# Coalesce concurrent generations into batched pipeline calls (QIE_SCHEDULER=1 enables). Off by
+# default: only jobs for the same upload can share a call, so a lone user would just pay the wait.
+SCHEDULER_ENABLED = os.environ.get("QIE_SCHEDULER", "0") == "1"
+SCHEDULER_MAX_BATCH = int(os.environ.get("QIE_SCHEDULER_MAX_BATCH", 4))
+SCHEDULER_MAX_WAIT_MS = float(os.environ.get("QIE_SCHEDULER_MAX_WAIT_MS", 50))
+
+
+@dataclass(eq=False)
+class GenerationJob:
+    pil_image: Image.Image
+    image_key: str
+    prompt: str
+    seed: int
+    guidance_scale: float
+    num_inference_steps: int
+    height: int
+    width: int
+    owner: str
+    batch_limit: int = 0
+    trace: StageTrace = None
+    on_preview: callable = None
+    cancel_event: threading.Event = None
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def group_key(self):
+        # The pipeline conditions a whole batch on one image list, so only jobs
+        # for the same upload can share a call
+        return (self.image_key, self.height, self.width, self.num_inference_steps, self.guidance_scale)
+
+
+class GenerationScheduler:
+    """
+    Single pipeline thread that batches compatible jobs.
+
+    Jobs are grouped by (image, size, steps, guidance). The group holding the
+    oldest job is served next; it is dispatched once it is full or its oldest
+    job has waited max_wait_ms, or at once if other groups are queued (their
+    jobs cannot join it, so waiting would only delay them). Within a batch, owners (UI sessions) are taken
+    round-robin so one caller submitting many views cannot starve the others.
+    """
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._cond = threading.Condition()
+        self._groups = OrderedDict()
+        self._thread = None
+
+    def submit(self, job: GenerationJob) -> Future:
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+                self._thread.start()
+            self._groups.setdefault(job.group_key, []).append(job)
+            self._cond.notify_all()
+        return job.future
+
+    def pending(self) -> int:
+        with self._cond:
+            return sum(len(jobs) for jobs in self._groups.values())
+
+    def _batch_limit(self, job: GenerationJob) -> int:
+        if job.batch_limit:
+            return job.batch_limit
+        return min(self.max_batch_size, multi_view_batch_size(job.height, job.width))
+
+    def _next_batch(self) -> list:
+        with self._cond:
+            while not self._groups:
+                self._cond.wait()
+            group_key = min(self._groups, key=lambda k: self._groups[k][0].enqueued_at)
+            jobs = self._groups[group_key]
+            limit = self._batch_limit(jobs[0])
+            deadline = jobs[0].enqueued_at + self.max_wait
+            while len(jobs) < limit and len(self._groups) == 1 and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            batch = self._take_fair(jobs, limit)
+            if not jobs:
+                del self._groups[group_key]
+            return batch
+
+    @staticmethod
+    def _take_fair(jobs: list, limit: int) -> list:
+        """Remove up to `limit` jobs from `jobs`, one per owner per round, oldest first."""
+        by_owner = OrderedDict()
+        for job in jobs:
+            by_owner.setdefault(job.owner, []).append(job)
+        batch = []
+        while len(batch) < limit and by_owner:
+            for owner in list(by_owner):
+                batch.append(by_owner[owner].pop(0))
+                if not by_owner[owner]:
+                    del by_owner[owner]
+                if len(batch) == limit:
+                    break
+        for job in batch:
+            jobs.remove(job)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = []
+            for job in self._next_batch():
+                if job.cancel_event is not None and job.cancel_event.is_set():
+                    job.future.set_exception(GenerationCancelled())
+                else:
+                    batch.append(job)
+            if not batch:
+                continue
+            first = batch[0]
+            batch_trace = StageTrace()
+            try:
+                images = run_pipeline(
+                    first.pil_image, first.image_key,
+                    [job.prompt for job in batch], [job.seed for job in batch],
+                    first.guidance_scale, first.num_inference_steps, first.height, first.width,
+                    trace=batch_trace, on_preview=[job.on_preview for job in batch],
+                    cancel_events=[job.cancel_event for job in batch],
+                )
+            except Exception as e:
+                for job in batch:
+                    job.future.set_exception(e)
+                continue
+            for job, generated in zip(batch, images):
+                if job.trace is not None:
+                    job.trace.merge(batch_trace)
+                job.future.set_result(generated)
+
+
+generation_scheduler = GenerationScheduler(SCHEDULER_MAX_BATCH, SCHEDULER_MAX_WAIT_MS) if SCHEDULER_ENABLED else None
+
+
+def denoise_views(
+    pil_image, image_key, prompts, seed, guidance_scale, num_inference_steps, height, width,
+    owner=None, batch_limit=0, trace=None, on_preview=None, cancel_event=None,
+) -> list:
+    """
+    Denoise `prompts` on the worker pool when configured, else through the
+    scheduler when enabled, else with a direct pipeline call. User
+    generations preempt speculative pre-rendering. Remote generations are
+    cancelled only before dispatch and stream no previews.
+    """
+    with speculative_renderer.user_activity(owner):
+        if worker_pool is not None:
+            if cancel_event is not None and cancel_event.is_set():
+                raise GenerationCancelled()
+            return worker_pool.generate(
+                pil_image, image_key, prompts, seed, guidance_scale, num_inference_steps, height, width,
+                owner, batch_limit, trace,
+            )
+        if generation_scheduler is None:
+            return run_pipeline(
+                pil_image, image_key, prompts, [seed] * len(prompts), guidance_scale, num_inference_steps, height, width,
+                trace=trace, on_preview=[on_preview] * len(prompts), cancel_events=[cancel_event] * len(prompts),
+            )
+        futures = [
+            generation_scheduler.submit(GenerationJob(
+                pil_image, image_key, prompt, seed, guidance_scale, num_inference_steps, height, width,
+                owner or "anonymous", batch_limit, trace, on_preview, cancel_event,
+            ))
+            for prompt in prompts
+        ]
+        return [f.result() for f in futures]
+
+
+def generate_views(
+    pil_image: Image.Image,
+    prompts: list,
+    seed: int,
+    guidance_scale: float,
+    num_inference_steps: int,
+    height: int,
+    width: int,
+    cache_results: bool = False,
+    owner: str = None,
+    batch_limit: int = 0,
+    trace: StageTrace = None,
+    on_preview=None,
+    cancel_event: threading.Event = None,
+    bucketed: bool = False,
+    lookup_only: bool = False,
+) -> list:
+    """
+    Return one image per prompt. With cache_results, views already in the
+    result store are served from disk and only the misses are denoised (as one
+    batch); fresh results are written back to the store. lookup_only (which
+    implies cache_results) never denoises: it returns None unless every view
+    is stored.
+
+    `owner` identifies the caller (UI session) for scheduler fairness;
+    `batch_limit` overrides the scheduler's batch size for these views;
+    stage timings are collected into `trace` when given; `on_preview` is
+    called with per-step previews of the views that are actually denoised;
+    setting `cancel_event` abandons the views with GenerationCancelled.
+    With resolution buckets enabled, views render at the nearest bucket and
+    are resized back to the requested size.
+    """
+    if resolution_buckets is not None and not bucketed:
+        start = time.perf_counter()
+        pil_image, height, width, requested = resolution_buckets.snap(pil_image, height, width, count=not lookup_only)
+        if trace is not None:
+            trace.add("bucket_resize", time.perf_counter() - start)
+        images = generate_views(
+            pil_image, prompts, seed, guidance_scale, num_inference_steps, height, width,
+            cache_results, owner, batch_limit, trace, on_preview, cancel_event, bucketed=True, lookup_only=lookup_only,
+        )
+        return None if images is None else [restore_size(image, requested) for image in images]
+
+    image_key = image_hash(pil_image)
+    if not cache_results and not lookup_only:
+        return denoise_views(
+            pil_image, image_key, prompts, seed, guidance_scale, num_inference_steps, height, width,
+            owner, batch_limit, trace, on_preview, cancel_event,
+        )
+
+    keys = [result_key(image_key, p, seed, guidance_scale, num_inference_steps, height, width) for p in prompts]
+    start = time.perf_counter()
+    results = [result_store.get(k) for k in keys]
+    if trace is not None:
+        trace.add("result_cache", time.perf_counter() - start)
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing and lookup_only:
+        return None
+    if missing:
+        images = denoise_views(
+            pil_image, image_key, [prompts[i] for i in missing], seed, guidance_scale, num_inference_steps, height, width,
+            owner, batch_limit, trace, on_preview, cancel_event,
+        )
+        for i, generated in zip(missing, images):
+            results[i] = generated
+            result_store.put(keys[i], generated)
+    return results
+
+
+def result_keys(pil_image: Image.Image, prompts: list, seed: int, guidance_scale: float, num_inference_steps: int, height: int, width: int) -> list:
+    """Result store keys generate_views(cache_results=True) uses for these views, after resolution bucketing."""
+    if resolution_buckets is not None:
+        pil_image, height, width, _ = resolution_buckets.snap(pil_image, height, width, count=False)
+    image_key = image_hash(pil_image)
+    return [result_key(image_key, p, seed, guidance_scale, num_inference_steps, height, width) for p in prompts]
+
+
+# Runs single-view generations so their previews can stream back while they denoise
+render_executor = ThreadPoolExecutor(thread_name_prefix="render")
+
+
+# @spaces.GPU  # ローカル実行用: Hugging Face Spaces上でのGPU動的割り当てデコレーター（ローカルでは不要）
+def infer_camera_edit(
+    image: Image.Image,
+    azimuth: float = 0.0,
+    elevation: float = 0.0,
+    distance: float = 1.0,
+    seed: int = 0,
+    randomize_seed: bool = True,
+    guidance_scale: float = 1.0,
+    num_inference_steps: int = 4,
+    height: int = 1024,
+    width: int = 1024,
+    request: gr.Request = None,
+):
+    """
+    Edit the camera angle of an image using Qwen Image Edit 2511 with multi-angles LoRA.
+
+    Yields (image, seed, prompt, timings): a cheap latent preview after each
+    denoising step, then the fully decoded result with the stage timings.
+    Runs as a tracked job: a newer request from the same session supersedes
+    it, in which case it ends without changing the outputs, and a client
+    disconnect cancels it. Views already in
+    the result store are returned without waiting out the debounce.
+    """
+    progress = gr.Progress(track_tqdm=True)
+    
+    prompt = build_camera_prompt(azimuth, elevation, distance)
+    print(f"Generated Prompt: {prompt}")
+
+    if randomize_seed:
+        seed = random.randint(0, MAX_SEED)
+
+    if image is None:
+        raise gr.Error("Please upload an image first.")
+
+    pil_image = to_pil_rgb(image)
+
+    owner = session_id(request)
+    job = job_manager.start(owner)
+    unchanged = (gr.update(), gr.update(), gr.update(), gr.update())
+    trace = StageTrace()
+    start = time.perf_counter()
+
+    try:
+        # Stored views (repeats, pre-rendered neighbours) return at once; only views that denoise are debounced
+        cached = None if randomize_seed else generate_views(
+            pil_image, [prompt], seed, guidance_scale, num_inference_steps, height, width, trace=trace, lookup_only=True,
+        )
+        if cached is not None:
+            result = cached[0]
+        else:
+            if not job_manager.wait_debounce(job):
+                job_manager.finish(job, "cancelled")
+                yield unchanged
+                return
+
+            previews = queue.Queue()
+            future = render_executor.submit(
+                generate_views, pil_image, [prompt], seed, guidance_scale, num_inference_steps, height, width,
+                cache_results=not randomize_seed, owner=owner, trace=trace,
+                on_preview=previews.put if PREVIEW_SIZE else None, cancel_event=job.cancel_event,
+            )
+            try:
+                while not future.done():
+                    try:
+                        preview = previews.get(timeout=0.05)
+                    except queue.Empty:
+                        continue
+                    # Only the newest preview is worth sending if steps outpace the UI
+                    while not previews.empty():
+                        preview = previews.get_nowait()
+                    if not job.cancel_event.is_set():
+                        yield preview, seed, prompt, gr.update()
+                result = future.result()[0]
+            except GenerationCancelled:
+                job_manager.finish(job, "cancelled")
+                yield unchanged
+                return
+            except Exception:
+                job_manager.finish(job, "error")
+                raise
+        job_manager.finish(job, "done")
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe("request", elapsed)
+        trace.add("request", elapsed)
+        if not randomize_seed:
+            # The next click is most likely an adjacent pose; render those while the GPU would sit idle
+            speculative_renderer.enqueue_neighbours(
+                owner, pil_image, azimuth, elevation, distance, seed, guidance_scale, num_inference_steps, height, width,
+            )
+
+        yield result, seed, prompt, dict(trace.summary(), job_id=job.id)
+    finally:
+        if job.finished is None:
+            # The client disconnected at a yield (GeneratorExit): stop the render and close the job
+            job.cancel_event.set()
+            job_manager.finish(job, "cancelled")
+
+
+def multi_view_batch_size(height: int, width: int, pixel_budget: int = None) -> int:
+    """How many views of the given size fit in one denoising batch under the pixel budget."""
+    pixel_budget = MULTI_VIEW_PIXEL_BUDGET if pixel_budget is None else pixel_budget
+    pixels = (height or 1024) * (width or 1024)
+    return max(1, pixel_budget // pixels)
+
+
+def infer_multi_view(
+    image: Image.Image,
+    poses: list,
+    seed: int = 0,
+    randomize_seed: bool = True,
+    guidance_scale: float = 1.0,
+    num_inference_steps: int = 4,
+    height: int = 1024,
+    width: int = 1024,
+    max_batch_size: int = 0,
+    owner: str = None,
+):
+    """
+    Render many camera poses of one image.
+
+    Args:
+        poses: List of (azimuth, elevation, distance) tuples
+        max_batch_size: Views per pipeline call; 0 derives it from MULTI_VIEW_PIXEL_BUDGET
+        owner: Caller identity used for scheduler fairness
+
+    Returns:
+        ([(image, prompt), ...] in pose order, seed)
+    """
+    if image is None:
+        raise gr.Error("Please upload an image first.")
+    if not poses:
+        raise gr.Error("Select at least one camera pose.")
+
+    cache_results = not randomize_seed
+    if randomize_seed:
+        seed = random.randint(0, MAX_SEED)
+
+    pil_image = to_pil_rgb(image)
+    prompts = [build_camera_prompt(az, el, dist) for az, el, dist in poses]
+    batch_size = int(max_batch_size) or multi_view_batch_size(height, width)
+    print(f"Multi-view: {len(prompts)} poses in batches of {batch_size}")
+
+    chunks = [prompts[start:start + batch_size] for start in range(0, len(prompts), batch_size)]
+
+    def render(chunk):
+        return generate_views(
+            pil_image, chunk, seed, guidance_scale, num_inference_steps, height, width,
+            cache_results=cache_results, owner=owner, batch_limit=batch_size,
+        )
+
+    # Worker replicas render chunks in parallel; in-process they would only queue on PIPELINE_LOCK
+    rendered = worker_pool.executor.map(render, chunks) if worker_pool is not None else map(render, chunks)
+    results = []
+    for chunk, images in zip(chunks, rendered):
+        results.extend(zip(images, chunk))
+    return results, seed
+
+
+def infer_multi_view_grid(
+    image: Image.Image,
+    azimuths: list,
+    elevations: list,
+    distance: float = 1.0,
+    seed: int = 0,
+    randomize_seed: bool = True,
+    guidance_scale: float = 1.0,
+    num_inference_steps: int = 4,
+    height: int = 1024,
+    width: int = 1024,
+    max_batch_size: int = 0,
+    request: gr.Request = None,
+):
+    """Render the azimuth × elevation grid selected in the Multi-View tab."""
+    progress = gr.Progress(track_tqdm=True)
+    poses = [(float(az), float(el), distance) for el in elevations for az in azimuths]
+    results, seed = infer_multi_view(
+        image, poses, seed, randomize_seed, guidance_scale, num_inference_steps, height, width, max_batch_size,
+        owner=session_id(request),
+    )
+    return results, seed
+
+
+# --- Speculative Pre-rendering ---
+
+# Neighbouring views pre-rendered into the result store after each fixed-seed single view
+# (0 disables; unset means 4 on CUDA and 0 in CPU mode, decided when used since --device may change it)
+SPECULATIVE_VIEWS = int(os.environ["QIE_SPECULATIVE_VIEWS"]) if os.environ.get("QIE_SPECULATIVE_VIEWS") else None
+# Quiet time after the last user generation before speculative work starts
+SPECULATIVE_IDLE_MS = float(os.environ.get("QIE_SPECULATIVE_IDLE_MS", 1000))
+SPECULATIVE_OWNER = "speculative"
+
+
+def neighbour_poses(azimuth: float, elevation: float, distance: float) -> list:
+    """Poses next to the given one, most likely next first: ±45° azimuth, one elevation step, one distance step."""
+    azimuths, elevations, distances = sorted(AZIMUTH_MAP), sorted(ELEVATION_MAP), sorted(DISTANCE_MAP)
+    az = snap_to_nearest(azimuth, azimuths)
+    el = snap_to_nearest(elevation, elevations)
+    dist = snap_to_nearest(distance, distances)
+    i, j, k = azimuths.index(az), elevations.index(el), distances.index(dist)
+    poses = [(azimuths[(i + 1) % len(azimuths)], el, dist), (azimuths[i - 1], el, dist)]
+    poses += [(az, elevations[n], dist) for n in (j + 1, j - 1) if 0 <= n < len(elevations)]
+    poses += [(az, el, distances[n]) for n in (k - 1, k + 1) if 0 <= n < len(distances)]
+    return poses
+
+
+@dataclass(order=True)
+class SpeculativeTask:
+    priority: int
+    seq: int
+    owner: str = field(compare=False)
+    key: str = field(compare=False)
+    args: tuple = field(compare=False)  # generate_views(pil_image, [prompt], seed, guidance, steps, height, width)
+
+
+class SpeculativeRenderer:
+    """
+    Idle-time pre-rendering of likely next views into the result store.
+
+    Tasks wait in a priority queue and run one at a time on a worker thread,
+    only once no user generation has been active for idle_ms. A user
+    generation starting meanwhile cancels the speculative one at its next
+    denoising step, and the task goes back into the queue. A session's new
+    request replaces its queued guesses. max_views None picks the default for
+    the current execution device.
+    """
+    def __init__(self, max_views: int, idle_ms: float):
+        self._max_views = max_views
+        self.idle = idle_ms / 1000.0
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = 0
+        self._latest = {}
+        self._active_users = 0
+        self._last_user = 0.0
+        self._current = None
+        self._thread = None
+        self.rendered = 0
+        self.preempted = 0
+        self.skipped = 0
+
+    @property
+    def max_views(self) -> int:
+        if self._max_views is not None:
+            return self._max_views
+        return 4 if device == "cuda" else 0
+
+    @contextmanager
+    def user_activity(self, owner: str = None):
+        """Mark a user generation: speculative work stops and waits until it is over."""
+        if owner == SPECULATIVE_OWNER:
+            yield
+            return
+        with self._cond:
+            self._active_users += 1
+            if self._current is not None:
+                self._current.set()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active_users -= 1
+                self._last_user = time.monotonic()
+                self._cond.notify_all()
+
+    def enqueue_neighbours(self, owner, pil_image, azimuth, elevation, distance, seed, guidance_scale, num_inference_steps, height, width):
+        if not self.max_views:
+            return
+        prompts = [build_camera_prompt(*pose) for pose in neighbour_poses(azimuth, elevation, distance)[:self.max_views]]
+        keys = result_keys(pil_image, prompts, seed, guidance_scale, num_inference_steps, height, width)
+        with self._cond:
+            first_seq = self._seq
+            tasks = []
+            for rank, (prompt, key) in enumerate(zip(prompts, keys)):
+                args = (pil_image, [prompt], seed, guidance_scale, num_inference_steps, height, width)
+                tasks.append(SpeculativeTask(rank, self._seq, owner, key, args))
+                self._seq += 1
+            # The session moved on, so its older guesses are stale
+            self._latest[owner] = first_seq
+            self._queue = [t for t in self._queue if t.owner != owner] + tasks
+            heapq.heapify(self._queue)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="speculative-renderer", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def _next_task(self):
+        with self._cond:
+            while True:
+                if not self._queue or self._active_users:
+                    self._cond.wait()
+                    continue
+                wait = self._last_user + self.idle - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                self._current = threading.Event()
+                return heapq.heappop(self._queue), self._current
+
+    def _run(self):
+        while True:
+            task, cancel_event = self._next_task()
+            try:
+                if result_store.contains(task.key):
+                    self.skipped += 1
+                    continue
+                generate_views(*task.args, cache_results=True, owner=SPECULATIVE_OWNER, cancel_event=cancel_event)
+                self.rendered += 1
+            except GenerationCancelled:
+                self.preempted += 1
+                with self._cond:
+                    if task.seq >= self._latest.get(task.owner, 0):
+                        heapq.heappush(self._queue, task)
+            except Exception as e:
+                print(f"Speculative render failed: {e}")
+            finally:
+                with self._cond:
+                    self._current = None
+
+
+speculative_renderer = SpeculativeRenderer(SPECULATIVE_VIEWS, SPECULATIVE_IDLE_MS)
+
+
+# --- Orbit / Turntable ---
+
+def orbit_path(elevation: float = 0.0, distance: float = 1.0, clockwise: bool = True) -> list:
+    """Poses for a full azimuth sweep over AZIMUTH_MAP at a fixed elevation and distance."""
+    azimuths = sorted(AZIMUTH_MAP)
+    if not clockwise:
+        azimuths = azimuths[:1] + azimuths[:0:-1]
+    return [(az, elevation, distance) for az in azimuths]
+
+
+def resolve_output_size(pipe, pil_image: Image.Image, height: int, width: int):
+    """The (height, width) the pipeline will actually render (mirrors QwenImageEditPlusPipeline.__call__)."""
+    if not height or not width:
+        calculated_width, calculated_height = calculate_dimensions(1024 * 1024, pil_image.width / pil_image.height)
+        height = height or calculated_height
+        width = width or calculated_width
+    multiple_of = pipe.vae_scale_factor * 2
+    return height // multiple_of * multiple_of, width // multiple_of * multiple_of
+
+
+def decode_latents(pipe, latents: torch.Tensor, height: int, width: int) -> list:
+    """Decode packed latents from output_type="latent" to PIL images, as the pipeline would."""
+    latents = pipe._unpack_latents(latents, height, width, pipe.vae_scale_factor)
+    latents = latents.to(pipe.vae.dtype)
+    z_dim = pipe.vae.config.z_dim
+    latents_mean = torch.tensor(pipe.vae.config.latents_mean).view(1, z_dim, 1, 1, 1).to(latents.device, latents.dtype)
+    latents_std = torch.tensor(pipe.vae.config.latents_std).view(1, z_dim, 1, 1, 1).to(latents.device, latents.dtype)
+    latents = latents * latents_std + latents_mean
+    image = pipe.vae.decode(latents, return_dict=False)[0][:, :, 0]
+    return pipe.image_processor.postprocess(image, output_type="pil")
+
 
+def warm_start_sigmas(num_inference_steps: int, strength: float) -> list:
+    """Tail of the default sigma schedule covering `strength` of it (at least one step)."""
+    full = np.linspace(1.0, 1 / num_inference_steps, num_inference_steps)
+    steps = max(1, round(num_inference_steps * strength))
+    return full[num_inference_steps - steps:].tolist()
 
-def snap_to_nearest(value, options):
-    """Snap a value to the nearest option in a list."""
-    return min(options, key=lambda x: abs(x - value))
+
+def warm_start_latents(pipe, previous: torch.Tensor, sigmas: list, generator: torch.Generator) -> torch.Tensor:
+    """
+    Re-noise a neighbouring view's packed latents to the first sigma of
+    `sigmas` (after the scheduler's resolution-dependent shift), following
+    the flow-matching interpolation x_t = (1 - t) * x_0 + t * noise.
+    """
+    config = pipe.scheduler.config
+    mu = calculate_shift(
+        previous.shape[1],
+        config.get("base_image_seq_len", 256),
+        config.get("max_image_seq_len", 4096),
+        config.get("base_shift", 0.5),
+        config.get("max_shift", 1.15),
+    )
+    pipe.scheduler.set_timesteps(sigmas=sigmas, mu=mu, device=previous.device)
+    sigma = pipe.scheduler.sigmas[0].to(previous.device, previous.dtype)
+    noise = torch.randn(previous.shape, generator=generator, device=generator.device, dtype=previous.dtype)
+    return (1 - sigma) * previous + sigma * noise.to(previous.device)
 
 
-def build_camera_prompt(azimuth: float, elevation: float, distance: float) -> str:
+def generate_orbit(
+    pil_image: Image.Image,
+    poses: list,
+    seed: int,
+    guidance_scale: float,
+    num_inference_steps: int,
+    height: int,
+    width: int,
+    warm_start_strength: float = 0.0,
+    trace: StageTrace = None,
+):
     """
-    Build a camera prompt from azimuth, elevation, and distance values.
-    
-    Args:
-        azimuth: Horizontal rotation in degrees (0-360)
-        elevation: Vertical angle in degrees (-30 to 60)
-        distance: Distance factor (0.6 to 1.8)
-    
-    Returns:
-        Formatted prompt string for the LoRA
+    Yield (prompt, frame) for each pose in order, as soon as each frame is done.
+
+    With warm_start_strength in (0, 1), every frame after the first starts from
+    the previous frame's latents re-noised to that strength and runs only that
+    fraction of the steps. Frames depend on each other, so they bypass the
+    request scheduler and hold PIPELINE_LOCK per frame.
+
+    With a worker pool, frames are rendered independently on the replicas
+    (they return images, not latents, so there is no warm start).
     """
-    # Snap to nearest valid values
-    azimuth_snapped = snap_to_nearest(azimuth, list(AZIMUTH_MAP.keys()))
-    elevation_snapped = snap_to_nearest(elevation, list(ELEVATION_MAP.keys()))
-    distance_snapped = snap_to_nearest(distance, list(DISTANCE_MAP.keys()))
-    
-    azimuth_name = AZIMUTH_MAP[azimuth_snapped]
-    elevation_name = ELEVATION_MAP[elevation_snapped]
-    distance_name = DISTANCE_MAP[distance_snapped]
-    
-    return f"<sks> {azimuth_name} {elevation_name} {distance_name}"
+    if worker_pool is not None:
+        for pose in poses:
+            prompt = build_camera_prompt(*pose)
+            yield prompt, generate_views(pil_image, [prompt], seed, guidance_scale, num_inference_steps, height, width, trace=trace)[0]
+        return
+    requested = None
+    if resolution_buckets is not None:
+        pil_image, height, width, requested = resolution_buckets.snap(pil_image, height, width)
+    pipe = get_pipe()
+    image_key = image_hash(pil_image)
+    height, width = resolve_output_size(pipe, pil_image, height, width)
+    warm = 0 < warm_start_strength < 1
+    previous = None
+    for pose in poses:
+        prompt = build_camera_prompt(*pose)
+        with speculative_renderer.user_activity(), PIPELINE_LOCK, torch.inference_mode():
+            if previous is None or not warm:
+                latents = run_pipeline(
+                    pil_image, image_key, [prompt], [seed], guidance_scale, num_inference_steps, height, width,
+                    trace=trace, output_type="latent",
+                )
+            else:
+                sigmas = warm_start_sigmas(num_inference_steps, warm_start_strength)
+                generator = torch.Generator(device=device).manual_seed(seed)
+                latents = run_pipeline(
+                    pil_image, image_key, [prompt], [seed], guidance_scale, len(sigmas), height, width,
+                    trace=trace, latents=warm_start_latents(pipe, previous, sigmas, generator),
+                    sigmas=sigmas, output_type="latent",
+                )
+            frame = decode_latents(pipe, latents, height, width)[0]
+        previous = latents
+        yield prompt, restore_size(frame, requested) if requested else frame
 
 
-# @spaces.GPU  # ローカル実行用: Hugging Face Spaces上でのGPU動的割り当てデコレーター（ローカルでは不要）
-def infer_camera_edit(
+def save_animation(frames: list, path: str, fmt: str, fps: float):
+    """Write frames as an animated GIF/WebP (Pillow) or MP4 (needs imageio[ffmpeg])."""
+    if fmt == "mp4":
+        try:
+            import imageio.v2 as imageio
+        except ImportError:
+            raise gr.Error("MP4 export needs imageio[ffmpeg] (pip install imageio[ffmpeg])")
+        with imageio.get_writer(path, fps=fps, codec="libx264", quality=8) as writer:
+            for frame in frames:
+                writer.append_data(np.asarray(frame))
+        return
+    duration = int(1000 / fps)
+    frames[0].save(
+        path, format=fmt.upper(), save_all=True, append_images=frames[1:], duration=duration, loop=0,
+        **({"quality": 90} if fmt == "webp" else {}),
+    )
+
+
+def infer_orbit(
     image: Image.Image,
-    azimuth: float = 0.0,
     elevation: float = 0.0,
     distance: float = 1.0,
+    clockwise: bool = True,
     seed: int = 0,
     randomize_seed: bool = True,
     guidance_scale: float = 1.0,
     num_inference_steps: int = 4,
     height: int = 1024,
     width: int = 1024,
+    warm_start_strength: float = 0.7,
+    fmt: str = "webp",
+    fps: float = 4.0,
 ):
     """
-    Edit the camera angle of an image using Qwen Image Edit 2511 with multi-angles LoRA.
+    Render a 360° turntable, streaming (frames so far, animation so far, seed)
+    after every frame. warm_start_strength of 0 or 1 renders every frame from
+    full noise.
     """
     progress = gr.Progress(track_tqdm=True)
-    
-    prompt = build_camera_prompt(azimuth, elevation, distance)
-    print(f"Generated Prompt: {prompt}")
-
-    if randomize_seed:
-        seed = random.randint(0, MAX_SEED)
-    generator = torch.Generator(device=device).manual_seed(seed)
-
     if image is None:
         raise gr.Error("Please upload an image first.")
+    if randomize_seed:
+        seed = random.randint(0, MAX_SEED)
 
-    pil_image = image.convert("RGB") if isinstance(image, Image.Image) else Image.open(image).convert("RGB")
-
-    result = pipe(
-        image=[pil_image],
-        prompt=prompt,
-        height=height if height != 0 else None,
-        width=width if width != 0 else None,
-        num_inference_steps=num_inference_steps,
-        generator=generator,
-        guidance_scale=guidance_scale,
-        num_images_per_prompt=1,
-    ).images[0]
-
-    return result, seed, prompt
+    pil_image = to_pil_rgb(image)
+    out_path = os.path.join(tempfile.mkdtemp(prefix="qie-orbit-"), f"orbit.{fmt}")
+    gallery, frames = [], []
+    for prompt, frame in generate_orbit(
+        pil_image, orbit_path(elevation, distance, clockwise), seed, guidance_scale, num_inference_steps,
+        height, width, warm_start_strength,
+    ):
+        gallery.append((frame, prompt))
+        frames.append(frame)
+        save_animation(frames, out_path, fmt, fps)
+        yield gallery, out_path, seed
 
 
 def update_dimensions_on_upload(image):
@@ -206,52 +3087,63 @@ class CameraControl3D(gr.HTML):
         (() => {
             const wrapper = element.querySelector('#camera-control-wrapper');
             const promptOverlay = element.querySelector('#prompt-overlay');
-            
+
             // Wait for THREE to load
             const initScene = () => {
                 if (typeof THREE === 'undefined') {
                     setTimeout(initScene, 100);
                     return;
                 }
-                
+
                 // Scene setup
                 const scene = new THREE.Scene();
                 scene.background = new THREE.Color(0x1a1a1a);
-                
+
                 const camera = new THREE.PerspectiveCamera(50, wrapper.clientWidth / wrapper.clientHeight, 0.1, 1000);
                 camera.position.set(4.5, 3, 4.5);
                 camera.lookAt(0, 0.75, 0);
-                
+
                 const renderer = new THREE.WebGLRenderer({ antialias: true });
                 renderer.setSize(wrapper.clientWidth, wrapper.clientHeight);
                 renderer.setPixelRatio(Math.min(window.devicePixelRatio, 2));
                 wrapper.insertBefore(renderer.domElement, promptOverlay);
-                
+
+                // Render on demand: changes request a single frame instead of a continuous loop
+                let renderPending = false;
+                function requestRender() {
+                    if (renderPending) return;
+                    renderPending = true;
+                    requestAnimationFrame(() => {
+                        renderPending = false;
+                        renderer.render(scene, camera);
+                    });
+                }
+
                 // Lighting
                 scene.add(new THREE.AmbientLight(0xffffff, 0.6));
                 const dirLight = new THREE.DirectionalLight(0xffffff, 0.6);
                 dirLight.position.set(5, 10, 5);
                 scene.add(dirLight);
-                
+
                 // Grid
                 scene.add(new THREE.GridHelper(8, 16, 0x333333, 0x222222));
-                
+
                 // Constants - reduced distances for tighter framing
                 const CENTER = new THREE.Vector3(0, 0.75, 0);
                 const BASE_DISTANCE = 1.6;
                 const AZIMUTH_RADIUS = 2.4;
                 const ELEVATION_RADIUS = 1.8;
-                
+
                 // State
                 let azimuthAngle = props.value?.azimuth || 0;
                 let elevationAngle = props.value?.elevation || 0;
                 let distanceFactor = props.value?.distance || 1.0;
-                
+
                 // Mappings - reduced wide shot multiplier
                 const azimuthSteps = [0, 45, 90, 135, 180, 225, 270, 315];
                 const elevationSteps = [-30, 0, 30, 60];
                 const distanceSteps = [0.6, 1.0, 1.4];
-                
+
                 const azimuthNames = {
                     0: 'front view', 45: 'front-right quarter view', 90: 'right side view',
                     135: 'back-right quarter view', 180: 'back view', 225: 'back-left quarter view',
@@ -259,11 +3151,11 @@ class CameraControl3D(gr.HTML):
                 };
                 const elevationNames = { '-30': 'low-angle shot', '0': 'eye-level shot', '30': 'elevated shot', '60': 'high-angle shot' };
                 const distanceNames = { '0.6': 'close-up', '1': 'medium shot', '1.4': 'wide shot' };
-                
+
                 function snapToNearest(value, steps) {
                     return steps.reduce((prev, curr) => Math.abs(curr - value) < Math.abs(prev - value) ? curr : prev);
                 }
-                
+
                 // Create placeholder texture (smiley face)
                 function createPlaceholderTexture() {
                     const canvas = document.createElement('canvas');
@@ -288,81 +3180,92 @@ class CameraControl3D(gr.HTML):
                     ctx.stroke();
                     return new THREE.CanvasTexture(canvas);
                 }
-                
-                // Target image plane
-                let currentTexture = createPlaceholderTexture();
-                const planeMaterial = new THREE.MeshBasicMaterial({ map: currentTexture, side: THREE.DoubleSide });
-                let targetPlane = new THREE.Mesh(new THREE.PlaneGeometry(1.2, 1.2), planeMaterial);
+
+                // Target image plane: one unit geometry, scaled to the image's aspect ratio
+                const placeholderTexture = createPlaceholderTexture();
+                const planeMaterial = new THREE.MeshBasicMaterial({ map: placeholderTexture, side: THREE.DoubleSide });
+                const targetPlane = new THREE.Mesh(new THREE.PlaneGeometry(1, 1), planeMaterial);
                 targetPlane.position.copy(CENTER);
+                targetPlane.scale.set(1.2, 1.2, 1);
                 scene.add(targetPlane);
-                
+
+                const textureLoader = new THREE.TextureLoader();
+                textureLoader.crossOrigin = 'anonymous';
+                let requestedUrl = null;
+
+                // Swap the plane's texture, releasing the previous image's GPU memory
+                function setPlaneTexture(texture) {
+                    const previous = planeMaterial.map;
+                    planeMaterial.map = texture;
+                    planeMaterial.needsUpdate = true;
+                    if (previous && previous !== placeholderTexture && previous !== texture) {
+                        previous.dispose();
+                    }
+                }
+
                 // Function to update texture from image URL
+                // Server file URLs are relative to the app root, which moves under a root_path/proxy
+                function appUrl(url) {
+                    const root = (window.gradio_config && window.gradio_config.root) || document.baseURI;
+                    return new URL(url, root.endsWith('/') ? root : root + '/').href;
+                }
+
                 function updateTextureFromUrl(url) {
+                    requestedUrl = url || null;
                     if (!url) {
-                        // Reset to placeholder
-                        planeMaterial.map = createPlaceholderTexture();
-                        planeMaterial.needsUpdate = true;
-                        // Reset plane to square
-                        scene.remove(targetPlane);
-                        targetPlane = new THREE.Mesh(new THREE.PlaneGeometry(1.2, 1.2), planeMaterial);
-                        targetPlane.position.copy(CENTER);
-                        scene.add(targetPlane);
+                        // Reset to placeholder and a square plane
+                        setPlaneTexture(placeholderTexture);
+                        targetPlane.scale.set(1.2, 1.2, 1);
+                        requestRender();
                         return;
                     }
-                    
-                    const loader = new THREE.TextureLoader();
-                    loader.crossOrigin = 'anonymous';
-                    loader.load(url, (texture) => {
+
+                    textureLoader.load(appUrl(url), (texture) => {
+                        // A newer image was requested while this one loaded
+                        if (url !== requestedUrl) {
+                            texture.dispose();
+                            return;
+                        }
                         texture.minFilter = THREE.LinearFilter;
                         texture.magFilter = THREE.LinearFilter;
-                        planeMaterial.map = texture;
-                        planeMaterial.needsUpdate = true;
-                        
+                        setPlaneTexture(texture);
+
                         // Adjust plane aspect ratio to match image
                         const img = texture.image;
                         if (img && img.width && img.height) {
                             const aspect = img.width / img.height;
                             const maxSize = 1.5;
-                            let planeWidth, planeHeight;
                             if (aspect > 1) {
-                                planeWidth = maxSize;
-                                planeHeight = maxSize / aspect;
+                                targetPlane.scale.set(maxSize, maxSize / aspect, 1);
                             } else {
-                                planeHeight = maxSize;
-                                planeWidth = maxSize * aspect;
+                                targetPlane.scale.set(maxSize * aspect, maxSize, 1);
                             }
-                            scene.remove(targetPlane);
-                            targetPlane = new THREE.Mesh(
-                                new THREE.PlaneGeometry(planeWidth, planeHeight),
-                                planeMaterial
-                            );
-                            targetPlane.position.copy(CENTER);
-                            scene.add(targetPlane);
                         }
+                        requestRender();
                     }, undefined, (err) => {
                         console.error('Failed to load texture:', err);
                     });
                 }
-                
+
                 // Check for initial imageUrl
                 if (props.imageUrl) {
                     updateTextureFromUrl(props.imageUrl);
                 }
-                
+
                 // Camera model
                 const cameraGroup = new THREE.Group();
                 const bodyMat = new THREE.MeshStandardMaterial({ color: 0x6699cc, metalness: 0.5, roughness: 0.3 });
                 const body = new THREE.Mesh(new THREE.BoxGeometry(0.3, 0.22, 0.38), bodyMat);
                 cameraGroup.add(body);
-                const lens = new THREE.Mesh(
-                    new THREE.CylinderGeometry(0.09, 0.11, 0.18, 16),
-                    new THREE.MeshStandardMaterial({ color: 0x6699cc, metalness: 0.5, roughness: 0.3 })
-                );
+                const lens = new THREE.Mesh(new THREE.CylinderGeometry(0.09, 0.11, 0.18, 16), bodyMat);
                 lens.rotation.x = Math.PI / 2;
                 lens.position.z = 0.26;
                 cameraGroup.add(lens);
                 scene.add(cameraGroup);
-                
+
+                // Handles share one sphere geometry; each keeps its own material for hover highlighting
+                const handleGeometry = new THREE.SphereGeometry(0.18, 16, 16);
+
                 // GREEN: Azimuth ring
                 const azimuthRing = new THREE.Mesh(
                     new THREE.TorusGeometry(AZIMUTH_RADIUS, 0.04, 16, 64),
@@ -371,14 +3274,14 @@ class CameraControl3D(gr.HTML):
                 azimuthRing.rotation.x = Math.PI / 2;
                 azimuthRing.position.y = 0.05;
                 scene.add(azimuthRing);
-                
+
                 const azimuthHandle = new THREE.Mesh(
-                    new THREE.SphereGeometry(0.18, 16, 16),
+                    handleGeometry,
                     new THREE.MeshStandardMaterial({ color: 0x00ff88, emissive: 0x00ff88, emissiveIntensity: 0.5 })
                 );
                 azimuthHandle.userData.type = 'azimuth';
                 scene.add(azimuthHandle);
-                
+
                 // PINK: Elevation arc
                 const arcPoints = [];
                 for (let i = 0; i <= 32; i++) {
@@ -391,49 +3294,56 @@ class CameraControl3D(gr.HTML):
                     new THREE.MeshStandardMaterial({ color: 0xff69b4, emissive: 0xff69b4, emissiveIntensity: 0.3 })
                 );
                 scene.add(elevationArc);
-                
+
                 const elevationHandle = new THREE.Mesh(
-                    new THREE.SphereGeometry(0.18, 16, 16),
+                    handleGeometry,
                     new THREE.MeshStandardMaterial({ color: 0xff69b4, emissive: 0xff69b4, emissiveIntensity: 0.5 })
                 );
                 elevationHandle.userData.type = 'elevation';
                 scene.add(elevationHandle);
-                
-                // ORANGE: Distance line & handle
+
+                // ORANGE: Distance line & handle (the line's two vertices are updated in place)
                 const distanceLineGeo = new THREE.BufferGeometry();
+                const distanceLinePositions = new THREE.BufferAttribute(new Float32Array(6), 3);
+                distanceLineGeo.setAttribute('position', distanceLinePositions);
                 const distanceLine = new THREE.Line(distanceLineGeo, new THREE.LineBasicMaterial({ color: 0xffa500 }));
+                distanceLine.frustumCulled = false;
                 scene.add(distanceLine);
-                
+
                 const distanceHandle = new THREE.Mesh(
-                    new THREE.SphereGeometry(0.18, 16, 16),
+                    handleGeometry,
                     new THREE.MeshStandardMaterial({ color: 0xffa500, emissive: 0xffa500, emissiveIntensity: 0.5 })
                 );
                 distanceHandle.userData.type = 'distance';
                 scene.add(distanceHandle);
-                
+
+                const handles = [azimuthHandle, elevationHandle, distanceHandle];
+
                 function updatePositions() {
                     const distance = BASE_DISTANCE * distanceFactor;
                     const azRad = THREE.MathUtils.degToRad(azimuthAngle);
                     const elRad = THREE.MathUtils.degToRad(elevationAngle);
-                    
+
                     const camX = distance * Math.sin(azRad) * Math.cos(elRad);
                     const camY = distance * Math.sin(elRad) + CENTER.y;
                     const camZ = distance * Math.cos(azRad) * Math.cos(elRad);
-                    
+
                     cameraGroup.position.set(camX, camY, camZ);
                     cameraGroup.lookAt(CENTER);
-                    
+
                     azimuthHandle.position.set(AZIMUTH_RADIUS * Math.sin(azRad), 0.05, AZIMUTH_RADIUS * Math.cos(azRad));
                     elevationHandle.position.set(-0.8, ELEVATION_RADIUS * Math.sin(elRad) + CENTER.y, ELEVATION_RADIUS * Math.cos(elRad));
-                    
+
                     const orangeDist = distance - 0.5;
                     distanceHandle.position.set(
                         orangeDist * Math.sin(azRad) * Math.cos(elRad),
                         orangeDist * Math.sin(elRad) + CENTER.y,
                         orangeDist * Math.cos(azRad) * Math.cos(elRad)
                     );
-                    distanceLineGeo.setFromPoints([cameraGroup.position.clone(), CENTER.clone()]);
-                    
+                    distanceLinePositions.setXYZ(0, camX, camY, camZ);
+                    distanceLinePositions.setXYZ(1, CENTER.x, CENTER.y, CENTER.z);
+                    distanceLinePositions.needsUpdate = true;
+
                     // Update prompt
                     const azSnap = snapToNearest(azimuthAngle, azimuthSteps);
                     const elSnap = snapToNearest(elevationAngle, elevationSteps);
@@ -441,117 +3351,132 @@ class CameraControl3D(gr.HTML):
                     const distKey = distSnap === 1 ? '1' : distSnap.toFixed(1);
                     const prompt = '<sks> ' + azimuthNames[azSnap] + ' ' + elevationNames[String(elSnap)] + ' ' + distanceNames[distKey];
                     promptOverlay.textContent = prompt;
+                    requestRender();
                 }
-                
+
                 function updatePropsAndTrigger() {
                     const azSnap = snapToNearest(azimuthAngle, azimuthSteps);
                     const elSnap = snapToNearest(elevationAngle, elevationSteps);
                     const distSnap = snapToNearest(distanceFactor, distanceSteps);
-                    
+
                     props.value = { azimuth: azSnap, elevation: elSnap, distance: distSnap };
                     trigger('change', props.value);
                 }
-                
-                // Raycasting
+
+                // Raycasting (drag planes and scratch vectors are allocated once)
                 const raycaster = new THREE.Raycaster();
                 const mouse = new THREE.Vector2();
                 let isDragging = false;
                 let dragTarget = null;
+                let hoverTarget = null;
                 let dragStartMouse = new THREE.Vector2();
                 let dragStartDistance = 1.0;
                 const intersection = new THREE.Vector3();
-                
+                const azimuthPlane = new THREE.Plane(new THREE.Vector3(0, 1, 0), -0.05);
+                const elevationPlane = new THREE.Plane(new THREE.Vector3(1, 0, 0), -0.8);
+
                 const canvas = renderer.domElement;
-                
-                canvas.addEventListener('mousedown', (e) => {
+
+                function setMouse(clientX, clientY) {
                     const rect = canvas.getBoundingClientRect();
-                    mouse.x = ((e.clientX - rect.left) / rect.width) * 2 - 1;
-                    mouse.y = -((e.clientY - rect.top) / rect.height) * 2 + 1;
-                    
+                    mouse.x = ((clientX - rect.left) / rect.width) * 2 - 1;
+                    mouse.y = -((clientY - rect.top) / rect.height) * 2 + 1;
                     raycaster.setFromCamera(mouse, camera);
-                    const intersects = raycaster.intersectObjects([azimuthHandle, elevationHandle, distanceHandle]);
-                    
-                    if (intersects.length > 0) {
-                        isDragging = true;
-                        dragTarget = intersects[0].object;
-                        dragTarget.material.emissiveIntensity = 1.0;
-                        dragTarget.scale.setScalar(1.3);
-                        dragStartMouse.copy(mouse);
-                        dragStartDistance = distanceFactor;
+                }
+
+                function startDrag() {
+                    const intersects = raycaster.intersectObjects(handles);
+                    if (intersects.length === 0) return false;
+                    isDragging = true;
+                    dragTarget = intersects[0].object;
+                    dragTarget.material.emissiveIntensity = 1.0;
+                    dragTarget.scale.setScalar(1.3);
+                    dragStartMouse.copy(mouse);
+                    dragStartDistance = distanceFactor;
+                    requestRender();
+                    return true;
+                }
+
+                function drag() {
+                    if (dragTarget.userData.type === 'azimuth') {
+                        if (raycaster.ray.intersectPlane(azimuthPlane, intersection)) {
+                            azimuthAngle = THREE.MathUtils.radToDeg(Math.atan2(intersection.x, intersection.z));
+                            if (azimuthAngle < 0) azimuthAngle += 360;
+                        }
+                    } else if (dragTarget.userData.type === 'elevation') {
+                        if (raycaster.ray.intersectPlane(elevationPlane, intersection)) {
+                            const relY = intersection.y - CENTER.y;
+                            const relZ = intersection.z;
+                            elevationAngle = THREE.MathUtils.clamp(THREE.MathUtils.radToDeg(Math.atan2(relY, relZ)), -30, 60);
+                        }
+                    } else if (dragTarget.userData.type === 'distance') {
+                        const deltaY = mouse.y - dragStartMouse.y;
+                        distanceFactor = THREE.MathUtils.clamp(dragStartDistance - deltaY * 1.5, 0.6, 1.4);
+                    }
+                    updatePositions();
+                }
+
+                canvas.addEventListener('mousedown', (e) => {
+                    setMouse(e.clientX, e.clientY);
+                    if (startDrag()) {
                         canvas.style.cursor = 'grabbing';
                     }
                 });
-                
+
                 canvas.addEventListener('mousemove', (e) => {
-                    const rect = canvas.getBoundingClientRect();
-                    mouse.x = ((e.clientX - rect.left) / rect.width) * 2 - 1;
-                    mouse.y = -((e.clientY - rect.top) / rect.height) * 2 + 1;
-                    
+                    setMouse(e.clientX, e.clientY);
+
                     if (isDragging && dragTarget) {
-                        raycaster.setFromCamera(mouse, camera);
-                        
-                        if (dragTarget.userData.type === 'azimuth') {
-                            const plane = new THREE.Plane(new THREE.Vector3(0, 1, 0), -0.05);
-                            if (raycaster.ray.intersectPlane(plane, intersection)) {
-                                azimuthAngle = THREE.MathUtils.radToDeg(Math.atan2(intersection.x, intersection.z));
-                                if (azimuthAngle < 0) azimuthAngle += 360;
-                            }
-                        } else if (dragTarget.userData.type === 'elevation') {
-                            const plane = new THREE.Plane(new THREE.Vector3(1, 0, 0), -0.8);
-                            if (raycaster.ray.intersectPlane(plane, intersection)) {
-                                const relY = intersection.y - CENTER.y;
-                                const relZ = intersection.z;
-                                elevationAngle = THREE.MathUtils.clamp(THREE.MathUtils.radToDeg(Math.atan2(relY, relZ)), -30, 60);
-                            }
-                        } else if (dragTarget.userData.type === 'distance') {
-                            const deltaY = mouse.y - dragStartMouse.y;
-                            distanceFactor = THREE.MathUtils.clamp(dragStartDistance - deltaY * 1.5, 0.6, 1.4);
-                        }
-                        updatePositions();
+                        drag();
+                        return;
+                    }
+                    // Hover highlight; only re-render when the hovered handle changes
+                    const intersects = raycaster.intersectObjects(handles);
+                    const hovered = intersects.length > 0 ? intersects[0].object : null;
+                    if (hovered === hoverTarget) return;
+                    hoverTarget = hovered;
+                    handles.forEach(h => {
+                        h.material.emissiveIntensity = 0.5;
+                        h.scale.setScalar(1);
+                    });
+                    if (hovered) {
+                        hovered.material.emissiveIntensity = 0.8;
+                        hovered.scale.setScalar(1.1);
+                        canvas.style.cursor = 'grab';
                     } else {
-                        raycaster.setFromCamera(mouse, camera);
-                        const intersects = raycaster.intersectObjects([azimuthHandle, elevationHandle, distanceHandle]);
-                        [azimuthHandle, elevationHandle, distanceHandle].forEach(h => {
-                            h.material.emissiveIntensity = 0.5;
-                            h.scale.setScalar(1);
-                        });
-                        if (intersects.length > 0) {
-                            intersects[0].object.material.emissiveIntensity = 0.8;
-                            intersects[0].object.scale.setScalar(1.1);
-                            canvas.style.cursor = 'grab';
-                        } else {
-                            canvas.style.cursor = 'default';
-                        }
+                        canvas.style.cursor = 'default';
                     }
+                    requestRender();
                 });
-                
+
                 const onMouseUp = () => {
                     if (dragTarget) {
                         dragTarget.material.emissiveIntensity = 0.5;
                         dragTarget.scale.setScalar(1);
-                        
+                        hoverTarget = null;
+
                         // Snap and animate
                         const targetAz = snapToNearest(azimuthAngle, azimuthSteps);
                         const targetEl = snapToNearest(elevationAngle, elevationSteps);
                         const targetDist = snapToNearest(distanceFactor, distanceSteps);
-                        
+
                         const startAz = azimuthAngle, startEl = elevationAngle, startDist = distanceFactor;
                         const startTime = Date.now();
-                        
+
                         function animateSnap() {
                             const t = Math.min((Date.now() - startTime) / 200, 1);
                             const ease = 1 - Math.pow(1 - t, 3);
-                            
+
                             let azDiff = targetAz - startAz;
                             if (azDiff > 180) azDiff -= 360;
                             if (azDiff < -180) azDiff += 360;
                             azimuthAngle = startAz + azDiff * ease;
                             if (azimuthAngle < 0) azimuthAngle += 360;
                             if (azimuthAngle >= 360) azimuthAngle -= 360;
-                            
+
                             elevationAngle = startEl + (targetEl - startEl) * ease;
                             distanceFactor = startDist + (targetDist - startDist) * ease;
-                            
+
                             updatePositions();
                             if (t < 1) requestAnimationFrame(animateSnap);
                             else updatePropsAndTrigger();
@@ -562,7 +3487,7 @@ class CameraControl3D(gr.HTML):
                     dragTarget = null;
                     canvas.style.cursor = 'default';
                 };
-                
+
                 canvas.addEventListener('mouseup', onMouseUp);
                 canvas.addEventListener('mouseleave', onMouseUp);
 
@@ -570,116 +3495,108 @@ class CameraControl3D(gr.HTML):
                 canvas.addEventListener('touchstart', (e) => {
                     e.preventDefault();
                     const touch = e.touches[0];
-                    const rect = canvas.getBoundingClientRect();
-                    mouse.x = ((touch.clientX - rect.left) / rect.width) * 2 - 1;
-                    mouse.y = -((touch.clientY - rect.top) / rect.height) * 2 + 1;
-                    
-                    raycaster.setFromCamera(mouse, camera);
-                    const intersects = raycaster.intersectObjects([azimuthHandle, elevationHandle, distanceHandle]);
-                    
-                    if (intersects.length > 0) {
-                        isDragging = true;
-                        dragTarget = intersects[0].object;
-                        dragTarget.material.emissiveIntensity = 1.0;
-                        dragTarget.scale.setScalar(1.3);
-                        dragStartMouse.copy(mouse);
-                        dragStartDistance = distanceFactor;
-                    }
+                    setMouse(touch.clientX, touch.clientY);
+                    startDrag();
                 }, { passive: false });
-                
+
                 canvas.addEventListener('touchmove', (e) => {
                     e.preventDefault();
                     const touch = e.touches[0];
-                    const rect = canvas.getBoundingClientRect();
-                    mouse.x = ((touch.clientX - rect.left) / rect.width) * 2 - 1;
-                    mouse.y = -((touch.clientY - rect.top) / rect.height) * 2 + 1;
-                    
+                    setMouse(touch.clientX, touch.clientY);
                     if (isDragging && dragTarget) {
-                        raycaster.setFromCamera(mouse, camera);
-                        
-                        if (dragTarget.userData.type === 'azimuth') {
-                            const plane = new THREE.Plane(new THREE.Vector3(0, 1, 0), -0.05);
-                            if (raycaster.ray.intersectPlane(plane, intersection)) {
-                                azimuthAngle = THREE.MathUtils.radToDeg(Math.atan2(intersection.x, intersection.z));
-                                if (azimuthAngle < 0) azimuthAngle += 360;
-                            }
-                        } else if (dragTarget.userData.type === 'elevation') {
-                            const plane = new THREE.Plane(new THREE.Vector3(1, 0, 0), -0.8);
-                            if (raycaster.ray.intersectPlane(plane, intersection)) {
-                                const relY = intersection.y - CENTER.y;
-                                const relZ = intersection.z;
-                                elevationAngle = THREE.MathUtils.clamp(THREE.MathUtils.radToDeg(Math.atan2(relY, relZ)), -30, 60);
-                            }
-                        } else if (dragTarget.userData.type === 'distance') {
-                            const deltaY = mouse.y - dragStartMouse.y;
-                            distanceFactor = THREE.MathUtils.clamp(dragStartDistance - deltaY * 1.5, 0.6, 1.4);
-                        }
-                        updatePositions();
+                        drag();
                     }
                 }, { passive: false });
-                
+
                 canvas.addEventListener('touchend', (e) => {
                     e.preventDefault();
                     onMouseUp();
                 }, { passive: false });
-                
+
                 canvas.addEventListener('touchcancel', (e) => {
                     e.preventDefault();
                     onMouseUp();
                 }, { passive: false });
-                
+
                 // Initial update
                 updatePositions();
-                
-                // Render loop
-                function render() {
-                    requestAnimationFrame(render);
-                    renderer.render(scene, camera);
-                }
-                render();
-                
-                // Handle resize
-                new ResizeObserver(() => {
-                    camera.aspect = wrapper.clientWidth / wrapper.clientHeight;
-                    camera.updateProjectionMatrix();
-                    renderer.setSize(wrapper.clientWidth, wrapper.clientHeight);
-                }).observe(wrapper);
-                
-                // Store update functions for external calls
-                wrapper._updateFromProps = (newVal) => {
+
+                function applyValue(newVal) {
                     if (newVal && typeof newVal === 'object') {
                         azimuthAngle = newVal.azimuth ?? azimuthAngle;
                         elevationAngle = newVal.elevation ?? elevationAngle;
                         distanceFactor = newVal.distance ?? distanceFactor;
                         updatePositions();
                     }
-                };
-                
+                }
+
+                // Store update functions for external calls
+                wrapper._updateFromProps = applyValue;
                 wrapper._updateTexture = updateTextureFromUrl;
-                
-                // Watch for prop changes (imageUrl and value)
-                let lastImageUrl = props.imageUrl;
-                let lastValue = JSON.stringify(props.value);
-                setInterval(() => {
-                    // Check imageUrl changes
-                    if (props.imageUrl !== lastImageUrl) {
-                        lastImageUrl = props.imageUrl;
-                        updateTextureFromUrl(props.imageUrl);
+
+                // Watch for prop changes (imageUrl and value). Assignments are intercepted
+                // with accessors so updates apply immediately; if props is a proxy that
+                // refuses accessors, fall back to a cheap visible-only check.
+                const watched = {
+                    imageUrl: { last: props.imageUrl, apply: updateTextureFromUrl, same: (a, b) => a === b },
+                    value: {
+                        last: props.value,
+                        apply: applyValue,
+                        same: (a, b) => a === b || (!!a && !!b && a.azimuth === b.azimuth && a.elevation === b.elevation && a.distance === b.distance),
+                    },
+                };
+                function onPropChange(name, current) {
+                    const entry = watched[name];
+                    if (entry.same(entry.last, current)) return;
+                    entry.last = current;
+                    entry.apply(current);
+                }
+                let pollTimer = null;
+                try {
+                    for (const name of Object.keys(watched)) {
+                        let current = props[name];
+                        Object.defineProperty(props, name, {
+                            configurable: true,
+                            enumerable: true,
+                            get: () => current,
+                            set: (v) => { current = v; onPropChange(name, v); },
+                        });
                     }
-                    // Check value changes (from sliders)
-                    const currentValue = JSON.stringify(props.value);
-                    if (currentValue !== lastValue) {
-                        lastValue = currentValue;
-                        if (props.value && typeof props.value === 'object') {
-                            azimuthAngle = props.value.azimuth ?? azimuthAngle;
-                            elevationAngle = props.value.elevation ?? elevationAngle;
-                            distanceFactor = props.value.distance ?? distanceFactor;
-                            updatePositions();
-                        }
+                } catch (err) {
+                    pollTimer = setInterval(() => {
+                        if (document.hidden) return;
+                        for (const name of Object.keys(watched)) onPropChange(name, props[name]);
+                    }, 250);
+                }
+
+                // Release GPU resources once Gradio removes the component from the page
+                function dispose() {
+                    if (pollTimer !== null) clearInterval(pollTimer);
+                    resizeObserver.disconnect();
+                    const textures = new Set([placeholderTexture, planeMaterial.map]);
+                    scene.traverse((obj) => {
+                        if (obj.geometry) obj.geometry.dispose();
+                        if (obj.material) obj.material.dispose();
+                    });
+                    textures.forEach((texture) => texture && texture.dispose());
+                    renderer.dispose();
+                }
+
+                // Handle resize
+                const resizeObserver = new ResizeObserver(() => {
+                    if (!wrapper.isConnected) {
+                        dispose();
+                        return;
                     }
-                }, 100);
+                    if (!wrapper.clientWidth || !wrapper.clientHeight) return;
+                    camera.aspect = wrapper.clientWidth / wrapper.clientHeight;
+                    camera.updateProjectionMatrix();
+                    renderer.setSize(wrapper.clientWidth, wrapper.clientHeight);
+                    requestRender();
+                });
+                resizeObserver.observe(wrapper);
             };
-            
+
             initScene();
         })();
         """
@@ -708,68 +3625,153 @@ with gr.Blocks(css=css, theme=gr.themes.Soft()) as demo:
     Control camera angles using the **3D viewport** or **sliders**. 
     Using [fal's Qwen-Image-Edit-2511-Multiple-Angles-LoRA](https://huggingface.co/fal/Qwen-Image-Edit-2511-Multiple-Angles-LoRA) for precise camera control.
     """)
+    model_status = gr.Markdown(model_status_text())
+    model_status_timer = gr.Timer(2.0)
     
-    with gr.Row():
-        # Left column: Input image and controls
-        with gr.Column(scale=1):
-            image = gr.Image(label="Input Image", type="pil", height=300)
+    with gr.Tabs():
+        with gr.Tab("🎥 Single View"):
+            with gr.Row():
+                # Left column: Input image and controls
+                with gr.Column(scale=1):
+                    image = gr.Image(label="Input Image", type="pil", height=300)
             
-            gr.Markdown("### 🎮 3D Camera Control")
-            gr.Markdown("*Drag the colored handles: 🟢 Azimuth, 🩷 Elevation, 🟠 Distance*")
+                    gr.Markdown("### 🎮 3D Camera Control")
+                    gr.Markdown("*Drag the colored handles: 🟢 Azimuth, 🩷 Elevation, 🟠 Distance*")
             
-            camera_3d = CameraControl3D(
-                value={"azimuth": 0, "elevation": 0, "distance": 1.0},
-                elem_id="camera-3d-control"
-            )
+                    camera_3d = CameraControl3D(
+                        value={"azimuth": 0, "elevation": 0, "distance": 1.0},
+                        elem_id="camera-3d-control"
+                    )
 
-            run_btn = gr.Button("🚀 Generate", variant="primary", size="lg")
+                    run_btn = gr.Button("🚀 Generate", variant="primary", size="lg")
             
-            gr.Markdown("### 🎚️ Slider Controls")
+                    gr.Markdown("### 🎚️ Slider Controls")
             
-            azimuth_slider = gr.Slider(
-                label="Azimuth (Horizontal Rotation)",
-                minimum=0,
-                maximum=315,
-                step=45,
-                value=0,
-                info="0°=front, 90°=right, 180°=back, 270°=left"
-            )
+                    azimuth_slider = gr.Slider(
+                        label="Azimuth (Horizontal Rotation)",
+                        minimum=0,
+                        maximum=315,
+                        step=45,
+                        value=0,
+                        info="0°=front, 90°=right, 180°=back, 270°=left"
+                    )
             
-            elevation_slider = gr.Slider(
-                label="Elevation (Vertical Angle)", 
-                minimum=-30,
-                maximum=60,
-                step=30,
-                value=0,
-                info="-30°=low angle, 0°=eye level, 60°=high angle"
-            )
+                    elevation_slider = gr.Slider(
+                        label="Elevation (Vertical Angle)", 
+                        minimum=-30,
+                        maximum=60,
+                        step=30,
+                        value=0,
+                        info="-30°=low angle, 0°=eye level, 60°=high angle"
+                    )
             
-            distance_slider = gr.Slider(
-                label="Distance",
-                minimum=0.6,
-                maximum=1.4,
-                step=0.4,
-                value=1.0,
-                info="0.6=close-up, 1.0=medium, 1.4=wide"
-            )
+                    distance_slider = gr.Slider(
+                        label="Distance",
+                        minimum=0.6,
+                        maximum=1.4,
+                        step=0.4,
+                        value=1.0,
+                        info="0.6=close-up, 1.0=medium, 1.4=wide"
+                    )
             
-            prompt_preview = gr.Textbox(
-                label="Generated Prompt",
-                value="<sks> front view eye-level shot medium shot",
-                interactive=False
-            )
+                    prompt_preview = gr.Textbox(
+                        label="Generated Prompt",
+                        value="<sks> front view eye-level shot medium shot",
+                        interactive=False
+                    )
         
-        # Right column: Output
-        with gr.Column(scale=1):
-            result = gr.Image(label="Output Image", height=500)
+                # Right column: Output
+                with gr.Column(scale=1):
+                    result = gr.Image(label="Output Image", height=500)
             
-            with gr.Accordion("⚙️ Advanced Settings", open=False):
-                seed = gr.Slider(label="Seed", minimum=0, maximum=MAX_SEED, step=1, value=0)
-                randomize_seed = gr.Checkbox(label="Randomize Seed", value=True)
-                guidance_scale = gr.Slider(label="Guidance Scale", minimum=1.0, maximum=10.0, step=0.1, value=1.0)
-                num_inference_steps = gr.Slider(label="Inference Steps", minimum=1, maximum=20, step=1, value=4)
-                height = gr.Slider(label="Height", minimum=256, maximum=2048, step=8, value=1024)
-                width = gr.Slider(label="Width", minimum=256, maximum=2048, step=8, value=1024)
+                    with gr.Accordion("⚙️ Advanced Settings", open=False):
+                        seed = gr.Slider(label="Seed", minimum=0, maximum=MAX_SEED, step=1, value=0)
+                        randomize_seed = gr.Checkbox(label="Randomize Seed", value=True)
+                        guidance_scale = gr.Slider(label="Guidance Scale", minimum=1.0, maximum=10.0, step=0.1, value=1.0)
+                        num_inference_steps = gr.Slider(label="Inference Steps", minimum=1, maximum=20, step=1, value=4)
+                        height = gr.Slider(label="Height", minimum=256, maximum=2048, step=8, value=1024)
+                        width = gr.Slider(label="Width", minimum=256, maximum=2048, step=8, value=1024)
+                        timings = gr.JSON(label="⏱️ Stage Timings (ms)")
+        
+        with gr.Tab("🧩 Multi-View"):
+            with gr.Row():
+                with gr.Column(scale=1):
+                    mv_image = gr.Image(label="Input Image", type="pil", height=300)
+                    mv_azimuths = gr.CheckboxGroup(
+                        label="Azimuths",
+                        choices=[(name, az) for az, name in AZIMUTH_MAP.items()],
+                        value=list(AZIMUTH_MAP.keys())
+                    )
+                    mv_elevations = gr.CheckboxGroup(
+                        label="Elevations",
+                        choices=[(name, el) for el, name in ELEVATION_MAP.items()],
+                        value=[0]
+                    )
+                    mv_distance = gr.Radio(
+                        label="Distance",
+                        choices=[(name, dist) for dist, name in DISTANCE_MAP.items()],
+                        value=1.0
+                    )
+                    mv_run_btn = gr.Button("🚀 Generate Views", variant="primary", size="lg")
+                    
+                    with gr.Accordion("⚙️ Advanced Settings", open=False):
+                        mv_seed = gr.Slider(label="Seed", minimum=0, maximum=MAX_SEED, step=1, value=0)
+                        mv_randomize_seed = gr.Checkbox(label="Randomize Seed", value=True)
+                        mv_guidance_scale = gr.Slider(label="Guidance Scale", minimum=1.0, maximum=10.0, step=0.1, value=1.0)
+                        mv_num_inference_steps = gr.Slider(label="Inference Steps", minimum=1, maximum=20, step=1, value=4)
+                        mv_height = gr.Slider(label="Height", minimum=256, maximum=2048, step=8, value=1024)
+                        mv_width = gr.Slider(label="Width", minimum=256, maximum=2048, step=8, value=1024)
+                        mv_max_batch_size = gr.Slider(
+                            label="Views per Batch",
+                            minimum=0,
+                            maximum=32,
+                            step=1,
+                            value=0,
+                            info="0 = derive from the memory budget (QIE_MULTI_VIEW_PIXEL_BUDGET)"
+                        )
+                
+                with gr.Column(scale=1):
+                    mv_gallery = gr.Gallery(label="Generated Views", columns=4, height=600)
+        
+        with gr.Tab("🔄 Orbit"):
+            with gr.Row():
+                with gr.Column(scale=1):
+                    orbit_image = gr.Image(label="Input Image", type="pil", height=300)
+                    orbit_elevation = gr.Radio(
+                        label="Elevation",
+                        choices=[(name, el) for el, name in ELEVATION_MAP.items()],
+                        value=0
+                    )
+                    orbit_distance = gr.Radio(
+                        label="Distance",
+                        choices=[(name, dist) for dist, name in DISTANCE_MAP.items()],
+                        value=1.0
+                    )
+                    orbit_clockwise = gr.Checkbox(label="Clockwise (front → right → back)", value=True)
+                    orbit_warm_start = gr.Slider(
+                        label="Warm-Start Strength",
+                        minimum=0.0,
+                        maximum=1.0,
+                        step=0.05,
+                        value=0.7,
+                        info="Start each frame from the previous one re-noised to this strength (0 or 1 = full noise)"
+                    )
+                    with gr.Row():
+                        orbit_format = gr.Radio(label="Format", choices=["webp", "gif", "mp4"], value="webp")
+                        orbit_fps = gr.Slider(label="FPS", minimum=1, maximum=24, step=1, value=4)
+                    orbit_run_btn = gr.Button("🚀 Render Orbit", variant="primary", size="lg")
+                    
+                    with gr.Accordion("⚙️ Advanced Settings", open=False):
+                        orbit_seed = gr.Slider(label="Seed", minimum=0, maximum=MAX_SEED, step=1, value=0)
+                        orbit_randomize_seed = gr.Checkbox(label="Randomize Seed", value=True)
+                        orbit_guidance_scale = gr.Slider(label="Guidance Scale", minimum=1.0, maximum=10.0, step=0.1, value=1.0)
+                        orbit_num_inference_steps = gr.Slider(label="Inference Steps", minimum=1, maximum=20, step=1, value=4)
+                        orbit_height = gr.Slider(label="Height", minimum=256, maximum=2048, step=8, value=1024)
+                        orbit_width = gr.Slider(label="Width", minimum=256, maximum=2048, step=8, value=1024)
+                
+                with gr.Column(scale=1):
+                    orbit_gallery = gr.Gallery(label="Frames", columns=4, height=400)
+                    orbit_file = gr.File(label="Animation")
     
     # --- Event Handlers ---
     
@@ -796,14 +3798,20 @@ with gr.Blocks(css=css, theme=gr.themes.Soft()) as demo:
         """Update the 3D component with the uploaded image."""
         if image is None:
             return gr.update(imageUrl=None)
-        # Convert PIL image to base64 data URL
-        import base64
-        from io import BytesIO
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        data_url = f"data:image/png;base64,{img_str}"
-        return gr.update(imageUrl=data_url)
+        return gr.update(imageUrl=thumbnail_url(image))
+    
+    def refresh_model_status():
+        """Poll the pipeline factory (or worker pool); stop polling once loading has settled."""
+        if worker_pool is not None:
+            # Replicas can go down and come back, so keep polling
+            return worker_pool.status_text(), gr.Timer(active=True)
+        settled = pipeline_factory.state == "error" or pipeline_factory.ready
+        return pipeline_factory.status_text(), gr.Timer(active=not settled)
+    
+    model_status_timer.tick(
+        fn=refresh_model_status,
+        outputs=[model_status, model_status_timer]
+    )
     
     # Slider -> Prompt preview
     for slider in [azimuth_slider, elevation_slider, distance_slider]:
@@ -832,7 +3840,11 @@ with gr.Blocks(css=css, theme=gr.themes.Soft()) as demo:
     run_btn.click(
         fn=infer_camera_edit,
         inputs=[image, azimuth_slider, elevation_slider, distance_slider, seed, randomize_seed, guidance_scale, num_inference_steps, height, width],
-        outputs=[result, seed, prompt_preview]
+        outputs=[result, seed, prompt_preview, timings],
+        # Set at launch from generation_concurrency(), after --workers is known
+        concurrency_limit="default",
+        # A new click supersedes the session's running job instead of waiting for it
+        trigger_mode="multiple",
     )
     
     # Image upload -> update dimensions AND update 3D preview
@@ -846,6 +3858,33 @@ with gr.Blocks(css=css, theme=gr.themes.Soft()) as demo:
         outputs=[camera_3d]
     )
     
+    # Multi-view tab
+    mv_run_btn.click(
+        fn=infer_multi_view_grid,
+        inputs=[mv_image, mv_azimuths, mv_elevations, mv_distance, mv_seed, mv_randomize_seed, mv_guidance_scale, mv_num_inference_steps, mv_height, mv_width, mv_max_batch_size],
+        outputs=[mv_gallery, mv_seed],
+        concurrency_limit="default",
+    )
+    
+    mv_image.upload(
+        fn=update_dimensions_on_upload,
+        inputs=[mv_image],
+        outputs=[mv_width, mv_height]
+    )
+    
+    # Orbit tab
+    orbit_run_btn.click(
+        fn=infer_orbit,
+        inputs=[orbit_image, orbit_elevation, orbit_distance, orbit_clockwise, orbit_seed, orbit_randomize_seed, orbit_guidance_scale, orbit_num_inference_steps, orbit_height, orbit_width, orbit_warm_start, orbit_format, orbit_fps],
+        outputs=[orbit_gallery, orbit_file, orbit_seed]
+    )
+    
+    orbit_image.upload(
+        fn=update_dimensions_on_upload,
+        inputs=[orbit_image],
+        outputs=[orbit_width, orbit_height]
+    )
+    
     # Also handle image clear
     image.clear(
         fn=lambda: gr.update(imageUrl=None),
@@ -866,6 +3905,33 @@ with gr.Blocks(css=css, theme=gr.themes.Soft()) as demo:
     #)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Qwen Image Edit 2511 - 3D Camera Control")
+    parser.add_argument("--device", choices=["auto", "cpu", "cuda"], default=None, help="Execution device (default: QIE_DEVICE or auto)")
+    parser.add_argument("--quant", choices=["auto", *QUANT_PROFILES], default=None, help="GGUF quantization profile (default: QIE_QUANT or auto)")
+    parser.add_argument("--memory-budget-gb", type=float, default=None, help="Memory available to the model for --quant auto")
+    parser.add_argument("--offline", action="store_true", help="Load only from the local model store (same as QIE_OFFLINE=1)")
+    parser.add_argument("--prepare-models", action="store_true", help="Download and pin all model artifacts into QIE_MODEL_DIR, then exit")
+    parser.add_argument("--workers", default=None, help="Comma-separated worker.py URLs to generate on instead of in-process (same as QIE_WORKERS)")
+    args = parser.parse_args()
+    if args.device and args.device != DEVICE_MODE:
+        configure_execution(args.device)
+    if args.device or args.quant or args.memory_budget_gb:
+        configure_quantization(args.quant, args.memory_budget_gb)
+    if args.offline:
+        model_store.offline = True
+    if args.prepare_models:
+        model_store.prepare()
+        raise SystemExit(0)
+
     head = '<script src="https://cdnjs.cloudflare.com/ajax/libs/three.js/r128/three.min.js"></script>'
     css = '.fillable{max-width: 1200px !important}'
-    demo.launch(head=head, css=css)
\ No newline at end of file
+    if args.workers:
+        worker_pool = WorkerPool(parse_worker_urls(args.workers))
+    if worker_pool is not None:
+        worker_pool.start()
+    else:
+        # Load the model in the background so the UI is usable immediately
+        pipeline_factory.start_background_load()
+    start_metrics_server()
+    demo.queue(default_concurrency_limit=generation_concurrency())
+    demo.launch(head=head, css=css, allowed_paths=[thumbnail_store.directory])
\ No newline at end of file
@@ -19,52 +19,63 @@ class CameraControl3D(gr.HTML):
         (() => {
             const wrapper = element.querySelector('#camera-control-wrapper');
             const promptOverlay = element.querySelector('#prompt-overlay');
-            
+
             // Wait for THREE to load
             const initScene = () => {
                 if (typeof THREE === 'undefined') {
                     setTimeout(initScene, 100);
                     return;
                 }
-                
+
                 // Scene setup
                 const scene = new THREE.Scene();
                 scene.background = new THREE.Color(0x1a1a1a);
-                
+
                 const camera = new THREE.PerspectiveCamera(50, wrapper.clientWidth / wrapper.clientHeight, 0.1, 1000);
                 camera.position.set(4.5, 3, 4.5);
                 camera.lookAt(0, 0.75, 0);
-                
+
                 const renderer = new THREE.WebGLRenderer({ antialias: true });
                 renderer.setSize(wrapper.clientWidth, wrapper.clientHeight);
                 renderer.setPixelRatio(Math.min(window.devicePixelRatio, 2));
                 wrapper.insertBefore(renderer.domElement, promptOverlay);
-                
+
+                // Render on demand: changes request a single frame instead of a continuous loop
+                let renderPending = false;
+                function requestRender() {
+                    if (renderPending) return;
+                    renderPending = true;
+                    requestAnimationFrame(() => {
+                        renderPending = false;
+                        renderer.render(scene, camera);
+                    });
+                }
+
                 // Lighting
                 scene.add(new THREE.AmbientLight(0xffffff, 0.6));
                 const dirLight = new THREE.DirectionalLight(0xffffff, 0.6);
                 dirLight.position.set(5, 10, 5);
                 scene.add(dirLight);
-                
+
                 // Grid
                 scene.add(new THREE.GridHelper(8, 16, 0x333333, 0x222222));
-                
+
                 // Constants - reduced distances for tighter framing
                 const CENTER = new THREE.Vector3(0, 0.75, 0);
                 const BASE_DISTANCE = 1.6;
                 const AZIMUTH_RADIUS = 2.4;
                 const ELEVATION_RADIUS = 1.8;
-                
+
                 // State
                 let azimuthAngle = props.value?.azimuth || 0;
                 let elevationAngle = props.value?.elevation || 0;
                 let distanceFactor = props.value?.distance || 1.0;
-                
+
                 // Mappings - reduced wide shot multiplier
                 const azimuthSteps = [0, 45, 90, 135, 180, 225, 270, 315];
                 const elevationSteps = [-30, 0, 30, 60];
                 const distanceSteps = [0.6, 1.0, 1.4];
-                
+
                 const azimuthNames = {
                     0: 'front view', 45: 'front-right quarter view', 90: 'right side view',
                     135: 'back-right quarter view', 180: 'back view', 225: 'back-left quarter view',
@@ -72,11 +83,11 @@ class CameraControl3D(gr.HTML):
                 };
                 const elevationNames = { '-30': 'low-angle shot', '0': 'eye-level shot', '30': 'elevated shot', '60': 'high-angle shot' };
                 const distanceNames = { '0.6': 'close-up', '1': 'medium shot', '1.4': 'wide shot' };
-                
+
                 function snapToNearest(value, steps) {
                     return steps.reduce((prev, curr) => Math.abs(curr - value) < Math.abs(prev - value) ? curr : prev);
                 }
-                
+
                 // Create placeholder texture (smiley face)
                 function createPlaceholderTexture() {
                     const canvas = document.createElement('canvas');
@@ -101,81 +112,86 @@ class CameraControl3D(gr.HTML):
                     ctx.stroke();
                     return new THREE.CanvasTexture(canvas);
                 }
-                
-                // Target image plane
-                let currentTexture = createPlaceholderTexture();
-                const planeMaterial = new THREE.MeshBasicMaterial({ map: currentTexture, side: THREE.DoubleSide });
-                let targetPlane = new THREE.Mesh(new THREE.PlaneGeometry(1.2, 1.2), planeMaterial);
+
+                // Target image plane: one unit geometry, scaled to the image's aspect ratio
+                const placeholderTexture = createPlaceholderTexture();
+                const planeMaterial = new THREE.MeshBasicMaterial({ map: placeholderTexture, side: THREE.DoubleSide });
+                const targetPlane = new THREE.Mesh(new THREE.PlaneGeometry(1, 1), planeMaterial);
                 targetPlane.position.copy(CENTER);
+                targetPlane.scale.set(1.2, 1.2, 1);
                 scene.add(targetPlane);
-                
+
+                const textureLoader = new THREE.TextureLoader();
+                textureLoader.crossOrigin = 'anonymous';
+                let requestedUrl = null;
+
+                // Swap the plane's texture, releasing the previous image's GPU memory
+                function setPlaneTexture(texture) {
+                    const previous = planeMaterial.map;
+                    planeMaterial.map = texture;
+                    planeMaterial.needsUpdate = true;
+                    if (previous && previous !== placeholderTexture && previous !== texture) {
+                        previous.dispose();
+                    }
+                }
+
                 // Function to update texture from image URL
                 function updateTextureFromUrl(url) {
+                    requestedUrl = url || null;
                     if (!url) {
-                        // Reset to placeholder
-                        planeMaterial.map = createPlaceholderTexture();
-                        planeMaterial.needsUpdate = true;
-                        // Reset plane to square
-                        scene.remove(targetPlane);
-                        targetPlane = new THREE.Mesh(new THREE.PlaneGeometry(1.2, 1.2), planeMaterial);
-                        targetPlane.position.copy(CENTER);
-                        scene.add(targetPlane);
+                        // Reset to placeholder and a square plane
+                        setPlaneTexture(placeholderTexture);
+                        targetPlane.scale.set(1.2, 1.2, 1);
+                        requestRender();
                         return;
                     }
-                    
-                    const loader = new THREE.TextureLoader();
-                    loader.crossOrigin = 'anonymous';
-                    loader.load(url, (texture) => {
+
+                    textureLoader.load(url, (texture) => {
+                        // A newer image was requested while this one loaded
+                        if (url !== requestedUrl) {
+                            texture.dispose();
+                            return;
+                        }
                         texture.minFilter = THREE.LinearFilter;
                         texture.magFilter = THREE.LinearFilter;
-                        planeMaterial.map = texture;
-                        planeMaterial.needsUpdate = true;
-                        
+                        setPlaneTexture(texture);
+
                         // Adjust plane aspect ratio to match image
                         const img = texture.image;
                         if (img && img.width && img.height) {
                             const aspect = img.width / img.height;
                             const maxSize = 1.5;
-                            let planeWidth, planeHeight;
                             if (aspect > 1) {
-                                planeWidth = maxSize;
-                                planeHeight = maxSize / aspect;
+                                targetPlane.scale.set(maxSize, maxSize / aspect, 1);
                             } else {
-                                planeHeight = maxSize;
-                                planeWidth = maxSize * aspect;
+                                targetPlane.scale.set(maxSize * aspect, maxSize, 1);
                             }
-                            scene.remove(targetPlane);
-                            targetPlane = new THREE.Mesh(
-                                new THREE.PlaneGeometry(planeWidth, planeHeight),
-                                planeMaterial
-                            );
-                            targetPlane.position.copy(CENTER);
-                            scene.add(targetPlane);
                         }
+                        requestRender();
                     }, undefined, (err) => {
                         console.error('Failed to load texture:', err);
                     });
                 }
-                
+
                 // Check for initial imageUrl
                 if (props.imageUrl) {
                     updateTextureFromUrl(props.imageUrl);
                 }
-                
+
                 // Camera model
                 const cameraGroup = new THREE.Group();
                 const bodyMat = new THREE.MeshStandardMaterial({ color: 0x6699cc, metalness: 0.5, roughness: 0.3 });
                 const body = new THREE.Mesh(new THREE.BoxGeometry(0.3, 0.22, 0.38), bodyMat);
                 cameraGroup.add(body);
-                const lens = new THREE.Mesh(
-                    new THREE.CylinderGeometry(0.09, 0.11, 0.18, 16),
-                    new THREE.MeshStandardMaterial({ color: 0x6699cc, metalness: 0.5, roughness: 0.3 })
-                );
+                const lens = new THREE.Mesh(new THREE.CylinderGeometry(0.09, 0.11, 0.18, 16), bodyMat);
                 lens.rotation.x = Math.PI / 2;
                 lens.position.z = 0.26;
                 cameraGroup.add(lens);
                 scene.add(cameraGroup);
-                
+
+                // Handles share one sphere geometry; each keeps its own material for hover highlighting
+                const handleGeometry = new THREE.SphereGeometry(0.18, 16, 16);
+
                 // GREEN: Azimuth ring
                 const azimuthRing = new THREE.Mesh(
                     new THREE.TorusGeometry(AZIMUTH_RADIUS, 0.04, 16, 64),
@@ -184,14 +200,14 @@ class CameraControl3D(gr.HTML):
                 azimuthRing.rotation.x = Math.PI / 2;
                 azimuthRing.position.y = 0.05;
                 scene.add(azimuthRing);
-                
+
                 const azimuthHandle = new THREE.Mesh(
-                    new THREE.SphereGeometry(0.18, 16, 16),
+                    handleGeometry,
                     new THREE.MeshStandardMaterial({ color: 0x00ff88, emissive: 0x00ff88, emissiveIntensity: 0.5 })
                 );
                 azimuthHandle.userData.type = 'azimuth';
                 scene.add(azimuthHandle);
-                
+
                 // PINK: Elevation arc
                 const arcPoints = [];
                 for (let i = 0; i <= 32; i++) {
@@ -204,49 +220,56 @@ class CameraControl3D(gr.HTML):
                     new THREE.MeshStandardMaterial({ color: 0xff69b4, emissive: 0xff69b4, emissiveIntensity: 0.3 })
                 );
                 scene.add(elevationArc);
-                
+
                 const elevationHandle = new THREE.Mesh(
-                    new THREE.SphereGeometry(0.18, 16, 16),
+                    handleGeometry,
                     new THREE.MeshStandardMaterial({ color: 0xff69b4, emissive: 0xff69b4, emissiveIntensity: 0.5 })
                 );
                 elevationHandle.userData.type = 'elevation';
                 scene.add(elevationHandle);
-                
-                // ORANGE: Distance line & handle
+
+                // ORANGE: Distance line & handle (the line's two vertices are updated in place)
                 const distanceLineGeo = new THREE.BufferGeometry();
+                const distanceLinePositions = new THREE.BufferAttribute(new Float32Array(6), 3);
+                distanceLineGeo.setAttribute('position', distanceLinePositions);
                 const distanceLine = new THREE.Line(distanceLineGeo, new THREE.LineBasicMaterial({ color: 0xffa500 }));
+                distanceLine.frustumCulled = false;
                 scene.add(distanceLine);
-                
+
                 const distanceHandle = new THREE.Mesh(
-                    new THREE.SphereGeometry(0.18, 16, 16),
+                    handleGeometry,
                     new THREE.MeshStandardMaterial({ color: 0xffa500, emissive: 0xffa500, emissiveIntensity: 0.5 })
                 );
                 distanceHandle.userData.type = 'distance';
                 scene.add(distanceHandle);
-                
+
+                const handles = [azimuthHandle, elevationHandle, distanceHandle];
+
                 function updatePositions() {
                     const distance = BASE_DISTANCE * distanceFactor;
                     const azRad = THREE.MathUtils.degToRad(azimuthAngle);
                     const elRad = THREE.MathUtils.degToRad(elevationAngle);
-                    
+
                     const camX = distance * Math.sin(azRad) * Math.cos(elRad);
                     const camY = distance * Math.sin(elRad) + CENTER.y;
                     const camZ = distance * Math.cos(azRad) * Math.cos(elRad);
-                    
+
                     cameraGroup.position.set(camX, camY, camZ);
                     cameraGroup.lookAt(CENTER);
-                    
+
                     azimuthHandle.position.set(AZIMUTH_RADIUS * Math.sin(azRad), 0.05, AZIMUTH_RADIUS * Math.cos(azRad));
                     elevationHandle.position.set(-0.8, ELEVATION_RADIUS * Math.sin(elRad) + CENTER.y, ELEVATION_RADIUS * Math.cos(elRad));
-                    
+
                     const orangeDist = distance - 0.5;
                     distanceHandle.position.set(
                         orangeDist * Math.sin(azRad) * Math.cos(elRad),
                         orangeDist * Math.sin(elRad) + CENTER.y,
                         orangeDist * Math.cos(azRad) * Math.cos(elRad)
                     );
-                    distanceLineGeo.setFromPoints([cameraGroup.position.clone(), CENTER.clone()]);
-                    
+                    distanceLinePositions.setXYZ(0, camX, camY, camZ);
+                    distanceLinePositions.setXYZ(1, CENTER.x, CENTER.y, CENTER.z);
+                    distanceLinePositions.needsUpdate = true;
+
                     // Update prompt
                     const azSnap = snapToNearest(azimuthAngle, azimuthSteps);
                     const elSnap = snapToNearest(elevationAngle, elevationSteps);
@@ -254,117 +277,132 @@ class CameraControl3D(gr.HTML):
                     const distKey = distSnap === 1 ? '1' : distSnap.toFixed(1);
                     const prompt = '<sks> ' + azimuthNames[azSnap] + ' ' + elevationNames[String(elSnap)] + ' ' + distanceNames[distKey];
                     promptOverlay.textContent = prompt;
+                    requestRender();
                 }
-                
+
                 function updatePropsAndTrigger() {
                     const azSnap = snapToNearest(azimuthAngle, azimuthSteps);
                     const elSnap = snapToNearest(elevationAngle, elevationSteps);
                     const distSnap = snapToNearest(distanceFactor, distanceSteps);
-                    
+
                     props.value = { azimuth: azSnap, elevation: elSnap, distance: distSnap };
                     trigger('change', props.value);
                 }
-                
-                // Raycasting
+
+                // Raycasting (drag planes and scratch vectors are allocated once)
                 const raycaster = new THREE.Raycaster();
                 const mouse = new THREE.Vector2();
                 let isDragging = false;
                 let dragTarget = null;
+                let hoverTarget = null;
                 let dragStartMouse = new THREE.Vector2();
                 let dragStartDistance = 1.0;
                 const intersection = new THREE.Vector3();
-                
+                const azimuthPlane = new THREE.Plane(new THREE.Vector3(0, 1, 0), -0.05);
+                const elevationPlane = new THREE.Plane(new THREE.Vector3(1, 0, 0), -0.8);
+
                 const canvas = renderer.domElement;
-                
-                canvas.addEventListener('mousedown', (e) => {
+
+                function setMouse(clientX, clientY) {
                     const rect = canvas.getBoundingClientRect();
-                    mouse.x = ((e.clientX - rect.left) / rect.width) * 2 - 1;
-                    mouse.y = -((e.clientY - rect.top) / rect.height) * 2 + 1;
-                    
+                    mouse.x = ((clientX - rect.left) / rect.width) * 2 - 1;
+                    mouse.y = -((clientY - rect.top) / rect.height) * 2 + 1;
                     raycaster.setFromCamera(mouse, camera);
-                    const intersects = raycaster.intersectObjects([azimuthHandle, elevationHandle, distanceHandle]);
-                    
-                    if (intersects.length > 0) {
-                        isDragging = true;
-                        dragTarget = intersects[0].object;
-                        dragTarget.material.emissiveIntensity = 1.0;
-                        dragTarget.scale.setScalar(1.3);
-                        dragStartMouse.copy(mouse);
-                        dragStartDistance = distanceFactor;
+                }
+
+                function startDrag() {
+                    const intersects = raycaster.intersectObjects(handles);
+                    if (intersects.length === 0) return false;
+                    isDragging = true;
+                    dragTarget = intersects[0].object;
+                    dragTarget.material.emissiveIntensity = 1.0;
+                    dragTarget.scale.setScalar(1.3);
+                    dragStartMouse.copy(mouse);
+                    dragStartDistance = distanceFactor;
+                    requestRender();
+                    return true;
+                }
+
+                function drag() {
+                    if (dragTarget.userData.type === 'azimuth') {
+                        if (raycaster.ray.intersectPlane(azimuthPlane, intersection)) {
+                            azimuthAngle = THREE.MathUtils.radToDeg(Math.atan2(intersection.x, intersection.z));
+                            if (azimuthAngle < 0) azimuthAngle += 360;
+                        }
+                    } else if (dragTarget.userData.type === 'elevation') {
+                        if (raycaster.ray.intersectPlane(elevationPlane, intersection)) {
+                            const relY = intersection.y - CENTER.y;
+                            const relZ = intersection.z;
+                            elevationAngle = THREE.MathUtils.clamp(THREE.MathUtils.radToDeg(Math.atan2(relY, relZ)), -30, 60);
+                        }
+                    } else if (dragTarget.userData.type === 'distance') {
+                        const deltaY = mouse.y - dragStartMouse.y;
+                        distanceFactor = THREE.MathUtils.clamp(dragStartDistance - deltaY * 1.5, 0.6, 1.4);
+                    }
+                    updatePositions();
+                }
+
+                canvas.addEventListener('mousedown', (e) => {
+                    setMouse(e.clientX, e.clientY);
+                    if (startDrag()) {
                         canvas.style.cursor = 'grabbing';
                     }
                 });
-                
+
                 canvas.addEventListener('mousemove', (e) => {
-                    const rect = canvas.getBoundingClientRect();
-                    mouse.x = ((e.clientX - rect.left) / rect.width) * 2 - 1;
-                    mouse.y = -((e.clientY - rect.top) / rect.height) * 2 + 1;
-                    
+                    setMouse(e.clientX, e.clientY);
+
                     if (isDragging && dragTarget) {
-                        raycaster.setFromCamera(mouse, camera);
-                        
-                        if (dragTarget.userData.type === 'azimuth') {
-                            const plane = new THREE.Plane(new THREE.Vector3(0, 1, 0), -0.05);
-                            if (raycaster.ray.intersectPlane(plane, intersection)) {
-                                azimuthAngle = THREE.MathUtils.radToDeg(Math.atan2(intersection.x, intersection.z));
-                                if (azimuthAngle < 0) azimuthAngle += 360;
-                            }
-                        } else if (dragTarget.userData.type === 'elevation') {
-                            const plane = new THREE.Plane(new THREE.Vector3(1, 0, 0), -0.8);
-                            if (raycaster.ray.intersectPlane(plane, intersection)) {
-                                const relY = intersection.y - CENTER.y;
-                                const relZ = intersection.z;
-                                elevationAngle = THREE.MathUtils.clamp(THREE.MathUtils.radToDeg(Math.atan2(relY, relZ)), -30, 60);
-                            }
-                        } else if (dragTarget.userData.type === 'distance') {
-                            const deltaY = mouse.y - dragStartMouse.y;
-                            distanceFactor = THREE.MathUtils.clamp(dragStartDistance - deltaY * 1.5, 0.6, 1.4);
-                        }
-                        updatePositions();
+                        drag();
+                        return;
+                    }
+                    // Hover highlight; only re-render when the hovered handle changes
+                    const intersects = raycaster.intersectObjects(handles);
+                    const hovered = intersects.length > 0 ? intersects[0].object : null;
+                    if (hovered === hoverTarget) return;
+                    hoverTarget = hovered;
+                    handles.forEach(h => {
+                        h.material.emissiveIntensity = 0.5;
+                        h.scale.setScalar(1);
+                    });
+                    if (hovered) {
+                        hovered.material.emissiveIntensity = 0.8;
+                        hovered.scale.setScalar(1.1);
+                        canvas.style.cursor = 'grab';
                     } else {
-                        raycaster.setFromCamera(mouse, camera);
-                        const intersects = raycaster.intersectObjects([azimuthHandle, elevationHandle, distanceHandle]);
-                        [azimuthHandle, elevationHandle, distanceHandle].forEach(h => {
-                            h.material.emissiveIntensity = 0.5;
-                            h.scale.setScalar(1);
-                        });
-                        if (intersects.length > 0) {
-                            intersects[0].object.material.emissiveIntensity = 0.8;
-                            intersects[0].object.scale.setScalar(1.1);
-                            canvas.style.cursor = 'grab';
-                        } else {
-                            canvas.style.cursor = 'default';
-                        }
+                        canvas.style.cursor = 'default';
                     }
+                    requestRender();
                 });
-                
+
                 const onMouseUp = () => {
                     if (dragTarget) {
                         dragTarget.material.emissiveIntensity = 0.5;
                         dragTarget.scale.setScalar(1);
-                        
+                        hoverTarget = null;
+
                         // Snap and animate
                         const targetAz = snapToNearest(azimuthAngle, azimuthSteps);
                         const targetEl = snapToNearest(elevationAngle, elevationSteps);
                         const targetDist = snapToNearest(distanceFactor, distanceSteps);
-                        
+
                         const startAz = azimuthAngle, startEl = elevationAngle, startDist = distanceFactor;
                         const startTime = Date.now();
-                        
+
                         function animateSnap() {
                             const t = Math.min((Date.now() - startTime) / 200, 1);
                             const ease = 1 - Math.pow(1 - t, 3);
-                            
+
                             let azDiff = targetAz - startAz;
                             if (azDiff > 180) azDiff -= 360;
                             if (azDiff < -180) azDiff += 360;
                             azimuthAngle = startAz + azDiff * ease;
                             if (azimuthAngle < 0) azimuthAngle += 360;
                             if (azimuthAngle >= 360) azimuthAngle -= 360;
-                            
+
                             elevationAngle = startEl + (targetEl - startEl) * ease;
                             distanceFactor = startDist + (targetDist - startDist) * ease;
-                            
+
                             updatePositions();
                             if (t < 1) requestAnimationFrame(animateSnap);
                             else updatePropsAndTrigger();
@@ -375,7 +413,7 @@ class CameraControl3D(gr.HTML):
                     dragTarget = null;
                     canvas.style.cursor = 'default';
                 };
-                
+
                 canvas.addEventListener('mouseup', onMouseUp);
                 canvas.addEventListener('mouseleave', onMouseUp);
 
@@ -383,116 +421,108 @@ class CameraControl3D(gr.HTML):
                 canvas.addEventListener('touchstart', (e) => {
                     e.preventDefault();
                     const touch = e.touches[0];
-                    const rect = canvas.getBoundingClientRect();
-                    mouse.x = ((touch.clientX - rect.left) / rect.width) * 2 - 1;
-                    mouse.y = -((touch.clientY - rect.top) / rect.height) * 2 + 1;
-                    
-                    raycaster.setFromCamera(mouse, camera);
-                    const intersects = raycaster.intersectObjects([azimuthHandle, elevationHandle, distanceHandle]);
-                    
-                    if (intersects.length > 0) {
-                        isDragging = true;
-                        dragTarget = intersects[0].object;
-                        dragTarget.material.emissiveIntensity = 1.0;
-                        dragTarget.scale.setScalar(1.3);
-                        dragStartMouse.copy(mouse);
-                        dragStartDistance = distanceFactor;
-                    }
+                    setMouse(touch.clientX, touch.clientY);
+                    startDrag();
                 }, { passive: false });
-                
+
                 canvas.addEventListener('touchmove', (e) => {
                     e.preventDefault();
                     const touch = e.touches[0];
-                    const rect = canvas.getBoundingClientRect();
-                    mouse.x = ((touch.clientX - rect.left) / rect.width) * 2 - 1;
-                    mouse.y = -((touch.clientY - rect.top) / rect.height) * 2 + 1;
-                    
+                    setMouse(touch.clientX, touch.clientY);
                     if (isDragging && dragTarget) {
-                        raycaster.setFromCamera(mouse, camera);
-                        
-                        if (dragTarget.userData.type === 'azimuth') {
-                            const plane = new THREE.Plane(new THREE.Vector3(0, 1, 0), -0.05);
-                            if (raycaster.ray.intersectPlane(plane, intersection)) {
-                                azimuthAngle = THREE.MathUtils.radToDeg(Math.atan2(intersection.x, intersection.z));
-                                if (azimuthAngle < 0) azimuthAngle += 360;
-                            }
-                        } else if (dragTarget.userData.type === 'elevation') {
-                            const plane = new THREE.Plane(new THREE.Vector3(1, 0, 0), -0.8);
-                            if (raycaster.ray.intersectPlane(plane, intersection)) {
-                                const relY = intersection.y - CENTER.y;
-                                const relZ = intersection.z;
-                                elevationAngle = THREE.MathUtils.clamp(THREE.MathUtils.radToDeg(Math.atan2(relY, relZ)), -30, 60);
-                            }
-                        } else if (dragTarget.userData.type === 'distance') {
-                            const deltaY = mouse.y - dragStartMouse.y;
-                            distanceFactor = THREE.MathUtils.clamp(dragStartDistance - deltaY * 1.5, 0.6, 1.4);
-                        }
-                        updatePositions();
+                        drag();
                     }
                 }, { passive: false });
-                
+
                 canvas.addEventListener('touchend', (e) => {
                     e.preventDefault();
                     onMouseUp();
                 }, { passive: false });
-                
+
                 canvas.addEventListener('touchcancel', (e) => {
                     e.preventDefault();
                     onMouseUp();
                 }, { passive: false });
-                
+
                 // Initial update
                 updatePositions();
-                
-                // Render loop
-                function render() {
-                    requestAnimationFrame(render);
-                    renderer.render(scene, camera);
-                }
-                render();
-                
-                // Handle resize
-                new ResizeObserver(() => {
-                    camera.aspect = wrapper.clientWidth / wrapper.clientHeight;
-                    camera.updateProjectionMatrix();
-                    renderer.setSize(wrapper.clientWidth, wrapper.clientHeight);
-                }).observe(wrapper);
-                
-                // Store update functions for external calls
-                wrapper._updateFromProps = (newVal) => {
+
+                function applyValue(newVal) {
                     if (newVal && typeof newVal === 'object') {
                         azimuthAngle = newVal.azimuth ?? azimuthAngle;
                         elevationAngle = newVal.elevation ?? elevationAngle;
                         distanceFactor = newVal.distance ?? distanceFactor;
                         updatePositions();
                     }
-                };
-                
+                }
+
+                // Store update functions for external calls
+                wrapper._updateFromProps = applyValue;
                 wrapper._updateTexture = updateTextureFromUrl;
-                
-                // Watch for prop changes (imageUrl and value)
-                let lastImageUrl = props.imageUrl;
-                let lastValue = JSON.stringify(props.value);
-                setInterval(() => {
-                    // Check imageUrl changes
-                    if (props.imageUrl !== lastImageUrl) {
-                        lastImageUrl = props.imageUrl;
-                        updateTextureFromUrl(props.imageUrl);
+
+                // Watch for prop changes (imageUrl and value). Assignments are intercepted
+                // with accessors so updates apply immediately; if props is a proxy that
+                // refuses accessors, fall back to a cheap visible-only check.
+                const watched = {
+                    imageUrl: { last: props.imageUrl, apply: updateTextureFromUrl, same: (a, b) => a === b },
+                    value: {
+                        last: props.value,
+                        apply: applyValue,
+                        same: (a, b) => a === b || (!!a && !!b && a.azimuth === b.azimuth && a.elevation === b.elevation && a.distance === b.distance),
+                    },
+                };
+                function onPropChange(name, current) {
+                    const entry = watched[name];
+                    if (entry.same(entry.last, current)) return;
+                    entry.last = current;
+                    entry.apply(current);
+                }
+                let pollTimer = null;
+                try {
+                    for (const name of Object.keys(watched)) {
+                        let current = props[name];
+                        Object.defineProperty(props, name, {
+                            configurable: true,
+                            enumerable: true,
+                            get: () => current,
+                            set: (v) => { current = v; onPropChange(name, v); },
+                        });
                     }
-                    // Check value changes (from sliders)
-                    const currentValue = JSON.stringify(props.value);
-                    if (currentValue !== lastValue) {
-                        lastValue = currentValue;
-                        if (props.value && typeof props.value === 'object') {
-                            azimuthAngle = props.value.azimuth ?? azimuthAngle;
-                            elevationAngle = props.value.elevation ?? elevationAngle;
-                            distanceFactor = props.value.distance ?? distanceFactor;
-                            updatePositions();
-                        }
+                } catch (err) {
+                    pollTimer = setInterval(() => {
+                        if (document.hidden) return;
+                        for (const name of Object.keys(watched)) onPropChange(name, props[name]);
+                    }, 250);
+                }
+
+                // Release GPU resources once Gradio removes the component from the page
+                function dispose() {
+                    if (pollTimer !== null) clearInterval(pollTimer);
+                    resizeObserver.disconnect();
+                    const textures = new Set([placeholderTexture, planeMaterial.map]);
+                    scene.traverse((obj) => {
+                        if (obj.geometry) obj.geometry.dispose();
+                        if (obj.material) obj.material.dispose();
+                    });
+                    textures.forEach((texture) => texture && texture.dispose());
+                    renderer.dispose();
+                }
+
+                // Handle resize
+                const resizeObserver = new ResizeObserver(() => {
+                    if (!wrapper.isConnected) {
+                        dispose();
+                        return;
                     }
-                }, 100);
+                    if (!wrapper.clientWidth || !wrapper.clientHeight) return;
+                    camera.aspect = wrapper.clientWidth / wrapper.clientHeight;
+                    camera.updateProjectionMatrix();
+                    renderer.setSize(wrapper.clientWidth, wrapper.clientHeight);
+                    requestRender();
+                });
+                resizeObserver.observe(wrapper);
             };
-            
+
             initScene();
         })();
         """
@@ -0,0 +1,271 @@
+"""
+Headless batch rendering of camera angles.
+
+Streams a directory or JSONL manifest of images through the same generation
+path as the UI: images are decoded (and, with QIE_BUCKETS, resized to their
+bucket) on loader threads ahead of time, the main thread keeps the pipeline
+busy (or, with --workers, keeps every worker replica busy with concurrent
+chunks), and PNG/WebP encoding + writes run on writer threads. Outputs that already exist are skipped, so an interrupted
+run resumes where it stopped.
+
+Examples:
+    python batch.py photos/ -o renders/ --poses turnaround
+    python batch.py --manifest catalog.jsonl -o renders/ --format webp
+
+Manifest lines are JSON objects:
+    {"image": "a.jpg", "name": "sku123", "seed": 7, "poses": [[0, 0, 1.0], [90, 30, 0.6]]}
+Only "image" is required; missing fields fall back to the command-line options.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+
+# Named pose sets for --poses
+POSE_PRESETS = {
+    "front": [(0, 0, 1.0)],
+    "turnaround": [(az, 0, 1.0) for az in app.AZIMUTH_MAP],
+    "grid": [(az, el, 1.0) for el in app.ELEVATION_MAP for az in app.AZIMUTH_MAP],
+}
+
+
+def parse_poses(spec: str) -> list:
+    """Parse a preset name or "az,el,dist;az,el,dist;..." into pose tuples."""
+    if spec in POSE_PRESETS:
+        return POSE_PRESETS[spec]
+    poses = []
+    for part in spec.split(";"):
+        az, el, dist = (float(v) for v in part.split(","))
+        poses.append((az, el, dist))
+    return poses
+
+
+def snap_pose(pose) -> tuple:
+    """Snap a pose to the values the LoRA prompt actually distinguishes."""
+    az, el, dist = pose
+    return (
+        app.snap_to_nearest(az, list(app.AZIMUTH_MAP)),
+        app.snap_to_nearest(el, list(app.ELEVATION_MAP)),
+        app.snap_to_nearest(dist, list(app.DISTANCE_MAP)),
+    )
+
+
+def output_path(out_dir: str, name: str, pose, fmt: str) -> str:
+    az, el, dist = snap_pose(pose)
+    return os.path.join(out_dir, f"{name}_az{int(az):03d}_el{int(el):+03d}_d{dist:.1f}.{fmt}")
+
+
+def collect_items(args) -> list:
+    """Build the work list: dicts with image, name, seed and poses."""
+    default_poses = parse_poses(args.poses)
+    items = []
+    if args.manifest:
+        base_dir = os.path.dirname(os.path.abspath(args.manifest))
+        with open(args.manifest, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                image_path = os.path.join(base_dir, entry["image"])
+                items.append({
+                    "image": image_path,
+                    "name": entry.get("name") or os.path.splitext(os.path.basename(image_path))[0],
+                    "seed": int(entry.get("seed", args.seed)),
+                    "poses": [tuple(p) for p in entry["poses"]] if "poses" in entry else default_poses,
+                })
+    else:
+        for file_name in sorted(os.listdir(args.input)):
+            if os.path.splitext(file_name)[1].lower() in IMAGE_EXTENSIONS:
+                items.append({
+                    "image": os.path.join(args.input, file_name),
+                    "name": os.path.splitext(file_name)[0],
+                    "seed": args.seed,
+                    "poses": default_poses,
+                })
+    return items
+
+
+def pending_poses(item: dict, args) -> list:
+    """Poses of an item whose output does not exist yet (resume support)."""
+    poses = dict.fromkeys(map(snap_pose, item["poses"]))
+    return [p for p in poses if not os.path.exists(output_path(args.output, item["name"], p, args.format))]
+
+
+def load_item(item: dict, args) -> dict:
+    """
+    Decode and normalize the input image and work out the output size (runs on
+    loader threads). With resolution buckets the image is also resized to its
+    bucket here, so generate_views finds it already snapped; otherwise the
+    pipeline resizes it.
+    """
+    image = app.to_pil_rgb(item["image"])
+    width, height = app.update_dimensions_on_upload(image)
+    width, height = args.width or width, args.height or height
+    if app.resolution_buckets is not None:
+        image = app.resolution_buckets.snap(image, height, width, count=False)[0]
+    return dict(item, pil_image=image, width=width, height=height)
+
+
+def prefetch(items: list, args, failures: list):
+    """
+    Yield loaded items in order while up to args.prefetch upcoming ones decode
+    in the background. Items that fail to load are skipped and added to `failures`.
+    """
+    with ThreadPoolExecutor(max_workers=args.loaders, thread_name_prefix="loader") as pool:
+        queue = deque()
+        remaining = iter(items)
+        for item in remaining:
+            queue.append((item, pool.submit(load_item, item, args)))
+            if len(queue) >= args.prefetch:
+                break
+        while queue:
+            item, future = queue.popleft()
+            upcoming = next(remaining, None)
+            if upcoming is not None:
+                queue.append((upcoming, pool.submit(load_item, upcoming, args)))
+            try:
+                yield future.result()
+            except Exception as e:
+                print(f"[skip] {item['image']}: {e}")
+                failures.append((item["image"], e))
+
+
+def save_image(image, path: str, fmt: str, quality: int):
+    """Encode and write atomically so a crash never leaves a truncated output behind."""
+    tmp = f"{path}.tmp"
+    if fmt == "webp":
+        image.save(tmp, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(tmp, format="PNG", compress_level=4)
+    os.replace(tmp, path)
+
+
+def run(args) -> int:
+    """Render every pending view; returns the number of images or views that failed."""
+    os.makedirs(args.output, exist_ok=True)
+    items = collect_items(args)
+    work = []
+    skipped = 0
+    for item in items:
+        poses = pending_poses(item, args)
+        skipped += len(set(map(snap_pose, item["poses"]))) - len(poses)
+        if poses:
+            work.append(dict(item, poses=poses))
+    total = sum(len(item["poses"]) for item in work)
+    print(f"{len(items)} images, {total} views to render ({skipped} already done)")
+    if not work:
+        return 0
+
+    if app.worker_pool is not None:
+        app.worker_pool.start()
+    else:
+        # Start loading weights while the first images decode
+        app.pipeline_factory.start_background_load()
+
+    # Bound in-flight writes so finished images cannot pile up in memory
+    write_slots = threading.BoundedSemaphore(args.writers * 4)
+    errors = []
+    failures = []
+
+    def write(image, path):
+        try:
+            save_image(image, path, args.format, args.quality)
+        except Exception as e:
+            errors.append((path, e))
+        finally:
+            write_slots.release()
+
+    done = 0
+    progress_lock = threading.Lock()
+    start = time.perf_counter()
+
+    def render(item, poses, chunk, batch_size):
+        nonlocal done
+        try:
+            images = app.generate_views(
+                item["pil_image"], chunk, item["seed"], args.guidance_scale, args.steps,
+                item["height"], item["width"], owner="batch", batch_limit=batch_size,
+            )
+        except Exception as e:
+            # One bad item (OOM, odd size, ...) must not abort the whole catalog; rerunning resumes it
+            print(f"[error] {item['name']}: {len(chunk)} view(s) failed: {type(e).__name__}: {e}")
+            failures.extend((item["name"], e) for _ in chunk)
+            return
+        for pose, image in zip(poses, images):
+            write_slots.acquire()
+            writers.submit(write, image, output_path(args.output, item["name"], pose, args.format))
+        with progress_lock:
+            done += len(images)
+            elapsed = time.perf_counter() - start
+            print(f"[{done}/{total}] {item['name']} ({done / elapsed:.2f} views/s)")
+
+    # Chunks in flight at once: enough to keep every worker replica busy, else one (the pipeline is serial)
+    dispatch = app.worker_pool.concurrency() if app.worker_pool is not None else 1
+    dispatch_slots = threading.BoundedSemaphore(dispatch)
+    with ThreadPoolExecutor(max_workers=args.writers, thread_name_prefix="writer") as writers, \
+            ThreadPoolExecutor(max_workers=dispatch, thread_name_prefix="dispatch") as dispatcher:
+        for item in prefetch(work, args, failures):
+            prompts = [app.build_camera_prompt(*pose) for pose in item["poses"]]
+            batch_size = args.batch_size or app.multi_view_batch_size(item["height"], item["width"])
+            for offset in range(0, len(prompts), batch_size):
+                dispatch_slots.acquire()
+                future = dispatcher.submit(
+                    render, item, item["poses"][offset:offset + batch_size], prompts[offset:offset + batch_size], batch_size,
+                )
+                future.add_done_callback(lambda _: dispatch_slots.release())
+
+    for path, e in errors:
+        print(f"[error] could not write {path}: {e}")
+    print(f"Finished {done} views in {time.perf_counter() - start:.1f}s")
+    if failures or errors:
+        print(f"{len(failures)} view(s)/image(s) failed and {len(errors)} write(s) failed; rerun to retry them")
+    return len(failures) + len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render camera angles for many images without the UI.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("input", nargs="?", help="Directory of input images")
+    source.add_argument("--manifest", help="JSONL manifest of images and camera poses")
+    parser.add_argument("-o", "--output", required=True, help="Output directory")
+    parser.add_argument("--poses", default="turnaround", help="Preset (front, turnaround, grid) or 'az,el,dist;...'")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--guidance-scale", type=float, default=1.0)
+    parser.add_argument("--width", type=int, default=0, help="Output width (default: from the input aspect ratio)")
+    parser.add_argument("--height", type=int, default=0, help="Output height (default: from the input aspect ratio)")
+    parser.add_argument("--batch-size", type=int, default=0, help="Views per pipeline call (0: from the pixel budget)")
+    parser.add_argument("--format", choices=["png", "webp"], default="png")
+    parser.add_argument("--quality", type=int, default=95, help="WebP quality")
+    parser.add_argument("--loaders", type=int, default=2, help="Image decode threads")
+    parser.add_argument("--prefetch", type=int, default=4, help="Images decoded ahead of generation")
+    parser.add_argument("--writers", type=int, default=2, help="Encode/write threads")
+    parser.add_argument("--device", choices=["auto", "cpu", "cuda"], default=None)
+    parser.add_argument("--quant", choices=["auto", *app.QUANT_PROFILES], default=None, help="GGUF quantization profile")
+    parser.add_argument("--memory-budget-gb", type=float, default=None, help="Memory available to the model for --quant auto")
+    parser.add_argument("--offline", action="store_true", help="Load only from the local model store")
+    parser.add_argument("--workers", default=None, help="Comma-separated worker.py URLs to render on (same as QIE_WORKERS)")
+    args = parser.parse_args()
+
+    if args.device and args.device != app.DEVICE_MODE:
+        app.configure_execution(args.device)
+    if args.device or args.quant or args.memory_budget_gb:
+        app.configure_quantization(args.quant, args.memory_budget_gb)
+    if args.offline:
+        app.model_store.offline = True
+    if args.workers:
+        app.worker_pool = app.WorkerPool(app.parse_worker_urls(args.workers))
+    if run(args):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Offline performance benchmark.
+
+Runs the real generation path (infer_camera_edit / infer_multi_view and the
+caches and scheduler behind them) against a tiny, randomly initialized
+QwenImageEditPlusPipeline, so it needs no downloads and finishes in minutes on
+a CPU. Absolute numbers say nothing about the real model; compare runs of the
+same benchmark before and after a change (diffusers bump, offload settings,
+caching changes, ...).
+
+Examples:
+    python benchmark.py -o bench.json
+    python benchmark.py -o new.json --baseline bench.json --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from collections import defaultdict
+
+import numpy as np
+import torch
+
+from PIL import Image
+
+# Stage timings collected by the wrappers installed in instrument_pipeline()
+STAGE_TIMES = defaultdict(list)
+
+
+def write_tiny_tokenizer(directory: str):
+    """Write a byte-level BPE vocabulary (no merges) that Qwen2Tokenizer can load."""
+    from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+
+    vocab = {ch: i for i, ch in enumerate(bytes_to_unicode().values())}
+    vocab_file = os.path.join(directory, "vocab.json")
+    merges_file = os.path.join(directory, "merges.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(merges_file, "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+    return vocab_file, merges_file
+
+
+def build_tiny_pipeline(seed: int = 0):
+    """
+    Build a QwenImageEditPlusPipeline with the real component classes at toy
+    sizes (2-layer transformer, 4-channel VAE, 2-layer Qwen2.5-VL encoder).
+    """
+    import app
+    from diffusers import AutoencoderKLQwenImage, FlowMatchEulerDiscreteScheduler, QwenImageEditPlusPipeline, QwenImageTransformer2DModel
+    from transformers import Qwen2_5_VLConfig, Qwen2_5_VLForConditionalGeneration, Qwen2Tokenizer, Qwen2VLImageProcessor, Qwen2VLProcessor
+
+    tokenizer_dir = tempfile.mkdtemp(prefix="qie-tiny-tokenizer-")
+    vocab_file, merges_file = write_tiny_tokenizer(tokenizer_dir)
+    tokenizer = Qwen2Tokenizer(
+        vocab_file, merges_file, unk_token="<|endoftext|>", eos_token="<|endoftext|>", pad_token="<|endoftext|>"
+    )
+    tokenizer.add_special_tokens({"additional_special_tokens": [
+        "<|im_start|>", "<|im_end|>", "<|vision_start|>", "<|vision_end|>", "<|image_pad|>", "<|video_pad|>",
+    ]})
+    processor_kwargs = {"image_processor": Qwen2VLImageProcessor(), "tokenizer": tokenizer}
+    try:
+        from transformers import Qwen2VLVideoProcessor
+        processor_kwargs["video_processor"] = Qwen2VLVideoProcessor()
+    except ImportError:
+        pass
+    processor = Qwen2VLProcessor(**processor_kwargs)
+
+    torch.manual_seed(seed)
+    hidden_size = 16
+    token_ids = {
+        "image_token_id": tokenizer.convert_tokens_to_ids("<|image_pad|>"),
+        "video_token_id": tokenizer.convert_tokens_to_ids("<|video_pad|>"),
+        "vision_start_token_id": tokenizer.convert_tokens_to_ids("<|vision_start|>"),
+        "vision_end_token_id": tokenizer.convert_tokens_to_ids("<|vision_end|>"),
+    }
+    config = Qwen2_5_VLConfig(
+        text_config={
+            "hidden_size": hidden_size,
+            "intermediate_size": hidden_size,
+            "num_hidden_layers": 2,
+            "num_attention_heads": 2,
+            "num_key_value_heads": 2,
+            "vocab_size": len(tokenizer),
+            "rope_scaling": {"mrope_section": [1, 1, 2], "rope_type": "default", "type": "default"},
+            "rope_theta": 1000000.0,
+        },
+        vision_config={"depth": 2, "hidden_size": hidden_size, "intermediate_size": hidden_size, "num_heads": 2, "out_hidden_size": hidden_size},
+        hidden_size=hidden_size,
+        vocab_size=len(tokenizer),
+        **token_ids,
+    )
+    text_encoder = Qwen2_5_VLForConditionalGeneration(config)
+
+    transformer = QwenImageTransformer2DModel(
+        patch_size=2,
+        in_channels=16,
+        out_channels=4,
+        num_layers=2,
+        attention_head_dim=16,
+        num_attention_heads=3,
+        joint_attention_dim=hidden_size,
+        guidance_embeds=False,
+        axes_dims_rope=(8, 4, 4),
+    )
+    z_dim = 4
+    vae = AutoencoderKLQwenImage(
+        base_dim=z_dim * 6,
+        z_dim=z_dim,
+        dim_mult=[1, 2, 4],
+        num_res_blocks=1,
+        temperal_downsample=[False, True],
+        latents_mean=[0.0] * z_dim,
+        latents_std=[1.0] * z_dim,
+    )
+
+    pipe = QwenImageEditPlusPipeline(
+        scheduler=FlowMatchEulerDiscreteScheduler(),
+        vae=vae,
+        text_encoder=text_encoder,
+        tokenizer=tokenizer,
+        processor=processor,
+        transformer=transformer,
+    )
+    pipe.to(app.device, app.dtype)
+    pipe.set_progress_bar_config(disable=True)
+    app.install_tiled_decode(pipe)
+    app.install_step_cache(pipe)
+    instrument_pipeline(pipe)
+    app.install_vae_latent_cache(pipe)
+    return pipe
+
+
+def timed(stage: str, fn):
+    """Wrap fn so each call's wall time (device-synchronized) is appended to STAGE_TIMES[stage]."""
+    def wrapper(*args, **kwargs):
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        out = fn(*args, **kwargs)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        STAGE_TIMES[stage].append((time.perf_counter() - start) * 1000)
+        return out
+    return wrapper
+
+
+def instrument_pipeline(pipe):
+    """Time prompt encoding, VAE encode, each transformer forward (= one step without CFG) and VAE decode."""
+    pipe.encode_prompt = timed("prompt_encode_ms", pipe.encode_prompt)
+    pipe._encode_vae_image = timed("vae_encode_ms", pipe._encode_vae_image)
+    pipe.transformer.forward = timed("denoise_step_ms", pipe.transformer.forward)
+    pipe.vae.decode = timed("vae_decode_ms", pipe.vae.decode)
+
+
+def random_image(size: int, rng: np.random.Generator) -> Image.Image:
+    """A fresh noise image, so content-addressed caches never hit unless a test wants them to."""
+    return Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8))
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def single_view(app, image, size: int, common: dict):
+    """Run one single-view request to completion (infer_camera_edit streams previews first)."""
+    for output in app.infer_camera_edit(image, height=size, width=size, **common):
+        pass
+    return output
+
+
+def summarize(values: list) -> dict:
+    return {
+        "mean": statistics.fmean(values),
+        "p50": statistics.median(values),
+        "min": min(values),
+        "max": max(values),
+        "n": len(values),
+    }
+
+
+def run_benchmark(args) -> dict:
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+    }
+
+    start = time.perf_counter()
+    import app
+    import diffusers
+    results["meta"]["diffusers"] = diffusers.__version__
+    results["meta"]["device"] = app.device
+    results["meta"]["dtype"] = str(app.dtype).removeprefix("torch.")
+    import_ms = (time.perf_counter() - start) * 1000
+
+    app.pipeline_factory = app.PipelineFactory(build_tiny_pipeline)
+    start = time.perf_counter()
+    app.pipeline_factory.get()
+    results["cold_start"] = {"import_ms": import_ms, "pipeline_build_ms": (time.perf_counter() - start) * 1000}
+
+    rng = np.random.default_rng(0)
+    common = {"num_inference_steps": args.steps, "guidance_scale": 1.0}
+
+    # Warm up kernels and allocators before anything is measured
+    single_view(app, random_image(args.image_size, rng), args.resolutions[0], common)
+    STAGE_TIMES.clear()
+
+    # Per-stage latency of single-view requests on fresh images (all caches miss)
+    totals = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        single_view(app, random_image(args.image_size, rng), args.resolutions[0], common)
+        totals.append((time.perf_counter() - start) * 1000)
+    results["stages"] = {stage: summarize(values) for stage, values in STAGE_TIMES.items()}
+    results["stages"]["request_total_ms"] = summarize(totals)
+
+    # Same image and pose again: the VAE latent and prompt embedding caches hit
+    image = random_image(args.image_size, rng)
+    single_view(app, image, args.resolutions[0], common)
+    repeats = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        single_view(app, image, args.resolutions[0], common)
+        repeats.append((time.perf_counter() - start) * 1000)
+    results["stages"]["cached_request_total_ms"] = summarize(repeats)
+
+    # Throughput across resolutions and batch sizes
+    poses = [(az, 0, 1.0) for az in app.AZIMUTH_MAP]
+    throughput = {}
+    for resolution in args.resolutions:
+        for batch_size in args.batch_sizes:
+            views = 0
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                results_batch, _ = app.infer_multi_view(
+                    random_image(args.image_size, rng), poses[:batch_size],
+                    height=resolution, width=resolution, max_batch_size=batch_size, **common,
+                )
+                views += len(results_batch)
+            elapsed = time.perf_counter() - start
+            throughput[f"{resolution}px_batch{batch_size}"] = {"images_per_s": views / elapsed}
+    results["throughput"] = throughput
+
+    results["memory"] = {"peak_rss_mb": peak_rss_mb()}
+    if torch.cuda.is_available():
+        results["memory"]["peak_cuda_mb"] = torch.cuda.max_memory_allocated() / 1024 / 1024
+    return results
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """Flatten nested numeric results into {"a.b.c": value}."""
+    flat = {}
+    for key, value in results.items():
+        if key == "meta":
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and key not in ("n", "min", "max"):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Print a comparison table and return the metrics that regressed by more than `tolerance`."""
+    current_flat, baseline_flat = flatten(current), flatten(baseline)
+    regressions = []
+    print(f"{'metric':<55} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(current_flat.keys() & baseline_flat.keys()):
+        old, new = baseline_flat[name], current_flat[name]
+        if old == 0:
+            continue
+        change = (new - old) / old
+        higher_is_better = "per_s" in name
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        marker = "  <-- regression" if regressed else ""
+        print(f"{name:<55} {old:>12.2f} {new:>12.2f} {change:>+7.1%}{marker}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against a tiny stand-in pipeline.")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative change counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--image-size", type=int, default=512, help="Side of the random input images")
+    parser.add_argument("--resolutions", default="256,512", help="Comma-separated output sizes")
+    parser.add_argument("--batch-sizes", default="1,4", help="Comma-separated multi-view batch sizes")
+    args = parser.parse_args()
+    args.resolutions = [int(v) for v in args.resolutions.split(",")]
+    args.batch_sizes = [int(v) for v in args.batch_sizes.split(",")]
+
+    # Keep the benchmark's cache entries out of the real cache directory
+    os.environ.setdefault("QIE_CACHE_DIR", tempfile.mkdtemp(prefix="qie-bench-cache-"))
+
+    results = run_benchmark(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Cancellation against the tiny stand-in pipeline from benchmark.py (no downloads).
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+import app  # noqa: E402
+import benchmark  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def tiny_pipe():
+    original = app.pipeline_factory
+    app.pipeline_factory = app.PipelineFactory(benchmark.build_tiny_pipeline)
+    yield app.pipeline_factory.get()
+    app.pipeline_factory = original
+
+
+def test_cancel_mid_run_frees_model_hooks(tiny_pipe, monkeypatch):
+    freed = []
+    monkeypatch.setattr(tiny_pipe, "maybe_free_model_hooks", lambda: freed.append(True))
+    cancel_event = threading.Event()
+    steps = []
+
+    def on_preview(preview):
+        # Cancel after the first denoising step, so the call is aborted from inside the loop
+        steps.append(preview)
+        cancel_event.set()
+
+    monkeypatch.setattr(app, "PREVIEW_SIZE", 64)
+    image = benchmark.random_image(64, benchmark.np.random.default_rng(0))
+    with pytest.raises(app.GenerationCancelled):
+        app.run_pipeline(
+            image, app.image_hash(image), [app.build_camera_prompt(0, 0, 1.0)], [0], 1.0, 4, 64, 64,
+            on_preview=[on_preview], cancel_events=[cancel_event],
+        )
+    assert len(steps) == 1
+    assert freed
@@ -0,0 +1,54 @@
+"""
+Stage timing of CPU-offload transfers, which must survive the fresh hooks
+every pipeline call installs.
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+accelerate = pytest.importorskip("accelerate")
+
+import app  # noqa: E402
+import benchmark  # noqa: E402
+
+
+def test_offload_transfer_timed_with_new_hooks():
+    app.instrument_offload_hooks()
+    for _ in range(2):
+        # maybe_free_model_hooks() re-runs enable_model_cpu_offload(), which creates new hook instances
+        model = torch.nn.Linear(4, 4)
+        model, hook = accelerate.cpu_offload_with_hook(model, execution_device="cpu")
+        trace = app.StageTrace()
+        token = app._current_trace.set(trace)
+        try:
+            model(torch.zeros(1, 4))
+        finally:
+            app._current_trace.reset(token)
+        hook.remove()
+        assert "offload_transfer" in trace.stages
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="model CPU offload needs CUDA")
+def test_offload_transfer_recorded_on_every_generation():
+    original = app.pipeline_factory
+    app.pipeline_factory = app.PipelineFactory(benchmark.build_tiny_pipeline)
+    try:
+        pipe = app.pipeline_factory.get()
+        pipe.enable_model_cpu_offload()
+        app.install_instrumentation(pipe)
+        image = benchmark.random_image(64, benchmark.np.random.default_rng(0))
+        for seed in range(2):
+            trace = app.StageTrace()
+            app.run_pipeline(
+                image, app.image_hash(image), [app.build_camera_prompt(0, 0, 1.0)], [seed], 1.0, 2, 64, 64, trace=trace,
+            )
+            assert "offload_transfer" in trace.stages
+    finally:
+        app.pipeline_factory = original
@@ -0,0 +1,194 @@
+"""
+Pipeline replica for worker-pool mode.
+
+Each worker process loads its own pipeline and serves generations over a
+small HTTP/JSON protocol, so replicas can run on this machine (one per GPU or
+CPU set) or on other nodes. The UI dispatches to them with QIE_WORKERS /
+--workers, routing each request to the least loaded ready replica.
+
+Examples:
+    python worker.py --port 7901 --device cuda
+    python worker.py --replicas 2 --gpus 0,1 --base-port 7901
+    python worker.py --replicas 2 --device cpu --cpus "0-7;8-15" --base-port 7901
+    python app.py --workers http://127.0.0.1:7901,http://127.0.0.1:7902
+
+Protocol:
+    GET  /health    {"state", "ready", "pending", "inflight", "device", "quant", "compile"}
+    POST /generate  {"image_key", "prompts", "seed", "guidance_scale", "num_inference_steps",
+                     "height", "width", "owner", "batch_limit", ["image": base64 PNG]}
+                    -> {"images": [base64 PNG], "stages": {...}, "counters": {...}}
+Images are cached by key; a request for an unknown key answers
+{"error": "unknown_image"} and is retried with the image attached.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app
+
+# Decoded input images by key; orbiting one image only uploads it once
+image_cache = app.LRUCache(int(os.environ.get("QIE_WORKER_IMAGE_CACHE_BYTES", 256 * 1024 ** 2)), sizeof=lambda im: im.width * im.height * 3)
+
+_inflight = 0
+_inflight_lock = threading.Lock()
+
+
+def parse_cpus(spec: str) -> set:
+    """Parse "0-7,16-23" into a CPU id set."""
+    cpus = set()
+    for part in spec.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        elif part.strip():
+            cpus.add(int(part))
+    return cpus
+
+
+def health() -> dict:
+    scheduler = app.generation_scheduler
+    return {
+        "state": app.pipeline_factory.state,
+        "ready": app.pipeline_factory.ready,
+        # Queued only: the pool already counts its own requests in flight to this worker
+        "pending": scheduler.pending() if scheduler is not None else 0,
+        "inflight": _inflight,
+        "device": app.device,
+        "quant": app.QUANT_PROFILE.name,
+        "compile": app.compile_status.state,
+    }
+
+
+def generate(request: dict) -> dict:
+    global _inflight
+    pil_image = image_cache.get(request["image_key"])
+    if pil_image is None:
+        if "image" not in request:
+            return {"error": "unknown_image"}
+        pil_image = app.to_pil_rgb(app.decode_image(request["image"]))
+        image_cache.put(request["image_key"], pil_image)
+    trace = app.StageTrace()
+    with _inflight_lock:
+        _inflight += 1
+    try:
+        images = app.generate_views(
+            pil_image, request["prompts"], request["seed"], request["guidance_scale"], request["num_inference_steps"],
+            request["height"], request["width"], owner=request.get("owner"), batch_limit=request.get("batch_limit", 0),
+            trace=trace,
+        )
+    finally:
+        with _inflight_lock:
+            _inflight -= 1
+    return {
+        "images": [app.encode_image(image) for image in images],
+        "stages": trace.stages,
+        "counters": trace.counters,
+    }
+
+
+class WorkerHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, health())
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self.send_error(404)
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+        if not app.pipeline_factory.ready:
+            self._send_json(503, {"error": f"model {app.pipeline_factory.state}"})
+            return
+        try:
+            self._send_json(200, generate(request))
+        except Exception as e:
+            self._send_json(200, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(args):
+    app.pipeline_factory.start_background_load()
+    server = ThreadingHTTPServer((args.host, args.port), WorkerHandler)
+    print(f"Worker on http://{args.host}:{args.port} ({app.device}, {app.QUANT_PROFILE.name})")
+    server.serve_forever()
+
+
+def spawn(args):
+    """Start one worker process per replica, each on its own port, GPU and/or CPU set."""
+    gpus = args.gpus.split(",") if args.gpus else []
+    cpu_sets = args.cpus.split(";") if args.cpus else []
+    children = []
+    for i in range(args.replicas):
+        command = [sys.executable, os.path.abspath(__file__), "--host", args.host, "--port", str(args.base_port + i)]
+        env = dict(os.environ)
+        if gpus:
+            env["CUDA_VISIBLE_DEVICES"] = gpus[i % len(gpus)]
+        if cpu_sets:
+            command += ["--cpus", cpu_sets[i % len(cpu_sets)]]
+        for flag, value in (("--device", args.device), ("--quant", args.quant), ("--memory-budget-gb", args.memory_budget_gb)):
+            if value:
+                command += [flag, str(value)]
+        if args.offline:
+            command.append("--offline")
+        children.append(subprocess.Popen(command, env=env))
+    print("Workers: " + ",".join(f"http://{args.host}:{args.base_port + i}" for i in range(args.replicas)))
+    try:
+        for child in children:
+            child.wait()
+    except KeyboardInterrupt:
+        for child in children:
+            child.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a pipeline replica for the UI's worker pool.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7901)
+    parser.add_argument("--replicas", type=int, default=0, help="Spawn this many worker processes on consecutive ports")
+    parser.add_argument("--base-port", type=int, default=7901, help="First port for --replicas")
+    parser.add_argument("--gpus", default=None, help="GPU ids assigned round-robin to --replicas, e.g. '0,1'")
+    parser.add_argument("--cpus", default=None, help="CPU ids to pin to, e.g. '0-7'; with --replicas, one set per replica separated by ';'")
+    parser.add_argument("--device", choices=["auto", "cpu", "cuda"], default=None)
+    parser.add_argument("--quant", choices=["auto", *app.QUANT_PROFILES], default=None, help="GGUF quantization profile")
+    parser.add_argument("--memory-budget-gb", type=float, default=None, help="Memory available to the model for --quant auto")
+    parser.add_argument("--offline", action="store_true", help="Load only from the local model store")
+    args = parser.parse_args()
+
+    if args.replicas:
+        spawn(args)
+        return
+    if args.cpus:
+        # Pin before sizing the thread pools, which follow the affinity mask
+        os.sched_setaffinity(0, parse_cpus(args.cpus))
+    if args.cpus or (args.device and args.device != app.DEVICE_MODE):
+        app.configure_execution(args.device)
+    if args.device or args.quant or args.memory_budget_gb:
+        app.configure_quantization(args.quant, args.memory_budget_gb)
+    if args.offline:
+        app.model_store.offline = True
+    serve(args)
+
+
+if __name__ == "__main__":
+    main()